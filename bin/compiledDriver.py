@@ -1,3 +1,5 @@
+import os
+import struct
 import sys
 import time
 import traceback
@@ -10,9 +12,74 @@ except ModuleNotFoundError:
 
 from dreamcoder.utilities import eprint
 
+
+def run(request):
+    response = (False, None)
+    f = request.get("function")
+    try:
+        result = f(*request["arguments"],
+                   **request["keywordArguments"])
+        response = (True, result)
+    except Exception as e:
+        eprint("Exception thrown in pypy process for %s:" % getattr(f, "__name__", f))
+        sys.stderr.write(traceback.format_exc())
+        sys.stderr.flush()
+    return response
+
+
+def readExactly(handle, n):
+    """Returns None at end of file"""
+    data = b""
+    while len(data) < n:
+        chunk = handle.read(n - len(data))
+        if not chunk:
+            return None
+        data += chunk
+    return data
+
+
+def serve():
+    """Answers requests until stdin is closed. Each message, in either
+    direction, is its length as 8 bytes big endian followed by a pickle."""
+    requests = sys.stdin.buffer
+    # Only responses go to stdout: anything f prints goes to stderr
+    responses = os.fdopen(os.dup(sys.stdout.fileno()), "wb")
+    sys.stdout = sys.stderr
+
+    while True:
+        header = readExactly(requests, 8)
+        if header is None:
+            break
+        message = readExactly(requests, struct.unpack(">Q", header)[0])
+        if message is None:
+            break
+        try:
+            response = run(pickle.loads(message))
+        except Exception:
+            eprint("Compiled driver could not unpack the message:")
+            sys.stderr.write(traceback.format_exc())
+            sys.stderr.flush()
+            response = (False, None)
+
+        try:
+            response = pickle.dumps(response)
+        except Exception:
+            eprint("Compiled driver could not pack the response:")
+            sys.stderr.write(traceback.format_exc())
+            sys.stderr.flush()
+            response = pickle.dumps((False, None))
+        responses.write(struct.pack(">Q", len(response)))
+        responses.write(response)
+        responses.flush()
+
+
 if __name__ == "__main__":
     sys.setrecursionlimit(10000)
-    
+
+    if "--server" in sys.argv[1:]:
+        serve()
+        sys.exit(0)
+
     start = time.time()
     request = pickle.load(sys.stdin.buffer)
     dt = time.time() - start
@@ -23,15 +90,7 @@ if __name__ == "__main__":
 
     response = (False, None)
     try:
-        start = time.time()
-        f = request["function"]
-        result = f(*request["arguments"],
-                   **request["keywordArguments"])
-        response = (True, result)
-    except Exception as e:
-        eprint("Exception thrown in pypy process for %s:" % f.__name__)
-        sys.stderr.write(traceback.format_exc())
-        sys.stderr.flush()
+        response = run(request)
     finally:
         start = time.time()
         pickle.dump(response, sys.stdout.buffer)
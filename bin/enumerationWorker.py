@@ -0,0 +1,30 @@
+"""
+Runs the OCaml solver for an EnumerationCoordinator on another machine.
+Start the coordinator with `--enumerationCoordinator HOST:PORT`, and then, on each machine:
+
+    python bin/enumerationWorker.py HOST:PORT --CPUs 8
+"""
+import argparse
+
+import binutil  # required to import from dreamcoder modules
+
+from dreamcoder.distributedEnumeration import parseAddress, runEnumerationWorker
+from dreamcoder.utilities import numberOfCPUs
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Enumeration worker")
+    parser.add_argument("coordinator",
+                        help="host:port of the coordinator")
+    parser.add_argument("--CPUs",
+                        type=int,
+                        default=numberOfCPUs(),
+                        help="How many CPUs the solver gets for each job. Default: all of them")
+    parser.add_argument("--patience",
+                        type=float,
+                        default=None,
+                        help="Give up after this many seconds without a coordinator. Default: never")
+    arguments = parser.parse_args()
+    runEnumerationWorker(*parseAddress(arguments.coordinator),
+                         patience=arguments.patience,
+                         CPUs=arguments.CPUs)
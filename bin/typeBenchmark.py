@@ -0,0 +1,80 @@
+"""
+Times the parts of the Python side of DreamCoder that spend most of their time
+in type inference: enumerating programs with Grammar.enumeration, scoring
+them with Grammar.closedLikelihoodSummary, and unifying long chains of type
+variables in a Context.
+
+Usage:
+    python bin/typeBenchmark.py [--budget 10.] [--repeat 3]
+"""
+
+import argparse
+import time
+
+import binutil  # required to import from dreamcoder modules
+
+from dreamcoder.domains.list.listPrimitives import bootstrapTarget
+from dreamcoder.grammar import Grammar
+from dreamcoder.type import Context, arrow, tint, tlist, tbool
+
+
+REQUESTS = [arrow(tlist(tint), tlist(tint)),
+            arrow(tlist(tint), tint),
+            arrow(tint, tlist(tint), tlist(tbool))]
+
+
+def best(repeat, thunk):
+    """Smallest time over repeat runs of thunk, and what it returned"""
+    fastest = None
+    for _ in range(repeat):
+        start = time.time()
+        value = thunk()
+        elapsed = time.time() - start
+        fastest = elapsed if fastest is None else min(fastest, elapsed)
+    return fastest, value
+
+
+def enumerate(g, budget):
+    return [(request, p)
+            for request in REQUESTS
+            for _, _, p in g.enumeration(Context.EMPTY, [], request, budget)]
+
+
+def summarize(g, programs):
+    return [g.closedLikelihoodSummary(request, p) for request, p in programs]
+
+
+def unifyChains(length):
+    """Binds t0 := t1 := ... := t(length) and then asks for each of them"""
+    k = Context.EMPTY
+    variables = []
+    for _ in range(length + 1):
+        k, v = k.makeVariable()
+        variables.append(v)
+    for a, b in zip(variables, variables[1:]):
+        k = k.unify(tlist(a), tlist(b))
+    k = k.unify(variables[-1], arrow(tint, tint))
+    return [v.apply(k) for v in variables]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmarks type inference")
+    parser.add_argument("--budget", type=float, default=10.,
+                        help="MDL to enumerate up to, for each request")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--chain", type=int, default=300,
+                        help="length of the chain of type variables to unify")
+    arguments = parser.parse_args()
+
+    g = Grammar.uniform(bootstrapTarget())
+    # The first run fills the candidate cache, which we do not want to time
+    enumerate(g, arguments.budget)
+
+    seconds, programs = best(arguments.repeat, lambda: enumerate(g, arguments.budget))
+    print("Grammar.enumeration: %d programs in %.3fs (%.1f us/program)" %
+          (len(programs), seconds, 1e6 * seconds / len(programs)))
+    seconds, _ = best(arguments.repeat, lambda: summarize(g, programs))
+    print("Grammar.closedLikelihoodSummary: %d programs in %.3fs (%.1f us/program)" %
+          (len(programs), seconds, 1e6 * seconds / len(programs)))
+    seconds, _ = best(arguments.repeat, lambda: unifyChains(arguments.chain))
+    print("Context.unify: chain of %d variables in %.3fs" % (arguments.chain, seconds))
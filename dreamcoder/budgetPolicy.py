@@ -0,0 +1,108 @@
+from dreamcoder.utilities import eprint
+
+import math
+
+
+class FixedBudgetPolicy:
+    """Gives every job the same MDL window, whatever happened to its last one.
+    This is what multicoreEnumeration has always done."""
+
+    def __init__(self, increment=1.5):
+        self.increment = increment
+        self.history = []
+
+    def budgetIncrement(self, job, lowerBound, CPUs):
+        return self.increment
+
+    def update(self, job, lowerBound, increment, CPUs, numberEnumerated, elapsed):
+        """Called when a job comes back from the window [lowerBound, lowerBound + increment)"""
+        self.history.append((job, lowerBound, increment, CPUs, numberEnumerated, elapsed))
+
+    def summary(self):
+        if not self.history:
+            return "no windows enumerated"
+        increments = [h[2] for h in self.history]
+        times = [h[5] for h in self.history]
+        return "%d windows, budget increment %.2f-%.2f (mean %.2f), %.2f-%.2fs per window (mean %.2fs)" % \
+            (len(self.history), min(increments), max(increments), sum(increments) / len(increments),
+             min(times), max(times), sum(times) / len(times))
+
+
+class AdaptiveBudgetPolicy(FixedBudgetPolicy):
+    """Sizes each job's next MDL window so that it takes about targetTime seconds.
+
+    The number of programs with description length below m grows like exp(beta * m),
+    so a window [l, l + d) holds about density(l) * (exp(beta * d) - 1) / beta programs.
+    From the last window of a job we know how many programs it enumerated and how
+    fast, which gives us density and enumeration rate; beta is re-estimated from the
+    densities of consecutive windows. Jobs that we know nothing about yet (or that
+    enumerated nothing) get twice their last increment."""
+
+    def __init__(self, targetTime=10., initialIncrement=1.5,
+                 minimumIncrement=0.25, maximumIncrement=8.,
+                 beta=1., verbose=False):
+        super(AdaptiveBudgetPolicy, self).__init__(initialIncrement)
+        self.targetTime = targetTime
+        self.minimumIncrement = minimumIncrement
+        self.maximumIncrement = maximumIncrement
+        self.initialBeta = beta
+        self.verbose = verbose
+        # Map from job to what we know about it
+        self.rate = {}  # programs per second per CPU
+        self.density = {}  # (middle of the window, programs per nat at the lower bound)
+        self.beta = {}
+        self.lastIncrement = {}
+
+    def budgetIncrement(self, job, lowerBound, CPUs):
+        if job not in self.lastIncrement:
+            return self.increment
+        if job not in self.rate:
+            return self.clamp(2 * self.lastIncrement[job])
+
+        beta = self.beta.get(job, self.initialBeta)
+        lastLowerBound, density = self.density[job]
+        density *= math.exp(beta * (lowerBound - lastLowerBound))
+        target = self.rate[job] * CPUs * self.targetTime
+        return self.clamp(math.log1p(beta * target / density) / beta)
+
+    def clamp(self, increment):
+        return min(self.maximumIncrement, max(self.minimumIncrement, increment))
+
+    def update(self, job, lowerBound, increment, CPUs, numberEnumerated, elapsed):
+        super(AdaptiveBudgetPolicy, self).update(job, lowerBound, increment, CPUs, numberEnumerated, elapsed)
+        self.lastIncrement[job] = increment
+        if numberEnumerated <= 0 or elapsed <= 0.:
+            return
+
+        beta = self.beta.get(job, self.initialBeta)
+        density = numberEnumerated * beta / math.expm1(beta * increment)
+        if job in self.density:
+            lastLowerBound, lastDensity = self.density[job]
+            if lowerBound > lastLowerBound:
+                estimate = math.log(density / lastDensity) / (lowerBound - lastLowerBound)
+                # Smooth the estimate, and keep it sane: timeouts and the
+                # overhead of launching make the counts noisy
+                beta = min(3., max(0.1, 0.5 * beta + 0.5 * estimate))
+                self.beta[job] = beta
+                density = numberEnumerated * beta / math.expm1(beta * increment)
+        self.density[job] = (lowerBound, density)
+        self.rate[job] = numberEnumerated / (elapsed * CPUs)
+
+        if self.verbose:
+            eprint("(python) Budget: %s enumerated %d programs in %.2fs with %d CPUs for %.2f <= MDL < %.2f; beta = %.2f" %
+                   (job[1], numberEnumerated, elapsed, CPUs, lowerBound, lowerBound + increment, beta))
+
+
+BUDGET_POLICIES = {"fixed": FixedBudgetPolicy,
+                   "adaptive": AdaptiveBudgetPolicy}
+
+
+def makeBudgetPolicy(policy, verbose=False):
+    """policy: either the name of a budget policy, or a policy object"""
+    if not isinstance(policy, str):
+        return policy
+    assert policy in BUDGET_POLICIES, \
+        "Invalid budget policy %s; options are %s" % (policy, ", ".join(BUDGET_POLICIES))
+    if policy == "adaptive":
+        return AdaptiveBudgetPolicy(verbose=verbose)
+    return BUDGET_POLICIES[policy]()
@@ -0,0 +1,310 @@
+"""
+Enumeration spread over several machines.
+
+An EnumerationCoordinator runs inside the process that calls
+multicoreEnumeration, and serves the messages that solveForTask_ocaml would
+have sent to its solver to any number of EnumerationWorker's over TCP. A
+worker runs the solver on each message that it gets, and sends back the
+solver's JSON response, which solveForTask_ocaml then turns into frontiers
+as usual. Everything on the wire is a line of JSON:
+
+    worker -> coordinator: {"type": "ready"}
+                           {"type": "heartbeat", "job": ID}
+                           {"type": "result", "job": ID, "response": "<solver response>"}
+                           {"type": "result", "job": ID, "error": "<what went wrong>"}
+    coordinator -> worker: {"type": "job", "job": ID, "solver": "<solver binary>", "message": "<solver message>"}
+                           {"type": "shutdown"}
+
+Workers send heartbeats while they are running a job. A job goes back in
+the queue if its worker disconnects, or has not been heard from in
+heartbeatTimeout seconds, and whichever result for it comes back first wins.
+
+Closing a coordinator just drops its workers, which then reconnect to
+whichever coordinator listens on that address next (every call to
+multicoreEnumeration with a host:port makes its own). Only
+close(shutdownWorkers=True) tells them to stop.
+"""
+
+from dreamcoder.utilities import eprint, get_root_dir
+
+import collections
+import json
+import os
+import socket
+import socketserver
+import subprocess
+import threading
+import time
+
+
+def sendLine(f, lock, m):
+    with lock:
+        f.write(bytes(json.dumps(m), encoding="utf-8") + b"\n")
+        f.flush()
+
+
+class CoordinatorHandler(socketserver.StreamRequestHandler):
+    """One of these talks to each worker that connects"""
+
+    def setup(self):
+        super(CoordinatorHandler, self).setup()
+        self.lock = threading.Lock()
+
+    def send(self, m):
+        sendLine(self.wfile, self.lock, m)
+
+    def handle(self):
+        coordinator = self.server.coordinator
+        try:
+            for line in self.rfile:
+                m = json.loads(line.decode("utf-8"))
+                if m["type"] == "ready":
+                    job = coordinator.nextJob(self)
+                    if job is None:
+                        if coordinator.shutdownWorkers:
+                            self.send({"type": "shutdown"})
+                        return
+                    self.send(job)
+                elif m["type"] == "heartbeat":
+                    coordinator.heartbeat(self, m["job"])
+                elif m["type"] == "result":
+                    coordinator.finish(self, m)
+                else:
+                    eprint("(coordinator) Unknown message from worker:", m)
+        except (OSError, ValueError) as e:
+            eprint("(coordinator) Lost a worker:", e)
+        finally:
+            coordinator.disconnected(self)
+
+
+class CoordinatorServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class EnumerationCoordinator(object):
+    """
+    Serves solver messages to EnumerationWorker's over TCP.
+    solve(message) blocks until some worker has run the message, so
+    multicoreEnumeration calls it from one thread per job.
+    Give port=0 to listen on any free port; address says which one it got.
+    """
+
+    def __init__(self, host="localhost", port=0,
+                 heartbeatInterval=1., heartbeatTimeout=10.):
+        self.heartbeatInterval = heartbeatInterval
+        self.heartbeatTimeout = heartbeatTimeout
+
+        self.condition = threading.Condition()
+        self.nextID = 0
+        # IDs of the jobs that no worker has, in the order they get handed out
+        self.pending = collections.deque()
+        # Map from ID to the job (and, once it is done, its result)
+        self.jobs = {}
+        # Map from ID to (handler, when we last heard about the job from it)
+        self.assigned = {}
+        self.closed = False
+        self.shutdownWorkers = False
+        self.requeued = 0
+        self.completed = 0
+
+        self.server = CoordinatorServer((host, port), CoordinatorHandler)
+        self.server.coordinator = self
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        threading.Thread(target=self.monitor, daemon=True).start()
+
+    @property
+    def address(self):
+        return self.server.server_address[:2]
+
+    def solve(self, message, solver="solver"):
+        """Returns the response of a worker's solver to message"""
+        with self.condition:
+            ID = self.nextID
+            self.nextID += 1
+            self.jobs[ID] = {"type": "job", "job": ID, "solver": solver, "message": message}
+            self.pending.append(ID)
+            self.condition.notify_all()
+            while "response" not in self.jobs[ID] and "error" not in self.jobs[ID] and not self.closed:
+                self.condition.wait()
+            job = self.jobs.pop(ID)
+        if "response" in job:
+            return job["response"]
+        raise ValueError(job.get("error", "coordinator closed"))
+
+    def nextJob(self, handler):
+        """Blocks until there is a job for the worker of handler; None once we are closed"""
+        with self.condition:
+            while not self.pending and not self.closed:
+                self.condition.wait()
+            if self.closed:
+                return None
+            ID = self.pending.popleft()
+            self.assigned[ID] = (handler, time.time())
+            job = self.jobs[ID]
+            return {"type": "job", "job": ID, "solver": job["solver"], "message": job["message"]}
+
+    def heartbeat(self, handler, ID):
+        with self.condition:
+            if ID in self.assigned and self.assigned[ID][0] is handler:
+                self.assigned[ID] = (handler, time.time())
+
+    def finish(self, handler, m):
+        with self.condition:
+            ID = m["job"]
+            if ID not in self.jobs or "response" in self.jobs[ID] or "error" in self.jobs[ID]:
+                # Somebody else already did it
+                return
+            self.assigned.pop(ID, None)
+            if ID in self.pending:
+                self.pending.remove(ID)
+            if "response" in m:
+                self.jobs[ID]["response"] = m["response"]
+            else:
+                self.jobs[ID]["error"] = m["error"]
+            self.completed += 1
+            self.condition.notify_all()
+
+    def requeue(self, ID):
+        """Call with the condition held"""
+        del self.assigned[ID]
+        self.pending.appendleft(ID)
+        self.requeued += 1
+        self.condition.notify_all()
+
+    def disconnected(self, handler):
+        with self.condition:
+            for ID, (h, _) in list(self.assigned.items()):
+                if h is handler:
+                    eprint("(coordinator) Worker disconnected; requeueing job", ID)
+                    self.requeue(ID)
+
+    def monitor(self):
+        """Requeues the jobs of workers that have stopped sending heartbeats"""
+        while True:
+            time.sleep(self.heartbeatInterval)
+            with self.condition:
+                if self.closed:
+                    return
+                now = time.time()
+                silent = set()
+                for ID, (h, lastHeard) in list(self.assigned.items()):
+                    if now - lastHeard > self.heartbeatTimeout:
+                        eprint("(coordinator) No heartbeat for job %d in %fs; requeueing it" %
+                               (ID, now - lastHeard))
+                        self.requeue(ID)
+                        silent.add(h)
+            # Whatever that worker sends from now on is ignored
+            for h in silent:
+                try:
+                    h.connection.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+
+    def close(self, shutdownWorkers=False):
+        """Drops the workers, so that they can reconnect to the next coordinator,
+        or tells them to exit if shutdownWorkers"""
+        with self.condition:
+            if self.closed:
+                return
+            self.closed = True
+            self.shutdownWorkers = shutdownWorkers
+            self.condition.notify_all()
+        self.server.shutdown()
+        self.server.server_close()
+
+
+class EnumerationWorker(object):
+    """
+    Connects to an EnumerationCoordinator and runs the solver on the jobs it
+    gets until the coordinator closes or tells it to shut down.
+    CPUs: if given, how many CPUs to tell the solver to use, instead of the
+    number that the job was allocated on the coordinator.
+    solverDirectory: where the solver binaries are; defaults to the root of the repository.
+    """
+
+    def __init__(self, host, port, CPUs=None, heartbeatInterval=1., solverDirectory=None):
+        self.host = host
+        self.port = port
+        self.CPUs = CPUs
+        self.heartbeatInterval = heartbeatInterval
+        self.solverDirectory = solverDirectory or get_root_dir()
+        self.jobsRun = 0
+
+    def run(self):
+        """Returns True if the coordinator told us to shut down,
+        and False if it closed or went away."""
+        with socket.create_connection((self.host, self.port)) as connection:
+            f = connection.makefile("rwb")
+            lock = threading.Lock()
+            while True:
+                try:
+                    sendLine(f, lock, {"type": "ready"})
+                    line = f.readline()
+                except OSError:
+                    return False
+                if not line:
+                    return False
+                m = json.loads(line.decode("utf-8"))
+                if m["type"] == "shutdown":
+                    return True
+                assert m["type"] == "job", "Unknown message from coordinator: %s" % m
+
+                done = threading.Event()
+
+                def heartbeat(ID=m["job"]):
+                    while not done.wait(self.heartbeatInterval):
+                        try:
+                            sendLine(f, lock, {"type": "heartbeat", "job": ID})
+                        except OSError:
+                            return
+                threading.Thread(target=heartbeat, daemon=True).start()
+                try:
+                    result = {"type": "result", "job": m["job"],
+                              "response": self.runSolver(m["solver"], m["message"])}
+                except Exception as e:
+                    result = {"type": "result", "job": m["job"], "error": str(e)}
+                finally:
+                    done.set()
+                self.jobsRun += 1
+                try:
+                    sendLine(f, lock, result)
+                except OSError:
+                    return False
+
+    def runSolver(self, solver, message):
+        if self.CPUs is not None:
+            message = json.loads(message)
+            message["nc"] = self.CPUs
+            message = json.dumps(message)
+        process = subprocess.Popen(os.path.join(self.solverDirectory, solver),
+                                   stdin=subprocess.PIPE,
+                                   stdout=subprocess.PIPE)
+        response, _ = process.communicate(bytes(message, encoding="utf-8"))
+        if process.returncode != 0:
+            raise ValueError("solver exited with code %s" % process.returncode)
+        return response.decode("utf-8")
+
+
+def runEnumerationWorker(host, port, patience=None, **keywords):
+    """Keeps an EnumerationWorker connected to the coordinator at host:port,
+    reconnecting whenever the coordinator closes (each round of enumeration
+    gets its own), until one tells us to shut down or we could not reach it
+    for patience seconds."""
+    lastConnected = time.time()
+    while True:
+        try:
+            if EnumerationWorker(host, port, **keywords).run():
+                return
+            lastConnected = time.time()
+        except OSError:
+            if patience is not None and time.time() - lastConnected > patience:
+                eprint("(worker) Gave up on the coordinator at %s:%d" % (host, port))
+                return
+        time.sleep(1.)
+
+
+def parseAddress(address):
+    """host:port -> (host, port)"""
+    host, port = address.rsplit(":", 1)
+    return host, int(port)
@@ -225,7 +225,19 @@ def ecIterator(grammar, tasks,
                language_compression=False,
                lc_score=False,
                max_compression=0,
-               max_mem_per_enumeration_thread=1000000,
+               max_mem_per_enumeration_thread=None,
+               persistentSolver=False,
+               streamHits=False,
+               budgetPolicy="fixed",
+               enumerationMemo=None,
+               observationalEquivalence=False,
+               enumerationTelemetry=None,
+               enumerationCoordinator=None,
+               grammarBucketing=None,
+               grammarBucketingDistance="linf",
+               enumerationJournal=None,
+               concurrentEnsemble=False,
+               wakeScheduler="fixed",
                # Entrypoint flags for integration tests. If these are set, we return early at semantic breakpoints in the iteration.
                test_task_language=False, # Integration test on the language we add to tasks.
                test_background_helmholtz=False, # Integration test for enumerating Helmholtz frontiers in the background.
@@ -323,7 +335,19 @@ def ecIterator(grammar, tasks,
             "parser",
             "print_recognition_model_summary",
             "condition_independently_on_language_descriptions",
-            "solver"} and v is not None}
+            "solver",
+            "persistentSolver",
+            "streamHits",
+            "budgetPolicy",
+            "enumerationMemo",
+            "observationalEquivalence",
+            "enumerationTelemetry",
+            "enumerationCoordinator",
+            "grammarBucketing",
+            "grammarBucketingDistance",
+            "enumerationJournal",
+            "concurrentEnsemble",
+            "wakeScheduler"} and v is not None}
     if not recognition_0:
         for k in {"helmholtzRatio", "recognitionTimeout", "biasOptimal", "mask",
                   "contextual", "matrixRank", "reuseRecognition", "auxiliaryLoss", "ensembleSize"}:
@@ -524,7 +548,8 @@ def ecIterator(grammar, tasks,
     print(f"Found n={len([t for t in tasks if t.add_as_supervised])} supervised tasks; initializing frontiers.")
     for t in tasks:
         if t.add_as_supervised:
-            result.allFrontiers[t] = result.allFrontiers[t].combine(Frontier.makeFrontierFromSupervised(t)).topK(maximumFrontier)
+            result.allFrontiers[t] = FrontierStore.of(result.allFrontiers[t], maximumFrontier).\
+                                     update(Frontier.makeFrontierFromSupervised(t))
     
     # Set up the task batcher.
     if taskReranker == 'default':
@@ -581,7 +606,16 @@ def ecIterator(grammar, tasks,
                                    solver=solver,
                                    enumerationTimeout=testingTimeout, evaluationTimeout=evaluationTimeout,
                                    test_dsl_only=test_dsl_only,
-                                   max_mem_per_enumeration_thread=max_mem_per_enumeration_thread)            
+                                   max_mem_per_enumeration_thread=max_mem_per_enumeration_thread,
+                                   persistentSolver=persistentSolver,
+                                   streamHits=streamHits,
+                                   budgetPolicy=budgetPolicy,
+                                   enumerationMemo=enumerationMemo,
+                                   observationalEquivalence=observationalEquivalence,
+                                   enumerationTelemetry=enumerationTelemetry,
+                                   enumerationCoordinator=enumerationCoordinator,
+                                   grammarBucketing=grammarBucketing,
+                                   grammarBucketingDistance=grammarBucketingDistance)
         # If we have to also enumerate Helmholtz frontiers,
         # do this extra sneaky in the background
         if n_models > 0 and biasOptimal and helmholtzRatio > 0 and \
@@ -617,6 +651,13 @@ def ecIterator(grammar, tasks,
                     enumeration_time = initialTimeout
             result.tasksAttempted.update(wakingTaskBatch)
             wake_generative = custom_wake_generative if custom_wake_generative is not None else default_wake_generative
+            # Journal the wake phase, so that if we die part way through it,
+            # resuming from the last checkpoint picks it up where we left off
+            journal = None
+            if enumerationJournal is not None:
+                os.makedirs(enumerationJournal, exist_ok=True)
+                journal = EnumerationJournal(os.path.join(enumerationJournal, "wake_%d.jsonl" % j),
+                                             resume=j == resume)
             topDownFrontiers, times = wake_generative(grammar, wakingTaskBatch,
                                                       solver=solver,
                                                       args=arguments,
@@ -624,7 +665,18 @@ def ecIterator(grammar, tasks,
                                                       enumerationTimeout=enumeration_time,
                                                       CPUs=CPUs,
                                                       evaluationTimeout=evaluationTimeout,
-                                                      max_mem_per_enumeration_thread=max_mem_per_enumeration_thread)
+                                                      max_mem_per_enumeration_thread=max_mem_per_enumeration_thread,
+                                                      persistentSolver=persistentSolver,
+                                                      streamHits=streamHits,
+                                                      budgetPolicy=budgetPolicy,
+                                                      enumerationMemo=enumerationMemo,
+                                                      observationalEquivalence=observationalEquivalence,
+                                                      enumerationTelemetry=enumerationTelemetry,
+                                                      enumerationCoordinator=enumerationCoordinator,
+                                                      grammarBucketing=grammarBucketing,
+                                                      grammarBucketingDistance=grammarBucketingDistance,
+                                                      enumerationJournal=journal,
+                                                      wakeScheduler=wakeScheduler)
             result.trainSearchTime = {t: tm for t, tm in times.items() if tm is not None}
         else:
             eprint("Skipping top-down enumeration because we are not using the generative model")
@@ -638,7 +690,7 @@ def ecIterator(grammar, tasks,
         # Combine topDownFrontiers from this task batch with all frontiers.
         for f in topDownFrontiers:
             if f.task not in result.allFrontiers: continue # backward compatibility with old checkpoints
-            result.allFrontiers[f.task] = result.allFrontiers[f.task].combine(f).topK(maximumFrontier)
+            result.allFrontiers[f.task] = FrontierStore.of(result.allFrontiers[f.task], maximumFrontier).update(f)
 
         eprint("Frontiers discovered top down: " + str(len(tasksHitTopDown)))
         eprint("Total frontiers: " + str(len([f for f in result.allFrontiers.values() if not f.empty])))
@@ -685,7 +737,17 @@ def ecIterator(grammar, tasks,
                                language_lexicon=None,
                                test_only_after_recognition=test_only_after_recognition,
                                pretrained_word_embeddings=pretrained_word_embeddings,
-                               max_mem_per_enumeration_thread=max_mem_per_enumeration_thread)
+                               max_mem_per_enumeration_thread=max_mem_per_enumeration_thread,
+                               persistentSolver=persistentSolver,
+                               streamHits=streamHits,
+                               budgetPolicy=budgetPolicy,
+                               enumerationMemo=enumerationMemo,
+                               observationalEquivalence=observationalEquivalence,
+                               enumerationTelemetry=enumerationTelemetry,
+                               enumerationCoordinator=enumerationCoordinator,
+                               grammarBucketing=grammarBucketing,
+                               grammarBucketingDistance=grammarBucketingDistance,
+                               concurrentEnsemble=concurrentEnsemble)
 
             showHitMatrix(tasksHitTopDown, tasks_hit_recognition_0, wakingTaskBatch)
             
@@ -758,7 +820,17 @@ def ecIterator(grammar, tasks,
                                helmholtz_translation_info=translation_info,
                                test_only_after_recognition=test_only_after_recognition,
                                pretrained_word_embeddings=pretrained_word_embeddings,
-                               max_mem_per_enumeration_thread=max_mem_per_enumeration_thread)
+                               max_mem_per_enumeration_thread=max_mem_per_enumeration_thread,
+                               persistentSolver=persistentSolver,
+                               streamHits=streamHits,
+                               budgetPolicy=budgetPolicy,
+                               enumerationMemo=enumerationMemo,
+                               observationalEquivalence=observationalEquivalence,
+                               enumerationTelemetry=enumerationTelemetry,
+                               enumerationCoordinator=enumerationCoordinator,
+                               grammarBucketing=grammarBucketing,
+                               grammarBucketingDistance=grammarBucketingDistance,
+                               concurrentEnsemble=concurrentEnsemble)
 
             showHitMatrix(tasksHitTopDown, tasks_hit_recognition_1, wakingTaskBatch)
             
@@ -794,9 +866,8 @@ def ecIterator(grammar, tasks,
                                     
             for task in tasks_hit_parser:
                 if task not in result.allFrontiers: continue
-                result.allFrontiers[task] = result.allFrontiers[task].\
-                                            combine(grammar.rescoreFrontier(tasks_hit_parser[task])).\
-                                            topK(maximumFrontier)
+                result.allFrontiers[task] = FrontierStore.of(result.allFrontiers[task], maximumFrontier).\
+                                            update(grammar.rescoreFrontier(tasks_hit_parser[task]))
             
             eprint("Frontiers discovered with parser: " + str(len(tasks_hit_parser)))
             eprint("Total frontiers: " + str(len([f for f in result.allFrontiers.values() if not f.empty])))
@@ -868,7 +939,16 @@ def showHitMatrix(top, bottom, tasks):
 
 def evaluateOnTestingTasks(result, testingTasks, grammar, _=None,
                            CPUs=None, solver=None, maximumFrontier=None, enumerationTimeout=None, evaluationTimeout=None,
-                           test_dsl_only= False,max_mem_per_enumeration_thread=1000000):
+                           test_dsl_only= False,max_mem_per_enumeration_thread=None,
+                           persistentSolver=False,
+                           streamHits=False,
+                           budgetPolicy="fixed",
+                           enumerationMemo=None,
+                           observationalEquivalence=False,
+                           enumerationTelemetry=None,
+                           enumerationCoordinator=None,
+                           grammarBucketing=None,
+                           grammarBucketingDistance="linf"):
     
     if len(result.models) > 0 and not test_dsl_only:
         eprint("Evaluating on testing tasks using the recognizer.")
@@ -881,7 +961,16 @@ def evaluateOnTestingTasks(result, testingTasks, grammar, _=None,
                                        enumerationTimeout=enumerationTimeout,
                                        evaluationTimeout=evaluationTimeout,
                                        testing=True,
-                                       max_mem_per_enumeration_thread=max_mem_per_enumeration_thread)
+                                       max_mem_per_enumeration_thread=max_mem_per_enumeration_thread,
+                                       persistentSolver=persistentSolver,
+                                       streamHits=streamHits,
+                                       budgetPolicy=budgetPolicy,
+                                       enumerationMemo=enumerationMemo,
+                                       observationalEquivalence=observationalEquivalence,
+                                       enumerationTelemetry=enumerationTelemetry,
+                                       enumerationCoordinator=enumerationCoordinator,
+                                       grammarBucketing=grammarBucketing,
+                                       grammarBucketingDistance=grammarBucketingDistance)
         updateTaskSummaryMetrics(result.recognitionTaskMetrics, recognizer.taskGrammarLogProductions(testingTasks), 'heldoutTaskLogProductions')
         updateTaskSummaryMetrics(result.recognitionTaskMetrics, recognizer.taskGrammarEntropies(testingTasks), 'heldoutTaskGrammarEntropies')
         updateTaskSummaryMetrics(result.recognitionTaskMetrics, recognizer.taskGrammarEntropies(testingTasks), 'heldoutTaskGrammarEntropies')
@@ -895,7 +984,16 @@ def evaluateOnTestingTasks(result, testingTasks, grammar, _=None,
                                                        CPUs=CPUs,
                                                        evaluationTimeout=evaluationTimeout,
                                                        testing=True,
-                                                       max_mem_per_enumeration_thread=max_mem_per_enumeration_thread)
+                                                       max_mem_per_enumeration_thread=max_mem_per_enumeration_thread,
+                                                       persistentSolver=persistentSolver,
+                                                       streamHits=streamHits,
+                                                       budgetPolicy=budgetPolicy,
+                                                       enumerationMemo=enumerationMemo,
+                                                       observationalEquivalence=observationalEquivalence,
+                                                       enumerationTelemetry=enumerationTelemetry,
+                                                       enumerationCoordinator=enumerationCoordinator,
+                                                       grammarBucketing=grammarBucketing,
+                                                       grammarBucketingDistance=grammarBucketingDistance)
     updateTaskSummaryMetrics(result.recognitionTaskMetrics, times, 'heldoutTestingTimes')
     updateTaskSummaryMetrics(result.recognitionTaskMetrics,
                                      {f.task: f for f in testingFrontiers if len(f) > 0 },
@@ -924,7 +1022,16 @@ def default_wake_language(grammar, tasks,
                     program_featurizer=None,
                     epochs=None,
                     cuda=False,
-                    max_mem_per_enumeration_thread=1000000):
+                    max_mem_per_enumeration_thread=None,
+                    persistentSolver=False,
+                    streamHits=False,
+                    budgetPolicy="fixed",
+                    enumerationMemo=None,
+                    observationalEquivalence=False,
+                    enumerationTelemetry=None,
+                    enumerationCoordinator=None,
+                    grammarBucketing=None,
+                    grammarBucketingDistance="linf"):
     # Get interactive descriptions for all solutions.
     if get_language_fn is not None:
         solutions = [f for f in currentResult.allFrontiers.values() if not f.empty]
@@ -965,7 +1072,18 @@ def default_wake_generative(grammar, tasks,
                     CPUs=None,
                     solver=None,
                     evaluationTimeout=None,
-                    max_mem_per_enumeration_thread=1000000):
+                    max_mem_per_enumeration_thread=None,
+                    persistentSolver=False,
+                    streamHits=False,
+                    budgetPolicy="fixed",
+                    enumerationMemo=None,
+                    observationalEquivalence=False,
+                    enumerationTelemetry=None,
+                    enumerationCoordinator=None,
+                    grammarBucketing=None,
+                    grammarBucketingDistance="linf",
+                    enumerationJournal=None,
+                    wakeScheduler="fixed"):
     topDownFrontiers, times = multicoreEnumeration(grammar, tasks, 
                                                    args=args,
                                                    maximumFrontier=maximumFrontier,
@@ -973,7 +1091,18 @@ def default_wake_generative(grammar, tasks,
                                                    CPUs=CPUs,
                                                    solver=solver,
                                                    evaluationTimeout=evaluationTimeout,
-                                                   max_mem_per_enumeration_thread=max_mem_per_enumeration_thread)
+                                                   max_mem_per_enumeration_thread=max_mem_per_enumeration_thread,
+                                                   persistentSolver=persistentSolver,
+                                                   streamHits=streamHits,
+                                                   budgetPolicy=budgetPolicy,
+                                                   enumerationMemo=enumerationMemo,
+                                                   observationalEquivalence=observationalEquivalence,
+                                                   enumerationTelemetry=enumerationTelemetry,
+                                                   enumerationCoordinator=enumerationCoordinator,
+                                                   grammarBucketing=grammarBucketing,
+                                                   grammarBucketingDistance=grammarBucketingDistance,
+                                                   enumerationJournal=enumerationJournal,
+                                                   wakeScheduler=wakeScheduler)
     eprint("Generative model enumeration results:")
     eprint(Frontier.describe(topDownFrontiers))
     summaryStatistics("Generative model", [t for t in times.values() if t is not None])
@@ -1024,7 +1153,17 @@ def sleep_recognition(result, grammar, taskBatch, tasks, testingTasks, allFronti
                       helmholtz_translation_info=None,
                       test_only_after_recognition=False,
                       pretrained_word_embeddings=None,
-                      max_mem_per_enumeration_thread=1000000):
+                      max_mem_per_enumeration_thread=None,
+                      persistentSolver=False,
+                      streamHits=False,
+                      budgetPolicy="fixed",
+                      enumerationMemo=None,
+                      observationalEquivalence=False,
+                      enumerationTelemetry=None,
+                      enumerationCoordinator=None,
+                      grammarBucketing=None,
+                      grammarBucketingDistance="linf",
+                      concurrentEnsemble=False):
     ### Pre-check: have we discovered any program solutions on the training set?
     ## If not, we have no data from which to train a joint language-example-based model, so we skip this round if you required training on both language and examples.
     n_frontiers = len([f for f in allFrontiers if not f.empty])
@@ -1098,7 +1237,16 @@ def sleep_recognition(result, grammar, taskBatch, tasks, testingTasks, allFronti
                                solver=solver,
                                enumerationTimeout=enumerationTimeout, evaluationTimeout=evaluationTimeout,
                                test_dsl_only=False,
-                               max_mem_per_enumeration_thread=max_mem_per_enumeration_thread)   
+                               max_mem_per_enumeration_thread=max_mem_per_enumeration_thread,
+                               persistentSolver=persistentSolver,
+                               streamHits=streamHits,
+                               budgetPolicy=budgetPolicy,
+                               enumerationMemo=enumerationMemo,
+                               observationalEquivalence=observationalEquivalence,
+                               enumerationTelemetry=enumerationTelemetry,
+                               enumerationCoordinator=enumerationCoordinator,
+                               grammarBucketing=grammarBucketing,
+                               grammarBucketingDistance=grammarBucketingDistance)
         
         sys.exit(0)
     # Enumerate frontiers for each of the recognizers.
@@ -1107,26 +1255,68 @@ def sleep_recognition(result, grammar, taskBatch, tasks, testingTasks, allFronti
     mostTasks = 0
     bestRecognizer = None
     totalTasksHitBottomUp = set()
-    for recIndex, recognizer in enumerate(trainedRecognizers):
-        eprint("Enumerating from recognizer %d of %d" % (recIndex, len(trainedRecognizers)))
-        bottomupFrontiers, allRecognitionTimes = \
-                        recognizer.enumerateFrontiers(taskBatch, 
-                                                      CPUs=CPUs,
-                                                      maximumFrontier=maximumFrontier,
-                                                      enumerationTimeout=enumerationTimeout,
-                                                      evaluationTimeout=evaluationTimeout,
-                                                      solver=solver,
-                                                      max_mem_per_enumeration_thread=max_mem_per_enumeration_thread)
+    if concurrentEnsemble and len(trainedRecognizers) > 1:
+        eprint("Enumerating from all %d recognizers at once" % len(trainedRecognizers))
+        bottomupFrontiers, allRecognitionTimes, ensembleGrammars = \
+                        enumerateFromEnsemble(trainedRecognizers, taskBatch,
+                                              CPUs=CPUs,
+                                              maximumFrontier=maximumFrontier,
+                                              enumerationTimeout=enumerationTimeout,
+                                              evaluationTimeout=evaluationTimeout,
+                                              solver=solver,
+                                              max_mem_per_enumeration_thread=max_mem_per_enumeration_thread,
+                                              persistentSolver=persistentSolver,
+                                              streamHits=streamHits,
+                                              budgetPolicy=budgetPolicy,
+                                              enumerationMemo=enumerationMemo,
+                                              observationalEquivalence=observationalEquivalence,
+                                              enumerationTelemetry=enumerationTelemetry,
+                                              enumerationCoordinator=enumerationCoordinator)
         ensembleFrontiers.append(bottomupFrontiers)
         ensembleTimes.append([t for t in allRecognitionTimes.values() if t is not None])
         ensembleRecognitionTimes.append(allRecognitionTimes)
-
-        recognizerTasksHitBottomUp = {f.task for f in bottomupFrontiers if not f.empty}
-        totalTasksHitBottomUp.update(recognizerTasksHitBottomUp)
-        eprint("Recognizer %d solved %d/%d tasks; total tasks solved is now %d." % (recIndex, len(recognizerTasksHitBottomUp), len(tasks), len(totalTasksHitBottomUp)))
-        if len(recognizerTasksHitBottomUp) >= mostTasks:
-            # TODO (cathywong): could consider keeping the one that put the highest likelihood on the solved tasks.
-            bestRecognizer = recIndex
+        totalTasksHitBottomUp.update({f.task for f in bottomupFrontiers if not f.empty})
+        eprint("The ensemble solved %d/%d tasks." % (len(totalTasksHitBottomUp), len(tasks)))
+
+        # We can't tell which recognizer found what, so keep the one that
+        # puts the most probability on the programs that the ensemble found
+        def solutionLikelihood(task2grammar):
+            return sum(max(task2grammar[f.task].logLikelihood(f.task.request, e.program) for e in f)
+                       for f in bottomupFrontiers if not f.empty and f.task in task2grammar)
+        bestRecognizer = max(range(len(trainedRecognizers)),
+                             key=lambda i: solutionLikelihood(ensembleGrammars[i]))
+        bestEnumeration = 0
+    else:
+        for recIndex, recognizer in enumerate(trainedRecognizers):
+            eprint("Enumerating from recognizer %d of %d" % (recIndex, len(trainedRecognizers)))
+            bottomupFrontiers, allRecognitionTimes = \
+                            recognizer.enumerateFrontiers(taskBatch, 
+                                                          CPUs=CPUs,
+                                                          maximumFrontier=maximumFrontier,
+                                                          enumerationTimeout=enumerationTimeout,
+                                                          evaluationTimeout=evaluationTimeout,
+                                                          solver=solver,
+                                                          max_mem_per_enumeration_thread=max_mem_per_enumeration_thread,
+                                                          persistentSolver=persistentSolver,
+                                                          streamHits=streamHits,
+                                                          budgetPolicy=budgetPolicy,
+                                                          enumerationMemo=enumerationMemo,
+                                                          observationalEquivalence=observationalEquivalence,
+                                                          enumerationTelemetry=enumerationTelemetry,
+                                                          enumerationCoordinator=enumerationCoordinator,
+                                                          grammarBucketing=grammarBucketing,
+                                                          grammarBucketingDistance=grammarBucketingDistance)
+            ensembleFrontiers.append(bottomupFrontiers)
+            ensembleTimes.append([t for t in allRecognitionTimes.values() if t is not None])
+            ensembleRecognitionTimes.append(allRecognitionTimes)
+
+            recognizerTasksHitBottomUp = {f.task for f in bottomupFrontiers if not f.empty}
+            totalTasksHitBottomUp.update(recognizerTasksHitBottomUp)
+            eprint("Recognizer %d solved %d/%d tasks; total tasks solved is now %d." % (recIndex, len(recognizerTasksHitBottomUp), len(tasks), len(totalTasksHitBottomUp)))
+            if len(recognizerTasksHitBottomUp) >= mostTasks:
+                # TODO (cathywong): could consider keeping the one that put the highest likelihood on the solved tasks.
+                bestRecognizer = recIndex
+        bestEnumeration = bestRecognizer
 
     
     result.models += [trainedRecognizers[bestRecognizer]]
@@ -1151,8 +1341,8 @@ def sleep_recognition(result, grammar, taskBatch, tasks, testingTasks, allFronti
 
     """ Rescore and combine the frontiers across the ensemble of recognition models."""
     eprint("Recognition model enumeration results for the best recognizer.")
-    eprint(Frontier.describe(ensembleFrontiers[bestRecognizer]))
-    summaryStatistics("Recognition model", ensembleTimes[bestRecognizer])
+    eprint(Frontier.describe(ensembleFrontiers[bestEnumeration]))
+    summaryStatistics("Recognition model", ensembleTimes[bestEnumeration])
 
     eprint("Cumulative results for the full ensemble of %d recognizers: " % len(trainedRecognizers))
     # Rescore all of the ensemble frontiers according to the generative model
@@ -1160,19 +1350,18 @@ def sleep_recognition(result, grammar, taskBatch, tasks, testingTasks, allFronti
     for bottomupFrontiers in ensembleFrontiers:
         for b in bottomupFrontiers:
             if b.task not in result.allFrontiers: continue # backwards compatibility with old checkpoints
-            result.allFrontiers[b.task] = result.allFrontiers[b.task].\
-                                          combine(grammar.rescoreFrontier(b)).\
-                                          topK(maximumFrontier)
+            result.allFrontiers[b.task] = FrontierStore.of(result.allFrontiers[b.task], maximumFrontier).\
+                                          update(grammar.rescoreFrontier(b))
 
     eprint("Frontiers discovered bottom up: " + str(len(totalTasksHitBottomUp)))
     eprint("Total frontiers: " + str(len([f for f in result.allFrontiers.values() if not f.empty])))
 
-    result.searchTimes.append(ensembleTimes[bestRecognizer])
-    if len(ensembleTimes[bestRecognizer]) > 0:
-        eprint("Average search time: ", int(mean(ensembleTimes[bestRecognizer]) + 0.5),
-               "sec.\tmedian:", int(median(ensembleTimes[bestRecognizer]) + 0.5),
-               "\tmax:", int(max(ensembleTimes[bestRecognizer]) + 0.5),
-               "\tstandard deviation", int(standardDeviation(ensembleTimes[bestRecognizer]) + 0.5))
+    result.searchTimes.append(ensembleTimes[bestEnumeration])
+    if len(ensembleTimes[bestEnumeration]) > 0:
+        eprint("Average search time: ", int(mean(ensembleTimes[bestEnumeration]) + 0.5),
+               "sec.\tmedian:", int(median(ensembleTimes[bestEnumeration]) + 0.5),
+               "\tmax:", int(max(ensembleTimes[bestEnumeration]) + 0.5),
+               "\tstandard deviation", int(standardDeviation(ensembleTimes[bestEnumeration]) + 0.5))
     return totalTasksHitBottomUp
 
 def consolidate(result, grammar, _=None, topK=None, arity=None, pseudoCounts=None, aic=None,
@@ -1353,7 +1542,66 @@ def commandlineArguments(_=None,
     parser.add_argument("--max_mem_per_enumeration_thread",	
                         default=1000000000,	
                         type=int,
-                        help="""The maximum memory to allow for an enumeration thread.""")
+                        help="""The maximum virtual memory, in bytes, that each OCaml solver process can use; enforced with an rlimit.
+                        Windows whose solver runs out of memory are retried with fewer CPUs, and then with a smaller shatter factor.""")
+    parser.add_argument("--persistentSolver",
+                        action="store_true",
+                        dest="persistentSolver",
+                        help="""Keep a pool of long-lived OCaml solver processes for each round of enumeration, instead of launching a solver for every job.""")
+    parser.add_argument("--streamHits",
+                        action="store_true",
+                        dest="streamHits",
+                        help="""Have the OCaml solver report hits as soon as it finds them, and stop enumerating for jobs whose tasks all have enough solutions.""")
+    parser.add_argument("--budgetPolicy",
+                        dest="budgetPolicy",
+                        default="fixed",
+                        choices=["fixed", "adaptive"],
+                        help="""How wide a window of description lengths to give each enumeration job.
+                        fixed: always 1.5 nats. adaptive: size each window to take about 10s, from how many programs the last window of the job enumerated and how fast.""")
+    parser.add_argument("--enumerationMemo",
+                        dest="enumerationMemo",
+                        default=None,
+                        type=str,
+                        help="""Directory in which to remember the windows of description lengths that have been enumerated for each grammar, so that later wake phases with the same grammar can skip over them.""")
+    parser.add_argument("--observationalEquivalence",
+                        action="store_true",
+                        dest="observationalEquivalence",
+                        help="""With the python solver, skip programs with subterms that compute the same outputs on the task inputs as cheaper subterms.""")
+    parser.add_argument("--enumerationTelemetry",
+                        dest="enumerationTelemetry",
+                        default=None,
+                        type=str,
+                        help="""File to append a JSON line to for each enumeration window (MDL window, CPUs, programs per second, and time spent encoding, solving and parsing) and for each round of enumeration.""")
+    parser.add_argument("--enumerationCoordinator",
+                        dest="enumerationCoordinator",
+                        default=None,
+                        type=str,
+                        help="""host:port to listen on for enumeration workers (bin/enumerationWorker.py) on other machines, which then run the OCaml solver for every enumeration job.""")
+    parser.add_argument("--grammarBucketing",
+                        dest="grammarBucketing",
+                        default=None,
+                        type=float,
+                        help="""When testing, let tasks whose recognition grammars are within this distance of each other share one enumeration job with the centroid of their grammars, and rescore their frontiers afterwards. Default: every testing task gets its own job.""")
+    parser.add_argument("--grammarBucketingDistance",
+                        dest="grammarBucketingDistance",
+                        default="linf",
+                        choices=["linf", "kl"],
+                        help="""How to measure the distance between grammars for --grammarBucketing: the largest difference in log probability of any production (linf), or the symmetrized KL divergence (kl).""")
+    parser.add_argument("--enumerationJournal",
+                        dest="enumerationJournal",
+                        default=None,
+                        type=str,
+                        help="""Directory in which to journal the state of each wake phase's enumeration as it goes. With --resume, a wake phase that died part way through carries on from its journal instead of starting over.""")
+    parser.add_argument("--concurrentEnsemble",
+                        action="store_true",
+                        dest="concurrentEnsemble",
+                        help="""Enumerate from every recognition model of the ensemble at once, sharing the CPUs, the frontiers, and one enumeration timeout between them, instead of one model after another.""")
+    parser.add_argument("--wakeScheduler",
+                        dest="wakeScheduler",
+                        default="fixed",
+                        choices=["fixed", "deadline"],
+                        help="""How to spend the enumeration timeout of a wake phase on its enumeration jobs.
+                        fixed: every job gets the whole enumeration timeout. deadline: the whole wake phase gets the enumeration timeout of wall clock time, and jobs that are solving the most of their unsolved tasks per second of search get more of it.""")
     parser.add_argument("--skip_first_test",	
                         action="store_true",	
                         dest="skip_first_test",	
@@ -1473,7 +1721,8 @@ def commandlineArguments(_=None,
         choices=[
             "ocaml",
             "pypy",
-            "python"],
+            "python",
+            "bottomup"],
         default=solver,
         help="""Solver for enumeration.
                         Default: %s""" %
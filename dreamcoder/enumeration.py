@@ -1,8 +1,20 @@
+from dreamcoder.budgetPolicy import makeBudgetPolicy
 from dreamcoder.likelihoodModel import AllOrNothingLikelihoodModel
+from dreamcoder.task import Task, EvaluationTimeout
 from dreamcoder.grammar import *
-from dreamcoder.utilities import get_root_dir, limit_virtual_memory_fn
+from dreamcoder.grammarBucketing import bucketGrammars
+from dreamcoder.wakeScheduler import makeWakeScheduler
+from dreamcoder.utilities import get_root_dir, limit_virtual_memory_fn, computeMD5hash, compiledWorkerPool
 
+import collections
+import json
 import os
+import shutil
+import signal
+import sys
+import tempfile
+import threading
+import time
 import traceback
 import subprocess
 
@@ -17,8 +29,63 @@ def multicoreEnumeration(g, tasks, _=None,
                          evaluationTimeout=None,
                          testing=False,
                          unigramGrammar=None,
-                         max_mem_per_enumeration_thread=1000000):
-    '''g: Either a Grammar, or a map from task to grammar.
+                         max_mem_per_enumeration_thread=None,
+                         persistentSolver=False,
+                         streamHits=False,
+                         budgetPolicy="fixed",
+                         workStealing=True,
+                         enumerationMemo=None,
+                         observationalEquivalence=False,
+                         enumerationTelemetry=None,
+                         enumerationCoordinator=None,
+                         grammarBucketing=None,
+                         grammarBucketingDistance="linf",
+                         enumerationJournal=None,
+                         wallClockTimeout=None,
+                         wakeScheduler="fixed"):
+    '''g: Either a Grammar, or a map from task to grammar, or a list of maps
+    from task to grammar, one for each model of an ensemble. The models share
+    the CPUs, and each task gets one frontier for all of them, so once it has
+    maximumFrontier solutions from any of them none of them look any further.
+    max_mem_per_enumeration_thread: if not None, the most virtual memory (in
+    bytes) that each ocaml solver process can use. A window whose solver runs
+    out of memory is tried again with half the CPUs, and once it is down to
+    one CPU, with half the shatter factor.
+    persistentSolver: if True (and the solver is ocaml), keep a pool of
+    long-lived solver processes for the whole call instead of launching a
+    fresh solver for every job.
+    streamHits: if True (and the solver is ocaml), have the solver report each
+    hit as soon as it finds it, and cancel jobs once all of their tasks have
+    maximumFrontier solutions, which frees up their CPUs for the other jobs.
+    budgetPolicy: how wide an MDL window to give each job that we launch;
+    either the name of a policy in dreamcoder.budgetPolicy, or a policy object.
+    workStealing: if True (and we are not testing), CPUs that no free job can
+    use go to the heaviest running job, as sub-windows of its next MDL window.
+    enumerationMemo: a directory (or EnumerationMemo) in which to remember the
+    windows that we enumerate; jobs pick up where the memo leaves off for them.
+    observationalEquivalence: if True (and the solver is python), skip programs
+    with subterms that compute the same thing on the task inputs as cheaper ones.
+    enumerationTelemetry: a file (or EnumerationTelemetry) to append a JSON line
+    to for each window that comes back, and for the whole call when it is done.
+    enumerationCoordinator: if given (and the solver is ocaml), an
+    EnumerationCoordinator, or a host:port for one to listen on, that hands
+    the solver messages to EnumerationWorker's on other machines.
+    grammarBucketing: if not None (and we are testing), tasks with the same
+    request whose grammars are within this distance of each other share a job,
+    which enumerates with the centroid of their grammars; each task's frontier
+    is rescored under its own grammar afterwards. See dreamcoder.grammarBucketing.
+    grammarBucketingDistance: how to measure that distance, either linf or kl.
+    enumerationJournal: a file (or EnumerationJournal) to journal the state of
+    the enumeration to as it goes; if it already holds a journal of these same
+    jobs, we carry on from where that left off.
+    wallClockTimeout: if not None, stop launching windows after this many
+    seconds, and cut the timeout of the windows that we launch to fit; otherwise
+    jobs that wait for CPUs can take the whole call past enumerationTimeout.
+    wakeScheduler: how long each job may search for, and which jobs go first;
+    either the name of a scheduler in dreamcoder.wakeScheduler, or a scheduler
+    object. The fixed scheduler gives every job enumerationTimeout seconds; the
+    deadline scheduler spends enumerationTimeout seconds of wall clock on the
+    whole call, mostly on the jobs that are solving the most tasks per second.
     Returns (list-of-frontiers, map-from-task-to-search-time)'''
 
     # We don't use actual threads but instead use the multiprocessing
@@ -32,32 +99,55 @@ def multicoreEnumeration(g, tasks, _=None,
 
     solvers = {"ocaml": solveForTask_ocaml,   
                "pypy": solveForTask_pypy,   
-               "python": solveForTask_python}   
-    assert solver in solvers, "You must specify a valid solver. options are ocaml, pypy, or python." 
+               "python": solveForTask_python,
+               "bottomup": solveForTask_bottomup}
+    assert solver in solvers, "You must specify a valid solver. options are ocaml, pypy, python, or bottomup." 
 
     likelihoodModel = None
-    if solver == 'pypy' or solver == 'python':
+    if solver == 'pypy' or solver == 'python' or solver == 'bottomup':
       # Use an all or nothing likelihood model.
       likelihoodModel = AllOrNothingLikelihoodModel(timeout=evaluationTimeout) 
       
     solver = solvers[solver]
 
-    if not isinstance(g, dict):
+    if not isinstance(g, (dict, list)):
         g = {t: g for t in tasks}
-    task2grammar = g
+    task2grammars = g if isinstance(g, list) else [g]
+    # Only used for which tasks we have; the grammars of jobs come out of task2grammars
+    task2grammar = {t: grammars[t] for grammars in reversed(task2grammars) for t in grammars}
+    if grammarBucketing is not None and len(task2grammars) > 1:
+        eprint("Not bucketing grammars: each task has a grammar for each model of the ensemble")
+        grammarBucketing = None
 
     # If we are not evaluating on held out testing tasks:
     # Bin the tasks by request type and grammar
     # If these are the same then we can enumerate for multiple tasks simultaneously
     # If we are evaluating testing tasks:
     # Make sure that each job corresponds to exactly one task
+    # unless their grammars are close enough to share a job
     jobs = {}
-    for i, t in enumerate(tasks):
-        if testing:
-            k = (task2grammar[t], t.request, i)
-        else:
-            k = (task2grammar[t], t.request)
-        jobs[k] = jobs.get(k, []) + [t]
+    bucketed = []
+    if testing and grammarBucketing is not None:
+        buckets = bucketGrammars(tasks, task2grammar, grammarBucketing,
+                                 distance=grammarBucketingDistance)
+        for i, (bucketGrammar, ts) in enumerate(buckets):
+            jobs[(bucketGrammar, ts[0].request, i)] = ts
+            if len(ts) > 1:
+                bucketed.extend(ts)
+        eprint("Grammar bucketing (%s <= %s): %d testing tasks in %d jobs" %
+               (grammarBucketingDistance, grammarBucketing, len(tasks), len(jobs)))
+    else:
+        for grammars in task2grammars:
+            for i, t in enumerate(tasks):
+                if t not in grammars:
+                    continue
+                if testing:
+                    k = (grammars[t], t.request, i)
+                else:
+                    k = (grammars[t], t.request)
+                # Models of an ensemble that agree on a grammar share its job
+                if t not in jobs.get(k, []):
+                    jobs[k] = jobs.get(k, []) + [t]
 
     disableParallelism = len(jobs) == 1
     parallelCallback = launchParallelProcess if not disableParallelism else lambda f, * \
@@ -66,6 +156,44 @@ def multicoreEnumeration(g, tasks, _=None,
         eprint("Disabling parallelism on the Python side because we only have one job.")
         eprint("If you are using ocaml, there could still be parallelism.")
 
+    # Workers on other machines run the solvers, so every job just needs a
+    # thread here; they can't see our task store, our solver pool, or our
+    # solver processes, so none of those are used
+    coordinator = None
+    if enumerationCoordinator is not None and solver is solveForTask_ocaml:
+        from dreamcoder.distributedEnumeration import EnumerationCoordinator, parseAddress
+        coordinator = enumerationCoordinator
+        if not isinstance(coordinator, EnumerationCoordinator):
+            coordinator = EnumerationCoordinator(*parseAddress(coordinator))
+        parallelCallback = launchThread
+        persistentSolver = streamHits = False
+
+    # Serialize every task and grammar once, up front, so that the jobs we
+    # launch (including the forked ones) only have to send their keys
+    taskStore = None
+    if solver is solveForTask_ocaml and coordinator is None:
+        taskStore = TaskStore()
+        for j, ts in jobs.items():
+            if usesTaskStore(ts[0]):
+                taskStore.grammar(j[0])
+                for t in ts: taskStore.task(t)
+
+    # The solver processes do all of the work, so with a pool we only need
+    # a thread on the Python side to talk to each of them
+    solverPool = None
+    if persistentSolver and solver is solveForTask_ocaml:
+        solverPool = SolverPool(CPUs, memoryLimit=max_mem_per_enumeration_thread)
+        parallelCallback = launchThread
+    # Likewise pypy does the work for solveForTask_pypy; calling it from threads
+    # of this process means that every window shares our warm compiled workers,
+    # where a forked child would start a cold pool of its own
+    if solver is solveForTask_pypy:
+        compiledWorkerPool(size=CPUs)
+        parallelCallback = launchThread
+    # We need to keep reading the queue while a streaming job is running
+    if streamHits and disableParallelism:
+        parallelCallback = launchThread
+
     # Map from task to the shortest time to find a program solving it
     bestSearchTime = {t: None for t in task2grammar}
 
@@ -75,6 +203,8 @@ def multicoreEnumeration(g, tasks, _=None,
 
     # For each job we keep track of how long we have been working on it
     stopwatches = {t: Stopwatch() for t in jobs}
+    # How many windows of each job are running right now
+    running = {t: 0 for t in jobs}
 
     # Map from task to how many programs we enumerated for that task
     taskToNumberOfPrograms = {t: 0 for t in tasks }
@@ -82,19 +212,48 @@ def multicoreEnumeration(g, tasks, _=None,
     def numberOfHits(f):
         return sum(e.logLikelihood > -0.01 for e in f)
 
-    def budgetIncrement(lb):
-        if True:
-            return 1.5
-        # Very heuristic - not sure what to do here
-        if lb < 24.:
-            return 1.
-        elif lb < 27.:
-            return 0.5
-        else:
-            return 0.25
-
-    def maximumFrontiers(j):
-        tasks = jobs[j]
+    budgetPolicy = makeBudgetPolicy(budgetPolicy, verbose=verbose)
+
+    # Skip over the windows that we have already enumerated with this grammar
+    memo = enumerationMemo
+    telemetry = enumerationTelemetry
+    if telemetry is not None and not isinstance(telemetry, EnumerationTelemetry):
+        telemetry = EnumerationTelemetry(telemetry)
+    startTime = time.time()
+
+    if memo is not None and not isinstance(memo, EnumerationMemo):
+        memo = EnumerationMemo(memo)
+    if memo is not None:
+        for j in jobs:
+            lowerBounds[j], found, pc = memo.replay(j[0], j[1], jobs[j],
+                                                    lambda hits: numberOfHits(hits) >= maximumFrontier)
+            for t, (hits, searchTime) in found.items():
+                frontiers[t] = frontiers[t].combine(Frontier(hits, task=t))
+                taskToNumberOfPrograms[t] += pc
+                if searchTime is not None:
+                    bestSearchTime[t] = searchTime
+            if lowerBounds[j] > 0:
+                eprint("(python) Enumeration memo: starting %s (%d tasks) at MDL %f" %
+                       (j[1], len(jobs[j]), lowerBounds[j]))
+
+    # Pick up where an enumeration of these jobs that died left off
+    journal = enumerationJournal
+    if journal is not None and not isinstance(journal, EnumerationJournal):
+        journal = EnumerationJournal(journal, resume=True)
+    if journal is not None:
+        jobState, taskState = journal.begin(jobs, lowerBounds)
+        for j, (lowerBound, elapsed) in jobState.items():
+            lowerBounds[j] = max(lowerBounds[j], lowerBound)
+            stopwatches[j] = Stopwatch(elapsed)
+        for t, (hits, totals) in taskState.items():
+            frontiers[t] = frontiers[t].combine(Frontier(hits, task=t))
+            if totals is not None:
+                bestSearchTime[t], taskToNumberOfPrograms[t] = totals
+        if jobState:
+            eprint("(python) Enumeration journal: resuming %d jobs (%d tasks with hits) from %s" %
+                   (len(jobState), sum(numberOfHits(frontiers[t]) > 0 for t in tasks), journal.path))
+
+    def maximumFrontiers(tasks):
         return {t: maximumFrontier - numberOfHits(frontiers[t]) for t in tasks}
 
     def allocateCPUs(n, tasks):
@@ -110,15 +269,43 @@ def multicoreEnumeration(g, tasks, _=None,
                     break
         return allocation
 
+    # The wake scheduler decides how long each job gets, and which go first.
+    # We call begin(jobs, enumerationTimeout, CPUs) once, with every job,
+    # including the ones that we resumed. Whenever we decide what to run next
+    # we call timeLimits(jobs, elapsed), which maps each job that is still
+    # working to how many seconds of search it may have in total, and
+    # priority(job, lowerBound), smallest first, for the jobs about to be
+    # launched. Whenever a window comes back we call
+    # update(job, elapsed, unsolved, remaining) with how many of the job's
+    # tasks have no solution and how many still want more. Times are seconds
+    # of search on the stopwatch of each job; a scheduler with a deadline
+    # also stops the whole call at scheduler.deadline.
+    scheduler = makeWakeScheduler(wakeScheduler, verbose=verbose)
+    scheduler.begin(jobs, enumerationTimeout, CPUs)
+    jobTasks = dict(jobs)
+
+    deadlines = [d for d in [None if wallClockTimeout is None else startTime + wallClockTimeout,
+                             scheduler.deadline]
+                 if d is not None]
+    deadline = min(deadlines) if deadlines else None
+
+    # Map from job to how long the scheduler lets us work on it
+    timeLimits = {}
+
     def refreshJobs():
         for k in list(jobs.keys()):
             v = [t for t in jobs[k]
                  if numberOfHits(frontiers[t]) < maximumFrontier
-                 and stopwatches[k].elapsed <= enumerationTimeout]
+                 and (deadline is None or time.time() < deadline - 0.5)]
             if v:
                 jobs[k] = v
             else:
                 del jobs[k]
+        timeLimits.clear()
+        timeLimits.update(scheduler.timeLimits(jobs, {k: stopwatches[k].elapsed for k in jobs}))
+        for k in list(jobs.keys()):
+            if stopwatches[k].elapsed > timeLimits[k]:
+                del jobs[k]
 
     # Workers put their messages in here
     q = Queue()
@@ -130,54 +317,118 @@ def multicoreEnumeration(g, tasks, _=None,
     id2CPUs = {}
     # What job was each ID working on?
     id2job = {}
+    # Which tasks was each ID working on?
+    id2tasks = {}
+    # (lower bound, budget increment, launch time, timeout) of each ID
+    id2window = {}
+    # The solver process of each ID, if it told us (only when streaming)
+    id2pid = {}
+    # Where the time of each ID went, if it told us (only with telemetry)
+    id2timings = {}
+    # The shatter factor that we gave the solver of each ID, if not the default
+    id2shatter = {}
+    # The (CPUs, shatter factor) that each job went down to after running out of memory
+    memoryCaps = {}
+    # IDs that we have told to stop
+    cancelled = set()
     nextID = 0
 
+    def cancel(ID):
+        """Stops a job early, because all of its tasks have enough solutions"""
+        cancelled.add(ID)
+        if solverPool is not None:
+            solverPool.cancel(ID)
+        elif ID in id2pid:
+            try:
+                os.killpg(id2pid[ID], signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    def launch(j, lowerBound, bi, nCPUs, shatter=None, tasks=None, thisTimeout=None):
+        """Launches job j on the window lowerBound <= MDL < lowerBound + bi"""
+        nonlocal nextID, activeCPUs
+        g, request = j[:2]
+        tasks = jobs[j] if tasks is None else tasks
+        # Once a job has run out of memory, none of its windows get more than it survived with
+        if j in memoryCaps:
+            nCPUs = min(nCPUs, memoryCaps[j][0])
+            shatter = min(shatter or memoryCaps[j][1], memoryCaps[j][1])
+        if thisTimeout is None:
+            thisTimeout = timeLimits[j] - stopwatches[j].elapsed
+        if deadline is not None:
+            thisTimeout = min(thisTimeout, deadline - time.time())
+        #eprint("(python) Launching %s (%d tasks) w/ %d CPUs. %f <= MDL < %f. Timeout %f." %
+        #       (request, len(jobs[j]), nCPUs, lowerBound, lowerBound + bi, thisTimeout))
+        # We run the stopwatch whenever any window of the job is being worked on
+        if running[j] == 0:
+            stopwatches[j].start()
+        running[j] += 1
+        parallelCallback(solver,
+                         args=args,
+                         q=q, g=g, ID=nextID,
+                         elapsedTime=stopwatches[j].elapsed,
+                         CPUs=nCPUs,
+                         tasks=tasks,
+                         lowerBound=lowerBound,
+                         upperBound=lowerBound + bi,
+                         budgetIncrement=bi,
+                         timeout=thisTimeout,
+                         evaluationTimeout=evaluationTimeout,
+                         maximumFrontiers=maximumFrontiers(tasks),
+                         testing=testing,
+                         likelihoodModel=likelihoodModel,
+                         unigramGrammar=unigramGrammar,
+                         max_mem_per_enumeration_thread=max_mem_per_enumeration_thread,
+                         **({"taskStore": taskStore} if taskStore is not None else {}),
+                         **({"reporter": JobReporter(q, nextID)} if streamHits and solver is solveForTask_ocaml else {}),
+                         **({"solverPool": solverPool} if solverPool is not None else {}),
+                         **({"observationalEquivalence": True}
+                            if observationalEquivalence and solver is solveForTask_python else {}),
+                         **({"telemetry": JobReporter(q, nextID)}
+                            if telemetry is not None and solver is solveForTask_ocaml else {}),
+                         **({"remote": coordinator} if coordinator is not None else {}),
+                         **({"shatter": shatter} if shatter is not None else {}))
+        id2CPUs[nextID] = nCPUs
+        id2shatter[nextID] = shatter
+        id2job[nextID] = j
+        id2tasks[nextID] = tasks
+        id2window[nextID] = (lowerBound, bi, time.time(), thisTimeout)
+        nextID += 1
+
+        activeCPUs += nCPUs
+
     while True:
         refreshJobs()
         # Don't launch a job that we are already working on
-        # We run the stopwatch whenever the job is being worked on
         # freeJobs are things that we are not working on but could be
         freeJobs = [j for j in jobs if not stopwatches[j].running
-                    and stopwatches[j].elapsed < enumerationTimeout - 0.5]
+                    and stopwatches[j].elapsed < timeLimits[j] - 0.5]
         if freeJobs and activeCPUs < CPUs:
-            # Allocate a CPU to each of the jobs that we have made the least
-            # progress on
-            freeJobs.sort(key=lambda j: lowerBounds[j])
+            # Allocate a CPU to each of the jobs that the scheduler likes best,
+            # by default the ones that we have made the least progress on
+            freeJobs.sort(key=lambda j: scheduler.priority(j, lowerBounds[j]))
             # Launch some more jobs until all of the CPUs are being used
             availableCPUs = CPUs - activeCPUs
             allocation = allocateCPUs(availableCPUs, freeJobs)
             for j in freeJobs:
                 if allocation[j] == 0:
                     continue
-                g, request = j[:2]
-                bi = budgetIncrement(lowerBounds[j])
-                thisTimeout = enumerationTimeout - stopwatches[j].elapsed
-                #eprint("(python) Launching %s (%d tasks) w/ %d CPUs. %f <= MDL < %f. Timeout %f." %
-                #       (request, len(jobs[j]), allocation[j], lowerBounds[j], lowerBounds[j] + bi, thisTimeout))
-                stopwatches[j].start()
-                parallelCallback(solver,
-                                 args=args,
-                                 q=q, g=g, ID=nextID,
-                                 elapsedTime=stopwatches[j].elapsed,
-                                 CPUs=allocation[j],
-                                 tasks=jobs[j],
-                                 lowerBound=lowerBounds[j],
-                                 upperBound=lowerBounds[j] + bi,
-                                 budgetIncrement=bi,
-                                 timeout=thisTimeout,
-                                 evaluationTimeout=evaluationTimeout,
-                                 maximumFrontiers=maximumFrontiers(j),
-                                 testing=testing,
-                                 likelihoodModel=likelihoodModel,
-                                 unigramGrammar=unigramGrammar,
-                                 max_mem_per_enumeration_thread=max_mem_per_enumeration_thread)
-                id2CPUs[nextID] = allocation[j]
-                id2job[nextID] = j
-                nextID += 1
-
-                activeCPUs += allocation[j]
+                bi = budgetPolicy.budgetIncrement(j, lowerBounds[j], allocation[j])
+                launch(j, lowerBounds[j], bi, allocation[j])
                 lowerBounds[j] += bi
 
+        # Any CPUs that are still idle go to the running job with the most
+        # tasks left: we split its next window into one sub-window per CPU
+        busyJobs = [j for j in jobs if running[j] > 0
+                    and stopwatches[j].elapsed < timeLimits[j] - 0.5]
+        if workStealing and not testing and busyJobs and activeCPUs < CPUs:
+            j = max(busyJobs, key=lambda j: (len(jobs[j]), -lowerBounds[j]))
+            availableCPUs = CPUs - activeCPUs
+            bi = budgetPolicy.budgetIncrement(j, lowerBounds[j], availableCPUs)
+            for k in range(availableCPUs):
+                launch(j, lowerBounds[j] + k * bi / availableCPUs, bi / availableCPUs, 1)
+            lowerBounds[j] += bi
+
         # If nothing is running, and we just tried to launch jobs,
         # then that means we are finished
         if all(not s.running for s in stopwatches.values()):
@@ -186,16 +437,92 @@ def multicoreEnumeration(g, tasks, _=None,
         # Wait to get a response
         message = Bunch(dill.loads(q.get()))
 
-        if message.result == "failure":
+        if message.result == "failure" and isinstance(message.exception, SolverOutOfMemory):
+            activeCPUs -= id2CPUs[message.ID]
+            j = id2job[message.ID]
+            running[j] -= 1
+            if running[j] == 0:
+                stopwatches[j].stop()
+            if message.ID in cancelled:
+                continue
+            lowerBound, bi, launchTime, thisTimeout = id2window[message.ID]
+            nCPUs = id2CPUs[message.ID]
+            shatter = id2shatter[message.ID] or defaultShatter(id2tasks[message.ID])
+            if nCPUs > 1:
+                nCPUs, retry = nCPUs // 2, "%d CPUs" % (nCPUs // 2)
+            elif shatter > 1:
+                shatter, retry = shatter // 2, "shatter %d" % (shatter // 2)
+            else:
+                eprint("(python) Out of memory on %s for %f <= MDL < %f even with 1 CPU and shatter 1; giving up on that window" %
+                       (j[1], lowerBound, lowerBound + bi))
+                continue
+            memoryCaps[j] = (nCPUs, shatter)
+            # The retry gets whatever time the window had left, even if the job
+            # has been dropped since because its time ran out
+            tasks = [t for t in id2tasks[message.ID] if numberOfHits(frontiers[t]) < maximumFrontier]
+            thisTimeout = launchTime + thisTimeout - time.time()
+            if not tasks:
+                continue
+            if thisTimeout < 0.5 or (deadline is not None and deadline - time.time() < 0.5):
+                eprint("(python) Out of memory on %s for %f <= MDL < %f with no time left to retry; lost that window" %
+                       (j[1], lowerBound, lowerBound + bi))
+                continue
+            eprint("(python) Out of memory on %s for %f <= MDL < %f; retrying with %s" %
+                   (j[1], lowerBound, lowerBound + bi, retry))
+            launch(j, lowerBound, bi, nCPUs, shatter=shatter, tasks=tasks, thisTimeout=thisTimeout)
+        elif message.result == "failure":
             eprint("PANIC! Exception in child worker:", message.exception)
             eprint(message.stacktrace)
+            if solverPool is not None: solverPool.close()
+            if taskStore is not None: taskStore.close()
+            if coordinator is not None and coordinator is not enumerationCoordinator: coordinator.close()
             assert False
+        elif message.result == "started":
+            id2pid[message.ID] = message.pid
+        elif message.result == "timings":
+            id2timings[message.ID] = message.timings
+        elif message.result == "hit":
+            t = next(t for t in id2tasks[message.ID] if t.name == message.task)
+            frontiers[t] = frontiers[t].combine(Frontier([message.entry], task=t))
+            if journal is not None:
+                journal.recordHit(t, message.entry)
+            if message.ID not in cancelled and \
+               all(numberOfHits(frontiers[t]) >= maximumFrontier for t in id2tasks[message.ID]):
+                cancel(message.ID)
         elif message.result == "success":
             # Mark the CPUs is no longer being used and pause the stopwatch
             activeCPUs -= id2CPUs[message.ID]
-            stopwatches[id2job[message.ID]].stop()
+            running[id2job[message.ID]] -= 1
+            if running[id2job[message.ID]] == 0:
+                stopwatches[id2job[message.ID]].stop()
 
             newFrontiers, searchTimes, pc = message.value
+            if telemetry is not None:
+                lowerBound, bi, launchTime, thisTimeout = id2window[message.ID]
+                elapsed = time.time() - launchTime
+                telemetry.record("window",
+                                 ID=message.ID,
+                                 request=id2job[message.ID][1],
+                                 tasks=[t.name for t in id2tasks[message.ID]],
+                                 launchTime=launchTime - startTime,
+                                 elapsed=elapsed,
+                                 timeout=thisTimeout,
+                                 CPUs=id2CPUs[message.ID],
+                                 lowerBound=lowerBound,
+                                 upperBound=lowerBound + bi,
+                                 numberEnumerated=pc,
+                                 programsPerSecond=pc / elapsed if elapsed > 0 else None,
+                                 hits=sum(len(f) for f in newFrontiers.values()),
+                                 cancelled=message.ID in cancelled,
+                                 **id2timings.pop(message.ID, {}))
+            if message.ID not in cancelled:
+                lowerBound, bi, launchTime, thisTimeout = id2window[message.ID]
+                budgetPolicy.update(id2job[message.ID], lowerBound, bi, id2CPUs[message.ID],
+                                    pc, time.time() - launchTime)
+                # Only windows that did not run out of time are worth remembering
+                if memo is not None and time.time() - launchTime < 0.9 * thisTimeout:
+                    memo.record(id2job[message.ID][0], id2job[message.ID][1],
+                                lowerBound, lowerBound + bi, newFrontiers, searchTimes, pc)
             for t, f in newFrontiers.items():
                 oldBest = None if len(
                     frontiers[t]) == 0 else frontiers[t].bestPosterior
@@ -220,12 +547,48 @@ def multicoreEnumeration(g, tasks, _=None,
                             bestSearchTime[t] = dt
                         elif newScore == oldScore:
                             bestSearchTime[t] = min(bestSearchTime[t], dt)
+            j = id2job[message.ID]
+            scheduler.update(j, stopwatches[j].elapsed,
+                             sum(numberOfHits(frontiers[t]) == 0 for t in jobTasks[j]),
+                             sum(numberOfHits(frontiers[t]) < maximumFrontier for t in jobTasks[j]))
+            if journal is not None:
+                lowerBound, bi, _, _ = id2window[message.ID]
+                journal.recordWindow(id2job[message.ID], lowerBound, lowerBound + bi,
+                                     stopwatches[id2job[message.ID]].elapsed, newFrontiers,
+                                     {t: bestSearchTime[t] for t in newFrontiers},
+                                     {t: taskToNumberOfPrograms[t] for t in newFrontiers})
         else:
             eprint("Unknown message result:", message.result)
             assert False
 
+    # Tasks that shared a job were enumerated with the centroid of their grammars
+    for t in bucketed:
+        frontiers[t] = task2grammar[t].rescoreFrontier(frontiers[t])
+
+    if journal is not None:
+        journal.end()
+    if solverPool is not None:
+        solverPool.close()
+    if taskStore is not None:
+        taskStore.close()
+    # Coordinators that we were given outlive this call
+    if coordinator is not None and coordinator is not enumerationCoordinator:
+        coordinator.close()
+
     eprint("We enumerated this many programs, for each task:\n\t",
            list(taskToNumberOfPrograms.values()))
+    eprint("Enumeration budget (%s):" % budgetPolicy.__class__.__name__, budgetPolicy.summary())
+    eprint("Wake scheduler (%s):" % scheduler.__class__.__name__, scheduler.summary())
+    if telemetry is not None:
+        telemetry.record("summary",
+                         solver=solver.__name__,
+                         CPUs=CPUs,
+                         enumerationTimeout=enumerationTimeout,
+                         elapsed=time.time() - startTime,
+                         windows=nextID,
+                         numberEnumerated={t.name: n for t, n in taskToNumberOfPrograms.items()},
+                         hits={t.name: numberOfHits(frontiers[t]) for t in tasks},
+                         searchTimes={t.name: bestSearchTime[t] for t in tasks})
 
     return [frontiers[t] for t in tasks], bestSearchTime
 
@@ -253,6 +616,513 @@ def wrapInThread(f):
             return
     return _f
 
+class JobReporter(object):
+    """Lets a job send messages back to multicoreEnumeration while it is still running"""
+    def __init__(self, q, ID):
+        self.q = q
+        self.ID = ID
+
+    def __call__(self, **message):
+        import dill
+        self.q.put(dill.dumps(dict(message, ID=self.ID)))
+
+
+def launchThread(f, *a, **k):
+    """Like launchParallelProcess, but runs f in a thread of this process.
+    Used when the actual work happens in a solver process that we talk to."""
+    t = threading.Thread(target=wrapInThread(f), args=a, kwargs=k, daemon=True)
+    t.start()
+    return t
+
+
+class SolverOutOfMemory(Exception):
+    """The solver of a job died because it ran out of memory"""
+    pass
+
+
+# What the solver (or the fake ones in the tests) say on stderr when they run out of memory
+OUT_OF_MEMORY_MESSAGES = ["Out_of_memory", "MemoryError", "Cannot allocate memory"]
+
+def killedForMemory(returncode, stderr, limited=True):
+    """Did a solver that exited with returncode, after writing stderr, run out of memory?
+    limited: whether it was running under a memory limit"""
+    if returncode == -signal.SIGKILL:
+        # The kernel's OOM killer
+        return True
+    if limited and returncode == -signal.SIGSEGV:
+        # Could not grow its stack
+        return True
+    return returncode != 0 and any(m in stderr for m in OUT_OF_MEMORY_MESSAGES)
+
+
+class StderrTail(object):
+    """Passes the stderr of a process through to ours, remembering the last few lines of it"""
+    def __init__(self, process, size=50):
+        self.lines = collections.deque(maxlen=size)
+        self.thread = threading.Thread(target=self.relay, args=(process.stderr,), daemon=True)
+        self.thread.start()
+
+    def relay(self, stderr):
+        for line in iter(stderr.readline, b""):
+            line = line.decode("utf-8", errors="replace")
+            self.lines.append(line)
+            sys.stderr.write(line)
+        stderr.close()
+
+    def text(self):
+        self.thread.join(timeout=1)
+        return "".join(self.lines)
+
+
+class SolverWorker(object):
+    """
+    A long-lived solver process (`solver --server`).
+    Jobs are framed as one line of JSON on its stdin, and each job gets back
+    exactly one line of JSON on its stdout, after any hits that it streams.
+    The worker keeps every grammar and task that it has loaded out of the TaskStore.
+    memoryLimit: if not None, the most virtual memory (in bytes) that the
+    worker and each of the processes it forks can use.
+    """
+    def __init__(self, solver_file, memoryLimit=None):
+        self.solver_file = solver_file
+        # In its own process group, so that we can cancel it along with its forked workers
+        self.process = subprocess.Popen([solver_file, "--server"],
+                                        stdin=subprocess.PIPE,
+                                        stdout=subprocess.PIPE,
+                                        start_new_session=True,
+                                        **solverMemoryLimit(memoryLimit))
+        self.stderr = StderrTail(self.process) if memoryLimit is not None else None
+        # ID of the job that is using this worker
+        self.owner = None
+
+    @property
+    def alive(self):
+        return self.process.poll() is None
+
+    def send(self, message):
+        self.process.stdin.write(bytes(message, encoding="utf-8") + b"\n")
+        self.process.stdin.flush()
+
+    def lines(self):
+        """The lines that the worker writes, until it exits"""
+        return iter(self.process.stdout.readline, b"")
+
+    def close(self):
+        try:
+            self.process.stdin.close()
+            self.process.wait(timeout=1)
+        except Exception:
+            self.process.kill()
+        self.process.stdout.close()
+
+
+class SolverPool(object):
+    """A pool of SolverWorker's, shared by all of the jobs of a multicoreEnumeration call."""
+    def __init__(self, size, memoryLimit=None):
+        self.size = size
+        self.memoryLimit = memoryLimit
+        self.idle = []
+        self.busy = set()
+        self.lock = threading.Lock()
+
+    def acquire(self, solver_file, owner=None):
+        with self.lock:
+            for w in self.idle:
+                if w.solver_file == solver_file and w.alive:
+                    self.idle.remove(w)
+                    self.busy.add(w)
+                    w.owner = owner
+                    return w
+            # Get rid of dead workers, and of workers for other solvers if we are out of room
+            for w in list(self.idle):
+                if not w.alive or len(self.idle) + len(self.busy) >= self.size:
+                    self.idle.remove(w)
+                    w.close()
+            w = SolverWorker(solver_file, memoryLimit=self.memoryLimit)
+            self.busy.add(w)
+            w.owner = owner
+            return w
+
+    def release(self, worker):
+        with self.lock:
+            self.busy.discard(worker)
+            worker.owner = None
+            if worker.alive:
+                self.idle.append(worker)
+
+    def cancel(self, owner):
+        """Kills the worker that is running the job of the given owner, if it is still running it"""
+        with self.lock:
+            for w in self.busy:
+                if w.owner == owner and w.alive:
+                    os.killpg(w.process.pid, signal.SIGTERM)
+
+    def discard(self, worker):
+        with self.lock:
+            self.busy.discard(worker)
+        worker.close()
+
+    def close(self):
+        with self.lock:
+            for w in self.idle + list(self.busy):
+                w.close()
+            self.idle, self.busy = [], set()
+
+
+def defaultShatter(tasks):
+    """How many pieces the solver splits each of its workers' windows into"""
+    return 5 if len(tasks) == 1 and "turtle" in str(tasks[0].request) else 10
+
+
+def solverMemoryLimit(memoryLimit):
+    """Keyword arguments for subprocess.Popen that put a solver under memoryLimit bytes of virtual memory.
+    The rlimit is inherited by every process that the solver forks, so each of them gets that much."""
+    if memoryLimit is None:
+        return {}
+    return {"preexec_fn": limit_virtual_memory_fn(memoryLimit),
+            "stderr": subprocess.PIPE}
+
+
+def taskMessage(t):
+    """The JSON that the solver is sent for a task, minus its maximumFrontier"""
+    serialized_examples = []
+    for xs, y in t.examples:
+        if hasattr(t, "serializeSpecialInput"):
+            xs = t.serializeSpecialInput(xs)
+        if hasattr(t, "serializeSpecialOutput"):
+            y = t.serializeSpecialOutput(y, is_output=True)
+        serialized_examples.append({"inputs": list(xs), "output": y})
+
+    m = {
+        "examples": serialized_examples,
+        "name": t.name,
+        "request": t.request.json()}
+    if hasattr(t, "specialTask"):
+        special, extra = t.specialTask
+        m["specialTask"] = special
+        m["extras"] = extra
+    if hasattr(t, "raw_programs_to_test"):
+        m["raw_programs_to_test"] = t.raw_programs_to_test
+    return m
+
+
+def serializeTask(t):
+    return json.dumps(taskMessage(t), sort_keys=True)
+
+def serializeGrammar(g):
+    return json.dumps(g.json(), sort_keys=True)
+
+
+# Solvers that know how to load tasks and grammars out of a TaskStore
+TASK_STORE_SOLVERS = {"solver", "clevrSolver"}
+
+def usesTaskStore(t):
+    return getattr(t, "specialSolver", "solver") in TASK_STORE_SOLVERS
+
+
+class TaskStore(object):
+    """
+    Content-addressed store of serialized tasks and grammars.
+    Each of them is serialized once and spilled to <directory>/<key>.json,
+    where the key is the MD5 of the serialization; solver messages then only
+    carry the keys, along with the MDL window and the other job parameters.
+    """
+    def __init__(self, directory=None):
+        self.temporary = directory is None
+        if directory is None:
+            directory = tempfile.mkdtemp(prefix="taskStore")
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        # Map from task/grammar to its key
+        self.taskKeys = {}
+        self.grammarKeys = {}
+
+    def put(self, serialization):
+        key = computeMD5hash(serialization)
+        path = os.path.join(self.directory, key + ".json")
+        if not os.path.exists(path):
+            # Write and then rename, so that a solver never reads half of a file
+            fd, temporary = tempfile.mkstemp(dir=self.directory)
+            with os.fdopen(fd, "w") as handle:
+                handle.write(serialization)
+            os.rename(temporary, path)
+        return key
+
+    def task(self, t):
+        if t not in self.taskKeys:
+            self.taskKeys[t] = self.put(serializeTask(t))
+        return self.taskKeys[t]
+
+    def grammar(self, g):
+        if g not in self.grammarKeys:
+            self.grammarKeys[g] = self.put(serializeGrammar(g))
+        return self.grammarKeys[g]
+
+    def close(self):
+        if self.temporary:
+            shutil.rmtree(self.directory, ignore_errors=True)
+
+
+class EnumerationMemo(object):
+    """
+    On-disk record of the MDL windows that have been enumerated, so that a
+    later wake phase with the same grammar can skip over them.
+    A window is keyed by (grammar, request, lowerBound, upperBound), and
+    remembers, for each task it was enumerated for, the hits and search
+    time, as well as how many programs it enumerated. Grammars and tasks
+    are identified by the MD5 of their serialization, so the memo stays
+    valid across processes. Each grammar gets a file <directory>/<key>.jsonl,
+    with one window per line.
+    """
+    def __init__(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.taskKeys = {}
+        self.grammarKeys = {}
+        # Map from grammar key to the windows enumerated with it
+        self.windows = {}
+
+    def taskKey(self, t):
+        if t not in self.taskKeys:
+            self.taskKeys[t] = computeMD5hash(serializeTask(t))
+        return self.taskKeys[t]
+
+    def grammarKey(self, g):
+        if g not in self.grammarKeys:
+            self.grammarKeys[g] = computeMD5hash(serializeGrammar(g))
+        return self.grammarKeys[g]
+
+    def path(self, key):
+        return os.path.join(self.directory, key + ".jsonl")
+
+    def load(self, key):
+        if key not in self.windows:
+            self.windows[key] = []
+            if os.path.exists(self.path(key)):
+                with open(self.path(key)) as handle:
+                    self.windows[key] = [json.loads(l) for l in handle if l.strip()]
+        return self.windows[key]
+
+    def record(self, g, request, lowerBound, upperBound, frontiers, searchTimes, numberEnumerated):
+        """Records a window that was enumerated all the way through"""
+        window = {"request": str(request),
+                  "lowerBound": lowerBound,
+                  "upperBound": upperBound,
+                  "numberEnumerated": numberEnumerated,
+                  "tasks": {self.taskKey(t): {"searchTime": searchTimes[t],
+                                              "hits": [{"program": str(e.program),
+                                                        "logPrior": e.logPrior,
+                                                        "logLikelihood": e.logLikelihood,
+                                                        "tokens": e.tokens}
+                                                       for e in f]}
+                            for t, f in frontiers.items()}}
+        key = self.grammarKey(g)
+        self.load(key).append(window)
+        with open(self.path(key), "a") as handle:
+            handle.write(json.dumps(window) + "\n")
+
+    def replay(self, g, request, tasks, isSolved):
+        """
+        Follows the windows recorded for these tasks up from MDL 0, for as
+        long as they cover every task that is not solved yet.
+        isSolved: takes the hits found so far for a task and says whether it needs any more.
+        Returns (the MDL we got up to, map from task to (hits, search time), number of programs enumerated)
+        """
+        windows = [w for w in self.load(self.grammarKey(g)) if w["request"] == str(request)]
+        found = {t: ([], None) for t in tasks}
+        lowerBound, numberEnumerated = 0., 0
+        while True:
+            covering = [w for w in windows
+                        if abs(w["lowerBound"] - lowerBound) < 1e-6 and w["upperBound"] > lowerBound
+                        and all(self.taskKey(t) in w["tasks"] or isSolved(found[t][0]) for t in tasks)]
+            if not covering:
+                return lowerBound, found, numberEnumerated
+            window = max(covering, key=lambda w: w["upperBound"])
+            for t in tasks:
+                record = window["tasks"].get(self.taskKey(t))
+                if record is None:
+                    continue
+                hits, searchTime = found[t]
+                hits = hits + [FrontierEntry(Program.parse(h["program"]),
+                                             logPrior=h["logPrior"],
+                                             logLikelihood=h["logLikelihood"],
+                                             tokens=h["tokens"])
+                               for h in record["hits"]]
+                if record["searchTime"] is not None:
+                    searchTime = record["searchTime"] if searchTime is None else min(searchTime, record["searchTime"])
+                found[t] = (hits, searchTime)
+            numberEnumerated += window["numberEnumerated"]
+            lowerBound = window["upperBound"]
+
+
+class EnumerationTelemetry(object):
+    """
+    Appends one JSON object per line to a file for what happens during
+    multicoreEnumeration: a "window" record for each window of a job when it
+    comes back (when it was launched, how many CPUs and programs it got, and,
+    for the ocaml solver, how long went into encoding the message, waiting on
+    the solver, and parsing its response), and a "summary" record at the end.
+    Every record also gets the fields given to the constructor.
+    """
+    def __init__(self, path, **fields):
+        self.path = path
+        self.fields = fields
+
+    def record(self, event, **fields):
+        r = dict(self.fields, event=event, time=time.time())
+        r.update(fields)
+        with open(self.path, "a") as f:
+            f.write(json.dumps(r, default=str) + "\n")
+
+
+class EnumerationJournal(object):
+    """
+    Append-only record of the state of one multicoreEnumeration call, so that
+    a call that dies part way through (a solver taking the machine down with
+    it, or the node getting preempted) can pick up where it left off instead
+    of starting over. One JSON object per line, written and synced to disk
+    as each message comes in:
+        {"type": "begin", "fingerprint": ..., "lowerBounds": {job: MDL}}
+        {"type": "hit", "task": task, "hit": hit}
+        {"type": "window", "job": job, "lowerBound": l, "upperBound": u, "elapsed": seconds,
+         "tasks": {task: {"hits": [hit], "searchTime": s, "numberEnumerated": n}}}
+        {"type": "end"}
+    Jobs and tasks are identified by the MD5 of their serialization, like in
+    EnumerationMemo; the fingerprint covers all of them, and the journal is
+    only replayed for a call with the same fingerprint. searchTime and
+    numberEnumerated are the totals for the task after the window, and
+    elapsed is how long the job has been running for.
+    resume: if False, whatever is already in the file is thrown away.
+    """
+    def __init__(self, path, resume=False):
+        self.path = path
+        self.records = []
+        if resume and os.path.exists(path):
+            with open(path, "rb+") as handle:
+                good = 0
+                for l in handle:
+                    try:
+                        assert l.endswith(b"\n")
+                        self.records.append(json.loads(l.decode("utf-8")))
+                    except (AssertionError, ValueError):
+                        # The last line of a journal that died while writing it
+                        break
+                    good += len(l)
+                handle.truncate(good)
+        elif os.path.exists(path):
+            os.remove(path)
+        self.handle = None
+        self.taskKeys = {}
+        self.jobKeys = {}
+
+    def taskKey(self, t):
+        if t not in self.taskKeys:
+            self.taskKeys[t] = computeMD5hash(serializeTask(t))
+        return self.taskKeys[t]
+
+    def jobKey(self, j):
+        """j: (grammar, request) or (grammar, request, index)"""
+        if j not in self.jobKeys:
+            self.jobKeys[j] = computeMD5hash(json.dumps([serializeGrammar(j[0]), str(j[1])] +
+                                                        list(j[2:])))
+        return self.jobKeys[j]
+
+    def fingerprint(self, jobs):
+        return computeMD5hash(json.dumps(sorted([self.jobKey(j), sorted(self.taskKey(t) for t in ts)]
+                                                for j, ts in jobs.items())))
+
+    def write(self, record):
+        if self.handle is None:
+            self.handle = open(self.path, "a")
+        self.handle.write(json.dumps(record) + "\n")
+        self.handle.flush()
+        os.fsync(self.handle.fileno())
+
+    @staticmethod
+    def hit(e):
+        return {"program": str(e.program),
+                "logPrior": e.logPrior,
+                "logLikelihood": e.logLikelihood,
+                "tokens": e.tokens}
+
+    @staticmethod
+    def entry(h):
+        return FrontierEntry(Program.parse(h["program"]),
+                             logPrior=h["logPrior"],
+                             logLikelihood=h["logLikelihood"],
+                             tokens=h["tokens"])
+
+    def begin(self, jobs, lowerBounds):
+        """
+        Returns what the journal knows about these jobs, as a map from job to
+        (the MDL to carry on from, how long it has run for), and a map from
+        task to (hits, (search time, number of programs enumerated)); the
+        second part is None if no window of the task ever came back.
+        Both are empty unless we are resuming a journal of these jobs.
+        """
+        fingerprint = self.fingerprint(jobs)
+        begins = [i for i, r in enumerate(self.records) if r["type"] == "begin"]
+        if not begins or self.records[begins[-1]]["fingerprint"] != fingerprint:
+            if self.records:
+                eprint("(python) Enumeration journal %s is for different jobs; starting over" % self.path)
+                self.records = []
+                os.remove(self.path)
+            self.write({"type": "begin", "fingerprint": fingerprint,
+                        "lowerBounds": {self.jobKey(j): lowerBounds[j] for j in jobs}})
+            return {}, {}
+
+        records = self.records[begins[-1]:]
+        self.records = []
+        taskState = {}
+        windows = {}
+        elapsed = {}
+        for r in records:
+            if r["type"] == "hit":
+                hits, totals = taskState.get(r["task"], ([], None))
+                taskState[r["task"]] = (hits + [self.entry(r["hit"])], totals)
+            elif r["type"] == "window":
+                windows[r["job"]] = windows.get(r["job"], []) + [(r["lowerBound"], r["upperBound"])]
+                elapsed[r["job"]] = max(elapsed.get(r["job"], 0.), r["elapsed"])
+                for task, record in r["tasks"].items():
+                    hits, _ = taskState.get(task, ([], None))
+                    taskState[task] = (hits + [self.entry(h) for h in record["hits"]],
+                                       (record["searchTime"], record["numberEnumerated"]))
+
+        jobState = {}
+        for j in jobs:
+            key = self.jobKey(j)
+            # Carry on from the end of the windows that came back one after the other;
+            # anything after a window that never came back gets done again
+            lowerBound = records[0]["lowerBounds"][key]
+            while True:
+                following = [u for l, u in windows.get(key, []) if abs(l - lowerBound) < 1e-6]
+                if not following:
+                    break
+                lowerBound = max(following)
+            jobState[j] = (lowerBound, elapsed.get(key, 0.))
+        tasks = {t for ts in jobs.values() for t in ts}
+        return jobState, {t: taskState[self.taskKey(t)] for t in tasks if self.taskKey(t) in taskState}
+
+    def recordHit(self, t, e):
+        self.write({"type": "hit", "task": self.taskKey(t), "hit": self.hit(e)})
+
+    def recordWindow(self, j, lowerBound, upperBound, elapsed, frontiers, searchTimes, numbersEnumerated):
+        self.write({"type": "window",
+                    "job": self.jobKey(j),
+                    "lowerBound": lowerBound,
+                    "upperBound": upperBound,
+                    "elapsed": elapsed,
+                    "tasks": {self.taskKey(t): {"hits": [self.hit(e) for e in f],
+                                                "searchTime": searchTimes[t],
+                                                "numberEnumerated": numbersEnumerated[t]}
+                              for t, f in frontiers.items()}})
+
+    def end(self):
+        self.write({"type": "end"})
+        self.handle.close()
+        self.handle = None
+
+
 OCAML_TEST_FLAG = "is_ocaml_test" # Indicates a JSON response intended for testing.
 def solveForTask_ocaml(
     _=None,
@@ -267,10 +1137,14 @@ def solveForTask_ocaml(
                        evaluationTimeout=None, maximumFrontiers=None,
                        unigramGrammar=None,
                        verbose=False,
-                       max_mem_per_enumeration_thread=1000000):
+                       max_mem_per_enumeration_thread=None,
+                       shatter=None,
+                       taskStore=None,
+                       solverPool=None,
+                       reporter=None,
+                       telemetry=None,
+                       remote=None):
 
-    import json
-    
     from dreamcoder.domains.cube.cubePrimitives import cubePrimitives
     from dreamcoder.domains.mathDomain.mathDomainPrimitives import mathDomainPrimitives
     # updates the global PRIMITIVES list in case we're on mac so we did a multithreading spawn instead of a fork
@@ -289,33 +1163,45 @@ def solveForTask_ocaml(
     "noLength": no_length,
     "rich": primitives}[args["primitives"]]() 
     '''
-        
-    def taskMessage(t):
-        serialized_examples = []
-        for xs, y in t.examples:
-            if hasattr(t, "serializeSpecialInput"):
-                xs = t.serializeSpecialInput(xs)
-            if hasattr(t, "serializeSpecialOutput"):
-                y = t.serializeSpecialOutput(y, is_output=True)
-            serialized_examples.append({"inputs": list(xs), "output": y})
-        
-        m = {
-            "examples": serialized_examples,
-            "name": t.name,
-            "request": t.request.json(),
-            "maximumFrontier": maximumFrontiers[t]}
-        if hasattr(t, "specialTask"):
-            special, extra = t.specialTask
-            m["specialTask"] = special
-            m["extras"] = extra
-        if hasattr(t, "raw_programs_to_test"):
-            m["raw_programs_to_test"] = t.raw_programs_to_test
-        return m
-
-
-    message = {"DSL": g.json(),
-               "tasks": [taskMessage(t)
-                         for t in tasks],
+
+
+    solver_name = 'solver'
+    if hasattr(tasks[0], 'specialSolver'):
+        solver_name = tasks[0].specialSolver
+    solver_file = os.path.join(get_root_dir(), solver_name)
+
+    if taskStore is not None and not usesTaskStore(tasks[0]):
+        taskStore = None
+
+    # Where the time goes: building and encoding the message, waiting on the
+    # solver, and parsing what it sends back. Reported through telemetry.
+    timings = {"encode": 0., "solver": 0., "parse": 0.}
+    startTime = time.time()
+
+    if taskStore is None:
+        message = {"DSL": g.json(),
+                   "tasks": [dict(taskMessage(t), maximumFrontier=maximumFrontiers[t])
+                             for t in tasks]}
+    else:
+        message = {"taskStore": taskStore.directory,
+                   "DSLKey": taskStore.grammar(g),
+                   "tasks": [{"key": taskStore.task(t),
+                              "name": t.name,
+                              "maximumFrontier": maximumFrontiers[t]}
+                             for t in tasks]}
+    timings["encode"] += time.time() - startTime
+
+    # Only the default solver knows how to run as a server, or stream its hits,
+    # and the server gets everything out of the task store
+    worker = None
+    if solverPool is not None and taskStore is not None and not hasattr(tasks[0], 'specialSolver'):
+        worker = solverPool.acquire(solver_file, owner=reporter.ID if reporter is not None else None)
+    stream = reporter is not None and not hasattr(tasks[0], 'specialSolver')
+    startTime = time.time()
+    if stream:
+        message["stream"] = True
+
+    message.update({
                "programTimeout": evaluationTimeout,
                "nc": CPUs,
                "timeout": timeout,
@@ -323,60 +1209,153 @@ def solveForTask_ocaml(
                "upperBound": upperBound,
                "budgetIncrement": budgetIncrement,
                "verbose": verbose,
-               "shatter": 5 if len(tasks) == 1 and "turtle" in str(tasks[0].request) else 10}
+               "shatter": shatter if shatter is not None else defaultShatter(tasks)})
 
     if hasattr(tasks[0], 'maxParameters') and tasks[0].maxParameters is not None:
         message["maxParameters"] = tasks[0].maxParameters
 
     message = json.dumps(message)
+    timings["encode"] += time.time() - startTime
+    timings["messageBytes"] = len(message)
     # uncomment this if you want to save the messages being sent to the solver
-    
-    solver_file = 'solver'
-    if hasattr(tasks[0], 'specialSolver'):
-        solver_file = tasks[0].specialSolver
 
+    def escape_tokens(tokens):
+        if unigramGrammar is not None:
+            return unigramGrammar.escape_tokens_string(tokens)
+        return g.escape_tokens_string(tokens)
+
+    def frontierEntry(t, e):
+        p = Program.parse(e["program"])
+        return FrontierEntry(program=p,
+                             logLikelihood=e["logLikelihood"],
+                             tokens=escape_tokens(e["tokens"]).split(),
+                             logPrior=g.logLikelihood(t.request, p))
+
+    # Map from task name to the hits that the solver streamed to us
+    streamedHits = {t.name: [] for t in tasks}
+
+    def readResponse(lines):
+        """Returns the final response of the solver, reporting any hits that it streams before it.
+        Returns None if the solver stops before giving its final response."""
+        for line in lines:
+            startParsing = time.time()
+            r = json.loads(line.decode("utf-8"))
+            if "hit" not in r:
+                timings["parse"] += time.time() - startParsing
+                return r
+            t = next(t for t in tasks if t.name == r["hit"])
+            streamedHits[t.name].append(r)
+            entry = frontierEntry(t, r)
+            timings["parse"] += time.time() - startParsing
+            reporter(result="hit", task=t.name, entry=entry)
+        return None
+
+    response, error = None, None
+    startTime = time.time()
     try:
-        solver_file = os.path.join(get_root_dir(), solver_file)
-        process = subprocess.Popen(solver_file,
-                                   stdin=subprocess.PIPE,
-                                   stdout=subprocess.PIPE)
-        #limit_virtual_memory_with_psutil_if_possible(process, max_mem_per_enumeration_thread)
-        
-        response, error = process.communicate(bytes(message, encoding="utf-8"))
-        response = json.loads(response.decode("utf-8"))
+        if remote is not None:
+            # Some other machine runs the solver for us
+            response = remote.solve(message, solver=solver_name)
+            startParsing = time.time()
+            response = json.loads(response)
+            timings["parse"] += time.time() - startParsing
+        elif worker is None and not stream:
+            process = subprocess.Popen(solver_file,
+                                       stdin=subprocess.PIPE,
+                                       stdout=subprocess.PIPE,
+                                       **solverMemoryLimit(max_mem_per_enumeration_thread))
+
+            response, error = process.communicate(bytes(message, encoding="utf-8"))
+            if max_mem_per_enumeration_thread is not None:
+                error = error.decode("utf-8", errors="replace")
+                sys.stderr.write(error)
+                if killedForMemory(process.returncode, error):
+                    raise SolverOutOfMemory(error)
+            startParsing = time.time()
+            response = json.loads(response.decode("utf-8"))
+            timings["parse"] += time.time() - startParsing
+        else:
+            try:
+                if worker is None:
+                    # In its own process group, so that we can cancel it along with its forked workers
+                    process = subprocess.Popen(solver_file,
+                                               stdin=subprocess.PIPE,
+                                               stdout=subprocess.PIPE,
+                                               start_new_session=True,
+                                               **solverMemoryLimit(max_mem_per_enumeration_thread))
+                    stderr = StderrTail(process) if max_mem_per_enumeration_thread is not None else None
+                    reporter(result="started", pid=process.pid)
+                    process.stdin.write(bytes(message, encoding="utf-8"))
+                    process.stdin.close()
+                    response = readResponse(process.stdout)
+                    process.stdout.close()
+                else:
+                    process = worker.process
+                    stderr = worker.stderr
+                    worker.send(message)
+                    response = readResponse(worker.lines())
+            except OSError as e:
+                # The solver died; don't let the OSError escape below
+                error = e
+                raise ValueError(e)
+            if response is None:
+                if stream and process.wait() == -signal.SIGTERM:
+                    # We were cancelled, because all of our tasks have enough solutions
+                    response = dict(streamedHits)
+                    if worker is not None:
+                        solverPool.discard(worker)
+                        worker = None
+                else:
+                    returncode = process.wait()
+                    if stderr is not None and killedForMemory(returncode, stderr.text()):
+                        raise SolverOutOfMemory(stderr.text())
+                    error = "solver exited with code %s" % returncode
+                    raise ValueError(error)
+            if "error" in response:
+                error = response["error"]
+                raise ValueError(error)
+            if worker is None:
+                process.wait()
+            else:
+                solverPool.release(worker)
+                worker = None
     except OSError as exc:
         raise exc
 
+    except SolverOutOfMemory:
+        # multicoreEnumeration tries again with less
+        if worker is not None:
+            solverPool.discard(worker)
+        raise
+
     except:
+        if worker is not None:
+            solverPool.discard(worker)
         print("response:", response)
         print("error:", error)
-        with open("message", "w") as f:
+        # Keep the message that failed somewhere we can find it, without
+        # littering the working directory
+        fd, failed = tempfile.mkstemp(prefix="solverMessage", suffix=".json")
+        with os.fdopen(fd, "w") as f:
             f.write(message)
+        print("message:", failed)
         # Don't fail on errors
         # assert False, "MAX RAISE"
         print("ERROR in enumeration, returning empty frontiers for this batch of tasks.")
         response = {t.name : [] for t in tasks} # Empty response 
-
-    def escape_tokens(tokens):
-        if unigramGrammar is not None:
-            return unigramGrammar.escape_tokens_string(tokens)
-        return g.escape_tokens_string(tokens)
+    timings["solver"] = time.time() - startTime - timings["parse"]
 
     if OCAML_TEST_FLAG in response:
         return response
         
+    startParsing = time.time()
     pc = response.get("number_enumerated",0)  # TODO
     frontiers = {}
     searchTimes = {}
     for t in tasks:
         solutions = response[t.name]
-        frontier = Frontier([FrontierEntry(program=p,
-                                           logLikelihood=e["logLikelihood"],
-                                           tokens=escape_tokens(e["tokens"]).split(),
-                                           logPrior=g.logLikelihood(t.request, p))
-                             for e in solutions 
-                             for p in [Program.parse(e["program"])]],
-                            task=t)        
+        frontier = Frontier([frontierEntry(t, e) for e in solutions],
+                            task=t)
         frontiers[t] = frontier
         if frontier.empty:
             searchTimes[t] = None
@@ -390,16 +1369,23 @@ def solveForTask_ocaml(
             searchTimes[t] = min(
                 (e["logLikelihood"] + e["logPrior"],
                  e["time"]) for e in solutions)[1] + elapsedTime
+    timings["parse"] += time.time() - startParsing
+
+    if telemetry is not None:
+        telemetry(result="timings", timings=timings)
 
     return frontiers, searchTimes, pc
 
 def solveForTask_pypy(_=None,
+                      args=None,
                       elapsedTime=0.,
-                      g=None, task=None,
+                      g=None, tasks=None,
                       lowerBound=None, upperBound=None, budgetIncrement=None,
                       timeout=None,
+                      CPUs=1,
                       likelihoodModel=None,
-                      evaluationTimeout=None, maximumFrontier=None, testing=False,unigramGrammar=None):
+                      evaluationTimeout=None, maximumFrontiers=None, testing=False,unigramGrammar=None,
+                      max_mem_per_enumeration_thread=None):
     return callCompiled(enumerateForTasks,
                         g, tasks, likelihoodModel,
                         timeout=timeout,
@@ -411,13 +1397,16 @@ def solveForTask_pypy(_=None,
                         lowerBound=lowerBound, upperBound=upperBound,unigramGrammar=None)
 
 def solveForTask_python(_=None,
+                        args=None,
                         elapsedTime=0.,
                         g=None, tasks=None,
                         lowerBound=None, upperBound=None, budgetIncrement=None,
                         timeout=None,
                         CPUs=1,
                         likelihoodModel=None,
-                        evaluationTimeout=None, maximumFrontiers=None, testing=False,unigramGrammar=None):
+                        evaluationTimeout=None, maximumFrontiers=None, testing=False,unigramGrammar=None,
+                        max_mem_per_enumeration_thread=None,
+                        observationalEquivalence=False):
     return enumerateForTasks(g, tasks, likelihoodModel,
                              timeout=timeout,
                              testing=testing,
@@ -425,12 +1414,152 @@ def solveForTask_python(_=None,
                              evaluationTimeout=evaluationTimeout,
                              maximumFrontiers=maximumFrontiers,
                              budgetIncrement=budgetIncrement,
-                             lowerBound=lowerBound, upperBound=upperBound,unigramGrammar=None)
+                             lowerBound=lowerBound, upperBound=upperBound,unigramGrammar=None,
+                             observationalEquivalence=observationalEquivalence)
+
+def solveForTask_bottomup(_=None,
+                          args=None,
+                          elapsedTime=0.,
+                          g=None, tasks=None,
+                          lowerBound=None, upperBound=None, budgetIncrement=None,
+                          timeout=None,
+                          CPUs=1,
+                          likelihoodModel=None,
+                          evaluationTimeout=None, maximumFrontiers=None, testing=False,unigramGrammar=None,
+                          max_mem_per_enumeration_thread=None):
+    return bottomUpEnumerateForTasks(g, tasks, likelihoodModel,
+                                     timeout=timeout,
+                                     elapsedTime=elapsedTime,
+                                     maximumFrontiers=maximumFrontiers,
+                                     budgetIncrement=budgetIncrement,
+                                     lowerBound=lowerBound, upperBound=upperBound)
 
 
 class EnumerationTimeout(Exception):
     pass
 
+def isPlainTask(t, likelihoodModel):
+    """Is t solved by exactly the programs that reproduce all of its outputs?"""
+    return isinstance(likelihoodModel, AllOrNothingLikelihoodModel) and \
+        all(getattr(type(t), m) is getattr(Task, m) for m in ["logLikelihood", "check", "predict"])
+
+def groupTasksByInputs(tasks, likelihoodModel):
+    """
+    Groups together the tasks that have exactly the same inputs, and that
+    are solved by exactly the programs that reproduce all of their outputs.
+    Returns a list of (inputs, indices into tasks); inputs is None for
+    tasks that have to be scored on their own by the likelihood model.
+    """
+    groups = []
+    # Map from repr of inputs to the groups with those inputs
+    candidates = {}
+    for n, t in enumerate(tasks):
+        if isPlainTask(t, likelihoodModel):
+            inputs = [xs for xs, _ in t.examples]
+            key = repr(inputs)
+            for group in candidates.get(key, []):
+                try:
+                    same = group[0] == inputs
+                except Exception:
+                    same = False
+                if same is True:
+                    group[1].append(n)
+                    break
+            else:
+                group = (inputs, [n])
+                groups.append(group)
+                candidates[key] = candidates.get(key, []) + [group]
+        else:
+            groups.append((None, [n]))
+    # Not worth the bookkeeping for tasks that have their inputs to themselves
+    return [(inputs if len(group) > 1 else None, group) for inputs, group in groups]
+
+
+class ObservationalEquivalence(object):
+    """
+    A table of what the subterms that Grammar.enumeration builds compute on the
+    task inputs. A subterm whose outputs on every input (its signature) we have
+    already seen from a cheaper subterm of the same type gets skipped: swapping
+    in the cheaper one gives a cheaper program that does the same thing on
+    every task, and that program has been (or will be) enumerated instead.
+    Only subterms that live directly under the lambdas of the request, and
+    whose type is ground data, can be evaluated; everything else is kept.
+    """
+
+    def __init__(self, inputs, arity, timeout=None):
+        # Environments to evaluate subterms in: the innermost lambda comes first
+        self.environments = [list(reversed(xs)) for xs in inputs]
+        self.arity = arity
+        self.timeout = timeout
+        # Map from (type, signature) to (description length, program) of the cheapest subterm
+        self.cheapest = {}
+        # Map from program to its signature, or None if it does not have one
+        self.signatures = {}
+        self.pruned = 0
+
+    @staticmethod
+    def fromTasks(tasks, likelihoodModel):
+        """Returns None unless every task is scored on its outputs alone"""
+        if not all(isPlainTask(t, likelihoodModel) for t in tasks):
+            return None
+        inputs = []
+        seen = set()
+        for t in tasks:
+            for xs, _ in t.examples:
+                if repr(xs) not in seen:
+                    seen.add(repr(xs))
+                    inputs.append(xs)
+        return ObservationalEquivalence(inputs, len(tasks[0].request.functionArguments()),
+                                        timeout=likelihoodModel.timeout)
+
+    def signature(self, p):
+        if p in self.signatures:
+            return self.signatures[p]
+
+        if self.timeout is not None:
+            def timeoutCallBack(_1, _2): raise EvaluationTimeout()
+            signal.signal(signal.SIGVTALRM, timeoutCallBack)
+            signal.setitimer(signal.ITIMER_VIRTUAL, self.timeout)
+        try:
+            signature = tuple(hashableValue(p.evaluate(environment))
+                              for environment in self.environments)
+            hash(signature)
+        except BaseException as e:
+            if isinstance(e, KeyboardInterrupt):
+                raise
+            signature = None
+        finally:
+            if self.timeout is not None:
+                signal.signal(signal.SIGVTALRM, lambda *_: None)
+                signal.setitimer(signal.ITIMER_VIRTUAL, 0)
+        self.signatures[p] = signature
+        return signature
+
+    def redundant(self, environment, request, descriptionLength, p):
+        """Should Grammar.enumeration skip the subterm p of type request?"""
+        if len(environment) != self.arity or request.isArrow() or request.isPolymorphic:
+            return False
+        signature = self.signature(p)
+        if signature is None:
+            return False
+
+        key = (request, signature)
+        if key not in self.cheapest or descriptionLength < self.cheapest[key][0]:
+            self.cheapest[key] = (descriptionLength, p)
+            return False
+        cheapestLength, cheapest = self.cheapest[key]
+        if cheapestLength < descriptionLength or cheapest != p:
+            self.pruned += 1
+            return True
+        return False
+
+
+def hashableValue(v):
+    if isinstance(v, list):
+        return tuple(hashableValue(x) for x in v)
+    return v
+
+
 def enumerateForTasks(g, tasks, likelihoodModel, _=None,
                       verbose=False,
                       timeout=None,
@@ -440,7 +1569,8 @@ def enumerateForTasks(g, tasks, likelihoodModel, _=None,
                       evaluationTimeout=None,
                       lowerBound=0.,
                       upperBound=100.,
-                      budgetIncrement=1.0, maximumFrontiers=None,unigramGrammar=None):
+                      budgetIncrement=1.0, maximumFrontiers=None,unigramGrammar=None,
+                      observationalEquivalence=False):
     assert timeout is not None, \
         "enumerateForTasks: You must provide a timeout."
 
@@ -455,6 +1585,29 @@ def enumerateForTasks(g, tasks, likelihoodModel, _=None,
     # we will never maintain maximumFrontier best solutions
     hits = [PQ() for _ in tasks]
 
+    # Tasks that have the same inputs only need each program to be run once
+    groups = groupTasksByInputs(tasks, likelihoodModel)
+    # Map from the first task of each group to the outputs of all of the tasks in it
+    outputs = {group[0]: [[y for _, y in tasks[n].examples] for n in group]
+               for inputs, group in groups if inputs is not None}
+
+    # Subterms that compute the same thing as cheaper ones get skipped
+    signatures = None
+    if observationalEquivalence:
+        signatures = ObservationalEquivalence.fromTasks(tasks, likelihoodModel)
+        if signatures is None:
+            eprint("(python) Not pruning observationally equivalent programs: some tasks are not scored on their outputs alone")
+
+    def hit(n, p, prior, likelihood):
+        dt = time() - starting + elapsedTime
+        priority = -(likelihood + prior)
+        hits[n].push(priority,
+                     (dt, FrontierEntry(program=p,
+                                        logLikelihood=likelihood,
+                                        logPrior=prior)))
+        if len(hits[n]) > maximumFrontiers[n]:
+            hits[n].popMaximum()
+
     starting = time()
     previousBudget = lowerBound
     budget = lowerBound + budgetIncrement
@@ -468,7 +1621,8 @@ def enumerateForTasks(g, tasks, likelihoodModel, _=None,
             for prior, _, p in g.enumeration(Context.EMPTY, [], request,
                                              maximumDepth=99,
                                              upperBound=budget,
-                                             lowerBound=previousBudget):
+                                             lowerBound=previousBudget,
+                                             **({"signatures": signatures} if signatures is not None else {})):
                 descriptionLength = -prior
                 # Shouldn't see it on this iteration
                 assert descriptionLength <= budget
@@ -478,25 +1632,22 @@ def enumerateForTasks(g, tasks, likelihoodModel, _=None,
                 numberOfPrograms += 1
                 totalNumberOfPrograms += 1
 
-                for n in range(len(tasks)):
-                    task = tasks[n]
-
-                    #Warning:changed to max's new likelihood model situation
-                    #likelihood = task.logLikelihood(p, evaluationTimeout)
-                    #if invalid(likelihood):
-                        #continue
-                    success, likelihood = likelihoodModel.score(p, task)
-                    if not success:
+                for inputs, group in groups:
+                    if inputs is None:
+                        n = group[0]
+                        task = tasks[n]
+
+                        #Warning:changed to max's new likelihood model situation
+                        #likelihood = task.logLikelihood(p, evaluationTimeout)
+                        #if invalid(likelihood):
+                            #continue
+                        success, likelihood = likelihoodModel.score(p, task)
+                        if success:
+                            hit(n, p, prior, likelihood)
                         continue
-                        
-                    dt = time() - starting + elapsedTime
-                    priority = -(likelihood + prior)
-                    hits[n].push(priority,
-                                 (dt, FrontierEntry(program=p,
-                                                    logLikelihood=likelihood,
-                                                    logPrior=prior)))
-                    if len(hits[n]) > maximumFrontiers[n]:
-                        hits[n].popMaximum()
+
+                    for k in tasks[group[0]].checkMany(p, outputs[group[0]], likelihoodModel.timeout):
+                        hit(group[k], p, prior, 0.)
 
                 if timeout is not None and time() - starting > timeout:
                     raise EnumerationTimeout
@@ -515,9 +1666,313 @@ def enumerateForTasks(g, tasks, likelihoodModel, _=None,
         tasks[n]: None if len(hits[n]) == 0 else \
         min(t for t,_ in hits[n]) for n in range(len(tasks))}
 
+    if verbose and hasattr(g, "candidateCacheStatistics"):
+        eprint("(python) Candidate cache: %(hits)d hits, %(misses)d misses, %(size)d entries" %
+               g.candidateCacheStatistics())
+    if verbose and signatures is not None:
+        eprint("(python) Pruned %d observationally equivalent subterms; %d distinct signatures" %
+               (signatures.pruned, len(signatures.cheapest)))
+
     return frontiers, searchTimes, totalNumberOfPrograms
 
 
+# What a subterm evaluates to on an input that it crashes on
+EVALUATIONFAILURE = object()
+
+
+def typeDepth(t):
+    if isinstance(t, TypeConstructor) and t.arguments:
+        return 1 + max(typeDepth(a) for a in t.arguments)
+    return 0
+
+
+def firstTypeVariable(t):
+    if isinstance(t, TypeVariable):
+        return t.v
+    for a in t.arguments:
+        if a.isPolymorphic:
+            return firstTypeVariable(a)
+
+
+class BottomUpEnumerator(object):
+    """
+    Builds the bodies of the programs for a request bottom-up, one window of
+    description lengths at a time, out of banks of subterms that have already
+    been evaluated on every input. A subterm costs what the grammar charges
+    for it when its type is requested in the environment of the body, and a
+    subterm that computes the same values as a cheaper one of the same type is
+    not banked. Arguments of function type are lambdas, which we cannot
+    evaluate on their own, so those get enumerated top-down by Grammar.enumeration.
+    """
+
+    def __init__(self, g, request, inputs, timeout=None, deadline=None):
+        self.g = g
+        self.returnType = request.returns()
+        arguments = request.functionArguments()
+        self.environment = list(reversed(arguments))
+        # Environments to evaluate subterms in: the innermost lambda comes first
+        self.environments = [list(reversed(xs)) for xs in inputs]
+        self.timeout = timeout
+        self.deadline = deadline
+        # Don't go building subterms of types bigger than anything in the request
+        self.maximumTypeDepth = max(typeDepth(t) for t in arguments + [self.returnType])
+
+        # Ground types that we build subterms of
+        self.targets = [self.returnType]
+        # Map from type to signature to (description length, program, values)
+        self.bank = {self.returnType: {}}
+        # Map from function type to [(description length, lambda, values)], and how far we enumerated them
+        self.lambdas = {}
+        self.lambdaBounds = {}
+        self.numberOfPrograms = 0
+
+    def candidates(self, request):
+        try:
+            return self.g.buildCandidates(request, Context.EMPTY, self.environment, normalize=True)
+        except NoCandidates:
+            return []
+
+    def enumerateWindow(self, lowerBound, upperBound):
+        """Banks the subterms with lowerBound <= MDL < upperBound, and yields
+        (MDL, body, values) for each of those of the return type, including the
+        ones that compute the same thing as cheaper ones."""
+        seen = set()
+        changed = True
+        # Subterms in the window can be made out of other subterms in the
+        # window, so we keep going until nothing new gets banked
+        while changed:
+            targets = len(self.targets)
+            changed = False
+            for target in list(self.targets):
+                for l, t, head, k in self.candidates(target):
+                    if -l >= upperBound:
+                        continue
+                    for argumentCost, arguments in self.arguments(t.apply(k).functionArguments(), k,
+                                                                  upperBound + l):
+                        if self.deadline is not None and time.time() > self.deadline:
+                            raise EnumerationTimeout()
+                        mdl = argumentCost - l
+                        if mdl < lowerBound:
+                            continue
+                        program = head
+                        for _, argument, _ in arguments:
+                            program = Application(program, argument)
+                        if (target, program) in seen:
+                            continue
+                        seen.add((target, program))
+
+                        values = self.evaluate(head, arguments)
+                        if values is None:
+                            continue
+                        self.numberOfPrograms += 1
+                        changed |= self.bankSubterm(target, mdl, program, values)
+                        if target == self.returnType:
+                            yield mdl, program, values
+            changed |= len(self.targets) > targets
+
+    def bankSubterm(self, target, mdl, program, values):
+        """Returns whether program is the cheapest way we know of computing values"""
+        try:
+            signature = tuple(hashableValue(v) for v in values)
+            hash(signature)
+        except TypeError:
+            signature = None
+        if signature is None or not self.environments:
+            # We cannot tell what it computes
+            signature = program
+        bank = self.bank[target]
+        if signature in bank and bank[signature][0] <= mdl:
+            return False
+        bank[signature] = (mdl, program, values)
+        return True
+
+    def arguments(self, argumentTypes, context, budget):
+        """Yields (total MDL, [(MDL, argument, values)]) for the ways of filling in argumentTypes"""
+        # Do the data arguments first, so that they decide the type variables of the functions
+        order = sorted(range(len(argumentTypes)), key=lambda i: argumentTypes[i].isArrow())
+        for cost, chosen in self.fill([argumentTypes[i] for i in order], context, budget):
+            arguments = [None] * len(order)
+            for i, argument in zip(order, chosen):
+                arguments[i] = argument
+            yield cost, arguments
+
+    def fill(self, types, context, budget):
+        if not types:
+            yield 0., []
+            return
+        if budget <= 0.:
+            return
+
+        t = types[0].apply(context)
+        if t.isPolymorphic:
+            # Try out each of the types that we have subterms of
+            for target in list(self.targets):
+                try:
+                    if t.isArrow():
+                        newContext = context.unify(TypeVariable(firstTypeVariable(t)), target)
+                    else:
+                        newContext = context.unify(t, target)
+                except UnificationFailure:
+                    continue
+                yield from self.fill(types, newContext, budget)
+            return
+
+        for cost, argument, values in self.subterms(t, budget):
+            for laterCost, later in self.fill(types[1:], context, budget - cost):
+                yield cost + laterCost, [(cost, argument, values)] + later
+
+    def subterms(self, t, budget):
+        if t.isArrow():
+            return self.lambdasBelow(t, budget)
+        if t not in self.bank:
+            if typeDepth(t) <= self.maximumTypeDepth:
+                # We will have subterms of this type on the next pass
+                self.targets.append(t)
+                self.bank[t] = {}
+            return []
+        return [s for s in list(self.bank[t].values()) if s[0] < budget]
+
+    def lambdasBelow(self, t, budget):
+        bound = self.lambdaBounds.get(t, 0.)
+        if budget > bound:
+            lambdas = self.lambdas.setdefault(t, [])
+            n = len(lambdas)
+            for l, _, p in self.g.enumeration(Context.EMPTY, self.environment, t,
+                                              upperBound=budget, lowerBound=bound,
+                                              maximumDepth=99):
+                if self.deadline is not None and time.time() > self.deadline:
+                    # Forget the half of the window that we got through
+                    del lambdas[n:]
+                    raise EnumerationTimeout()
+                lambdas.append((-l, p, tuple(p.evaluate(environment)
+                                             for environment in self.environments)))
+            self.lambdaBounds[t] = budget
+        return [s for s in self.lambdas[t] if s[0] < budget]
+
+    def evaluate(self, head, arguments):
+        """The values of head applied to arguments on each input,
+        or None if it crashes on all of them"""
+        if self.timeout is not None:
+            def timeoutCallBack(_1, _2): raise EvaluationTimeout()
+            signal.signal(signal.SIGVTALRM, timeoutCallBack)
+            signal.setitimer(signal.ITIMER_VIRTUAL, self.timeout)
+        values = []
+        try:
+            for j, environment in enumerate(self.environments):
+                try:
+                    f = head.evaluate(environment)
+                    for _, _, argumentValues in arguments:
+                        if argumentValues[j] is EVALUATIONFAILURE:
+                            raise ValueError()
+                        f = f(argumentValues[j])
+                    values.append(f)
+                except EvaluationTimeout:
+                    raise
+                except Exception:
+                    values.append(EVALUATIONFAILURE)
+        except EvaluationTimeout:
+            return None
+        finally:
+            if self.timeout is not None:
+                signal.signal(signal.SIGVTALRM, lambda *_: None)
+                signal.setitimer(signal.ITIMER_VIRTUAL, 0)
+        if values and all(v is EVALUATIONFAILURE for v in values):
+            return None
+        return tuple(values)
+
+
+def bottomUpEnumerateForTasks(g, tasks, likelihoodModel, _=None,
+                              verbose=False,
+                              timeout=None,
+                              elapsedTime=0.,
+                              lowerBound=0.,
+                              upperBound=100.,
+                              budgetIncrement=1.0, maximumFrontiers=None):
+    """Like enumerateForTasks, but builds programs bottom-up with a BottomUpEnumerator.
+    The banks have to be filled with everything below lowerBound as well,
+    but only the programs with lowerBound <= MDL < upperBound get scored."""
+    assert timeout is not None, \
+        "bottomUpEnumerateForTasks: You must provide a timeout."
+
+    from time import time
+
+    request = tasks[0].request
+    assert all(t.request == request for t in tasks), \
+        "bottomUpEnumerateForTasks: Expected tasks to all have the same type"
+
+    maximumFrontiers = [maximumFrontiers[t] for t in tasks]
+    hits = [PQ() for _ in tasks]
+
+    # Every subterm gets evaluated on the union of the inputs of the tasks.
+    # For each task that is scored on its outputs alone, where its inputs are in that union
+    inputs = []
+    positions = {}
+    taskInputs = []
+    for t in tasks:
+        ps = []
+        for xs, _ in getattr(t, "examples", []):
+            if repr(xs) not in positions:
+                positions[repr(xs)] = len(inputs)
+                inputs.append(xs)
+            ps.append(positions[repr(xs)])
+        taskInputs.append(ps if isPlainTask(t, likelihoodModel) else None)
+
+    starting = time()
+    enumerator = BottomUpEnumerator(g, request, inputs,
+                                    timeout=likelihoodModel.timeout,
+                                    deadline=starting + timeout)
+
+    def solves(n, values):
+        try:
+            return all(values[p] == y for p, (_, y) in zip(taskInputs[n], tasks[n].examples))
+        except Exception:
+            return False
 
+    windows = [(0., lowerBound)] if lowerBound > 0. else []
+    budget = lowerBound
+    while budget < upperBound:
+        windows.append((budget, min(upperBound, budget + budgetIncrement)))
+        budget += budgetIncrement
 
+    try:
+        for windowLowerBound, windowUpperBound in windows:
+            if not any(len(h) < mf for h, mf in zip(hits, maximumFrontiers)):
+                break
+            for mdl, body, values in enumerator.enumerateWindow(windowLowerBound, windowUpperBound):
+                if mdl < lowerBound:
+                    continue
+                program = body
+                for _ in enumerator.environment:
+                    program = Abstraction(program)
+                prior = None
+                for n, task in enumerate(tasks):
+                    if taskInputs[n] is not None:
+                        success, likelihood = solves(n, values), 0.
+                    else:
+                        success, likelihood = likelihoodModel.score(program, task)
+                    if not success:
+                        continue
+                    if prior is None:
+                        prior = g.logLikelihood(request, program)
+                    dt = time() - starting + elapsedTime
+                    hits[n].push(-(likelihood + prior),
+                                 (dt, FrontierEntry(program=program,
+                                                    logLikelihood=likelihood,
+                                                    logPrior=prior)))
+                    if len(hits[n]) > maximumFrontiers[n]:
+                        hits[n].popMaximum()
+    except EnumerationTimeout:
+        pass
+
+    if verbose:
+        eprint("(python) Bottom-up enumeration banked %d subterms of %d types" %
+               (sum(len(b) for b in enumerator.bank.values()), len(enumerator.bank)))
+
+    frontiers = {tasks[n]: Frontier([e for _, e in hits[n]],
+                                    task=tasks[n])
+                 for n in range(len(tasks))}
+    searchTimes = {
+        tasks[n]: None if len(hits[n]) == 0 else \
+        min(t for t,_ in hits[n]) for n in range(len(tasks))}
 
+    return frontiers, searchTimes, enumerator.numberOfPrograms
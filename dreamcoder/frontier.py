@@ -1,6 +1,8 @@
 from dreamcoder.utilities import *
 from dreamcoder.task import Task
 
+import heapq
+
 
 class FrontierEntry(object):
     def __init__(
@@ -13,7 +15,9 @@ class FrontierEntry(object):
             tokens=None,
             test=None):
         self.logPosterior = logPrior + logLikelihood if logPosterior is None else logPosterior
-        self.program = program
+        # Interned programs share their subtrees with every other frontier,
+        # and hash and compare in constant time
+        self.program = program if program is None else program.intern()
         self.logPrior = logPrior
         self.logLikelihood = logLikelihood
         if tokens is None:
@@ -183,6 +187,48 @@ class Frontier(object):
                          ["Hits %d/%d tasks" % (numberOfHits, len(frontiers))] +
                          ["Average description length of a program solving a task: %f nats" % (-averageLikelihood)])
 
+    def mergeEntries(self, e1, e2, tolerance=0.01):
+        """Combines two entries for the same program.
+        Returns (the entry to keep, whether their likelihoods differed)"""
+        p = e1.program
+        foundDifference = False
+        if abs(e1.logPrior - e2.logPrior) > tolerance:
+            eprint(
+                "WARNING: Log priors differed during frontier combining: %f vs %f" %
+                (e1.logPrior, e2.logPrior))
+            eprint("WARNING: \tThe program is", p)
+            eprint()
+        if abs(e1.logLikelihood - e2.logLikelihood) > tolerance:
+            foundDifference = True
+            eprint(
+                "WARNING: Log likelihoods deferred for %s: %f & %f" %
+                (p, e1.logLikelihood, e2.logLikelihood))
+            if hasattr(self.task, 'BIC'):
+                eprint("\t%d examples, BIC=%f, parameterPenalty=%f, n parameters=%d, correct likelihood=%f" %
+                       (len(self.task.examples),
+                        self.task.BIC,
+                        self.task.BIC * math.log(len(self.task.examples)),
+                        substringOccurrences("REAL", str(p)),
+                        substringOccurrences("REAL", str(p)) * self.task.BIC * math.log(len(self.task.examples))))
+                e1.logLikelihood = - \
+                    substringOccurrences("REAL", str(p)) * self.task.BIC * math.log(len(self.task.examples))
+                e2.logLikelihood = e1.logLikelihood
+
+            e1 = FrontierEntry(
+                program=e1.program,
+                logLikelihood=(
+                    e1.logLikelihood +
+                    e2.logLikelihood) /
+                2,
+                logPrior=e1.logPrior)
+        return e1, foundDifference
+
+    def warnAboutDifferentLikelihoods(self):
+        eprint(
+            "WARNING: Log likelihoods differed for the same program on the task %s.\n" %
+            (self.task.name),
+            "\tThis is acceptable only if the likelihood model is stochastic. Took the geometric mean of the likelihoods.")
+
     def combine(self, other, tolerance=0.01):
         '''Takes the union of the programs in each of the frontiers'''
         assert self.task == other.task
@@ -197,44 +243,140 @@ class Frontier(object):
             if p in x:
                 e1 = x[p]
                 if p in y:
-                    e2 = y[p]
-                    if abs(e1.logPrior - e2.logPrior) > tolerance:
-                        eprint(
-                            "WARNING: Log priors differed during frontier combining: %f vs %f" %
-                            (e1.logPrior, e2.logPrior))
-                        eprint("WARNING: \tThe program is", p)
-                        eprint()
-                    if abs(e1.logLikelihood - e2.logLikelihood) > tolerance:
-                        foundDifference = True
-                        eprint(
-                            "WARNING: Log likelihoods deferred for %s: %f & %f" %
-                            (p, e1.logLikelihood, e2.logLikelihood))
-                        if hasattr(self.task, 'BIC'):
-                            eprint("\t%d examples, BIC=%f, parameterPenalty=%f, n parameters=%d, correct likelihood=%f" %
-                                   (len(self.task.examples),
-                                    self.task.BIC,
-                                    self.task.BIC * math.log(len(self.task.examples)),
-                                    substringOccurrences("REAL", str(p)),
-                                    substringOccurrences("REAL", str(p)) * self.task.BIC * math.log(len(self.task.examples))))
-                            e1.logLikelihood = - \
-                                substringOccurrences("REAL", str(p)) * self.task.BIC * math.log(len(self.task.examples))
-                            e2.logLikelihood = e1.logLikelihood
-
-                        e1 = FrontierEntry(
-                            program=e1.program,
-                            logLikelihood=(
-                                e1.logLikelihood +
-                                e2.logLikelihood) /
-                            2,
-                            logPrior=e1.logPrior)
+                    e1, differed = self.mergeEntries(e1, y[p], tolerance)
+                    foundDifference = foundDifference or differed
             else:
                 e1 = y[p]
             union.append(e1)
 
         if foundDifference:
-            eprint(
-                "WARNING: Log likelihoods differed for the same program on the task %s.\n" %
-                (self.task.name),
-                "\tThis is acceptable only if the likelihood model is stochastic. Took the geometric mean of the likelihoods.")
+            self.warnAboutDifferentLikelihoods()
 
         return Frontier(union, self.task)
+
+
+class RankedEntry(object):
+    """A FrontierEntry in the heap of a FrontierStore, which puts the worst entry on top:
+    the one with the lowest posterior, and of those, the one that Frontier.topK would drop first"""
+    __slots__ = ["entry", "key", "live"]
+
+    def __init__(self, entry):
+        self.entry = entry
+        self.key = str(entry.program)
+        # Entries that have been replaced or dropped stay in the heap until they get to the top
+        self.live = True
+
+    def __lt__(self, o):
+        if self.entry.logPosterior != o.entry.logPosterior:
+            return self.entry.logPosterior < o.entry.logPosterior
+        return self.key > o.key
+
+
+class FrontierStore(Frontier):
+    """
+    A frontier that holds on to at most maximumFrontier entries, the ones with
+    the best posteriors, and that gets updated in place:
+        store.update(other)
+    leaves store with the entries of frontier.combine(other).topK(maximumFrontier),
+    without rebuilding and sorting the whole frontier each time. Programs are
+    indexed by their hash and the entries kept in a heap, so adding an entry
+    takes O(log maximumFrontier). Everything else in the Frontier API works
+    on a view of its entries, best first.
+    maximumFrontier: None (or negative) for no limit.
+    """
+
+    def __init__(self, frontier, task, maximumFrontier=None):
+        self.task = task
+        self.maximumFrontier = maximumFrontier
+        self.reset(frontier)
+
+    @staticmethod
+    def of(frontier, maximumFrontier):
+        """frontier, if it is a FrontierStore with this maximumFrontier already,
+        and otherwise a new FrontierStore of its best entries"""
+        if isinstance(frontier, FrontierStore) and frontier.maximumFrontier == maximumFrontier:
+            return frontier
+        return FrontierStore(frontier.entries, frontier.task, maximumFrontier)
+
+    def reset(self, entries):
+        # Map from program to its RankedEntry
+        self.index = {}
+        self.heap = []
+        self.view = None
+        for e in entries:
+            self.add(e)
+
+    def __getstate__(self):
+        return {"task": self.task, "maximumFrontier": self.maximumFrontier, "entries": self.entries}
+
+    def __setstate__(self, state):
+        self.__init__(state["entries"], state["task"], state["maximumFrontier"])
+
+    @property
+    def entries(self):
+        if self.view is None:
+            self.view = [r.entry for r in sorted(self.index.values(),
+                                                 key=lambda r: (-r.entry.logPosterior, r.key))]
+        return self.view
+
+    @entries.setter
+    def entries(self, entries):
+        self.reset(entries)
+
+    @property
+    def bounded(self):
+        return self.maximumFrontier is not None and self.maximumFrontier >= 0
+
+    def worst(self):
+        while not self.heap[0].live:
+            heapq.heappop(self.heap)
+        return self.heap[0]
+
+    def push(self, r):
+        self.index[r.entry.program] = r
+        heapq.heappush(self.heap, r)
+        self.view = None
+        # Don't let the dead entries pile up
+        if len(self.heap) > 2 * len(self.index) + 16:
+            self.heap = [r for r in self.heap if r.live]
+            heapq.heapify(self.heap)
+
+    def add(self, e, tolerance=0.01):
+        """Adds an entry, unless it would not be in the top maximumFrontier.
+        Returns whether there was an entry for its program already, with a different likelihood."""
+        if self.bounded and self.maximumFrontier == 0:
+            return False
+        old = self.index.get(e.program)
+        if old is not None:
+            merged, differed = self.mergeEntries(old.entry, e, tolerance)
+            if merged is not old.entry:
+                old.live = False
+                self.push(RankedEntry(merged))
+            return differed
+
+        r = RankedEntry(e)
+        if self.bounded and len(self.index) >= self.maximumFrontier:
+            worst = self.worst()
+            if not (worst < r):
+                return False
+            worst.live = False
+            heapq.heappop(self.heap)
+            del self.index[worst.entry.program]
+        self.push(r)
+        return False
+
+    def update(self, frontier, tolerance=0.01):
+        """Adds the entries of frontier to this one, in place. Returns self."""
+        assert self.task == frontier.task
+        if any([self.add(e, tolerance) for e in frontier]):
+            self.warnAboutDifferentLikelihoods()
+        return self
+
+    def rescore(self, grammar):
+        """Replaces the prior of every entry with its prior under grammar, in place. Returns self."""
+        self.reset([FrontierEntry(e.program,
+                                  logPrior=grammar.logLikelihood(self.task.request, e.program),
+                                  logLikelihood=e.logLikelihood,
+                                  tokens=e.tokens)
+                    for e in self.entries])
+        return self
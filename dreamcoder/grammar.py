@@ -1,4 +1,4 @@
-from collections import defaultdict, Counter
+from collections import defaultdict, Counter, OrderedDict
 
 from dreamcoder.frontier import *
 from dreamcoder.program import *
@@ -17,13 +17,44 @@ class NoCandidates(Exception):
     pass
 
 
+def shiftCandidates(candidates, context):
+    """Moves candidates that were built in the empty context into the given context:
+    their type variables get renumbered to come after the ones that the context uses,
+    and their substitutions get put in front of the context's."""
+    n = context.nextVariable
+    shifted = []
+    for l, t, p, k in candidates:
+        if k.nextVariable == 0 and not k.substitution:
+            # Nothing was instantiated, so the context is left alone
+            shifted.append((l, t, p, context))
+            continue
+        bindings = {v: TypeVariable(v + n) for v in range(k.nextVariable)}
+        def shift(tp): return tp.instantiate(Context.EMPTY, bindings)[1]
+        shifted.append((l, shift(t), p,
+                        context.extendMany(n + k.nextVariable,
+                                           [(v + n, shift(tp)) for v, tp in k.substitution])))
+    return shifted
+
+
 class Grammar(object):
+    # How many (request, environment) entries each grammar keeps in its candidate cache
+    CANDIDATECACHESIZE = 10000
+
     def __init__(self, logVariable, productions, continuationType=None):
         self.logVariable = logVariable
         self.productions = productions
 
         self.continuationType = continuationType
 
+        # Map from monomorphic (request, environment, flags) to the candidates
+        # built for it in the empty context; see buildCandidates
+        self.candidateCache = OrderedDict()
+        self.candidateCacheHits = 0
+        self.candidateCacheMisses = 0
+
+        # What likelihood summaries depend on; see LikelihoodSummaryCache
+        self.productionKey = (frozenset((t, p) for _, t, p in productions), continuationType)
+
         self.expression2likelihood = dict((p, l) for l, _, p in productions)
         self.expression2likelihood[Index(0)] = self.logVariable
         
@@ -90,6 +121,12 @@ class Grammar(object):
                                     for l,t,p in self.productions ],
                        continuationType=self.continuationType)
 
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        del state["candidateCache"]
+        del state["productionKey"]
+        return state
+
     def __setstate__(self, state):
         """
         Legacy support for loading grammar objects without the imperative type filled in
@@ -187,6 +224,60 @@ class Grammar(object):
         if returnProbabilities:
             assert normalize
 
+        # When neither the request nor the environment mention any type
+        # variables, the candidates only depend on the context through how
+        # many type variables it has already used. So we build them once in
+        # the empty context, and shift them into the context we were given.
+        key = None
+        request = request.apply(context)
+        if not request.isPolymorphic:
+            environment = [t.apply(context) for t in environment]
+            if not any(t.isPolymorphic for t in environment):
+                key = (request, tuple(environment), normalize, returnProbabilities, mustBeLeaf)
+
+        if key is None:
+            candidates = self._buildCandidates(request, context, environment,
+                                               normalize, returnProbabilities, mustBeLeaf)
+        else:
+            # Solver threads can share this grammar, so another one may evict
+            # what we just looked up. A request with no candidates is cached as None,
+            # so NoCandidates stands for a miss
+            candidates = self.candidateCache.get(key, NoCandidates)
+            if candidates is not NoCandidates:
+                self.candidateCacheHits += 1
+                try:
+                    self.candidateCache.move_to_end(key)
+                except KeyError:
+                    pass
+            else:
+                self.candidateCacheMisses += 1
+                try:
+                    candidates = self._buildCandidates(request, Context.EMPTY, environment,
+                                                       normalize, returnProbabilities, mustBeLeaf)
+                except NoCandidates:
+                    candidates = None
+                self.candidateCache[key] = candidates
+                if len(self.candidateCache) > self.CANDIDATECACHESIZE:
+                    try:
+                        self.candidateCache.popitem(last=False)
+                    except KeyError:
+                        pass
+            if candidates is None:
+                raise NoCandidates()
+            candidates = shiftCandidates(candidates, context)
+
+        if returnTable:
+            return {p: (l, t, k) for l, t, p, k in candidates}
+        else:
+            return candidates
+
+    def candidateCacheStatistics(self):
+        return {"hits": self.candidateCacheHits,
+                "misses": self.candidateCacheMisses,
+                "size": len(self.candidateCache)}
+
+    def _buildCandidates(self, request, context, environment,
+                         normalize, returnProbabilities, mustBeLeaf):
         candidates = []
         variableCandidates = []
         for l, t, p in self.productions:
@@ -234,10 +325,7 @@ class Grammar(object):
         #eprint("candidates inside buildCandidates after norm:")
         #eprint(candidates)
 
-        if returnTable:
-            return {p: (l, t, k) for l, t, p, k in candidates}
-        else:
-            return candidates
+        return candidates
 
 
     def sample(self, request, maximumDepth=6, maxAttempts=None):
@@ -425,6 +513,9 @@ class Grammar(object):
                 action()
 
     def closedLikelihoodSummary(self, request, expression, silent=False):
+        return SUMMARYCACHE.summary(self, request, expression, silent=silent)
+
+    def _closedLikelihoodSummary(self, request, expression, silent=False):
         try:
             context, summary = self.likelihoodSummary(Context.EMPTY, [], request, expression, silent=silent)
         except GrammarFailure as e:
@@ -510,8 +601,11 @@ class Grammar(object):
 
     def enumeration(self,context,environment,request,upperBound,
                     maximumDepth=20,
-                    lowerBound=0.):
-        '''Enumerates all programs whose MDL satisfies: lowerBound <= MDL < upperBound'''
+                    lowerBound=0.,
+                    signatures=None):
+        '''Enumerates all programs whose MDL satisfies: lowerBound <= MDL < upperBound
+        signatures: optionally, an object whose redundant(environment, request, MDL, program)
+        says which subterms to skip because they are observationally equivalent to cheaper ones'''
         if upperBound < 0 or maximumDepth == 1:
             return
 
@@ -521,7 +615,8 @@ class Grammar(object):
                                                      request.arguments[1],
                                                      upperBound=upperBound,
                                                      lowerBound=lowerBound,
-                                                     maximumDepth=maximumDepth):
+                                                     maximumDepth=maximumDepth,
+                                                     signatures=signatures):
                 yield l, newContext, Abstraction(b)
 
         else:
@@ -538,7 +633,11 @@ class Grammar(object):
                     self.enumerateApplication(newContext, environment, p, xs,
                                               upperBound=upperBound + l,
                                               lowerBound=lowerBound + l,
-                                              maximumDepth=maximumDepth - 1):
+                                              maximumDepth=maximumDepth - 1,
+                                              signatures=signatures):
+                    if signatures is not None and \
+                       signatures.redundant(environment, request.apply(aK), -(aL + l), application):
+                        continue
                     yield aL + l, aK, application
 
     def enumerateApplication(self, context, environment,
@@ -551,7 +650,8 @@ class Grammar(object):
                              lowerBound=0.,
                              maximumDepth=20,
                              originalFunction=None,
-                             argumentIndex=0):
+                             argumentIndex=0,
+                             signatures=None):
         if upperBound < 0. or maximumDepth == 1:
             return
         if originalFunction is None:
@@ -568,7 +668,8 @@ class Grammar(object):
             for argL, newContext, arg in self.enumeration(context, environment, argRequest,
                                                           upperBound=upperBound,
                                                           lowerBound=0.,
-                                                          maximumDepth=maximumDepth):
+                                                          maximumDepth=maximumDepth,
+                                                          signatures=signatures):
                 if violatesSymmetry(originalFunction, arg, argumentIndex):
                     continue
 
@@ -579,7 +680,8 @@ class Grammar(object):
                                                                           lowerBound=lowerBound + argL,
                                                                           maximumDepth=maximumDepth,
                                                                           originalFunction=originalFunction,
-                                                                          argumentIndex=argumentIndex + 1):
+                                                                          argumentIndex=argumentIndex + 1,
+                                                                          signatures=signatures):
                     yield resultL + argL, resultK, result
 
     def sketchEnumeration(self,context,environment,request,sk,upperBound,
@@ -862,6 +964,57 @@ normalizers = {%s})""" % (self.constant,
                     possibleUses, actualUses)
 
 
+class LikelihoodSummaryCache(object):
+    """Bounded LRU cache from (productions, request, program) to the closed
+    likelihood summary of the program. A summary says which productions were
+    used, and which could have been, but not what they weigh: so it is shared
+    by every grammar with the same productions (and continuation type), and
+    rescoring a frontier under new weights only needs
+    LikelihoodSummary.logLikelihood. Summaries must not be modified.
+    Ill-typed programs have no summary, and are not cached, so that callers
+    that are not silent about them still hear about them.
+    Solver threads share the cache, so it never assumes that a key it has
+    just seen is still there."""
+
+    def __init__(self, size=2**15):
+        self.size = size
+        self.summaries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def clear(self):
+        self.summaries.clear()
+
+    def statistics(self):
+        return {"hits": self.hits,
+                "misses": self.misses,
+                "size": len(self.summaries)}
+
+    def summary(self, grammar, request, expression, silent=False):
+        key = (grammar.productionKey, request, expression)
+        summary = self.summaries.get(key)
+        if summary is not None:
+            self.hits += 1
+            try:
+                self.summaries.move_to_end(key)
+            except KeyError:
+                pass
+            return summary
+        self.misses += 1
+        summary = grammar._closedLikelihoodSummary(request, expression, silent=silent)
+        if summary is not None and self.size > 0:
+            self.summaries[key] = summary
+            if len(self.summaries) > self.size:
+                try:
+                    self.summaries.popitem(last=False)
+                except KeyError:
+                    pass
+        return summary
+
+
+SUMMARYCACHE = LikelihoodSummaryCache()
+
+
 class Uses(object):
     '''Tracks uses of different grammar productions'''
 
@@ -1090,6 +1243,9 @@ class ContextualGrammar:
     def logLikelihood(self, request, expression):
         return self.closedLikelihoodSummary(request, expression).logLikelihood(self)
 
+    def rescoreFrontier(self, frontier):
+        return Grammar.rescoreFrontier(self, frontier)
+
     def sample(self, request, maximumDepth=8, maxAttempts=None):
         attempts = 0
         while True:
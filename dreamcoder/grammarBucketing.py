@@ -0,0 +1,114 @@
+"""
+Sharing enumeration between testing tasks whose grammars are nearly the same.
+
+During testing, multicoreEnumeration gives each task a job of its own, and
+the recognition model gives each task a grammar of its own, so every task
+pays for its own solver. bucketGrammars puts tasks that have the same
+request, and grammars that are all within threshold of each other, into one
+bucket. Each bucket is enumerated once with the centroid of its grammars,
+and afterwards the frontier of each task is rescored under its own grammar.
+
+Grammars are compared through their productions (and variable), normalized
+into a distribution. For a ContextualGrammar we take the largest distance
+between corresponding component grammars.
+    linf: the largest difference in log probability of any production.
+          Every grammar in a bucket is within threshold of the centroid, so
+          each choice that the centroid makes is off by at most 2 * threshold nats.
+    kl: the symmetrized KL divergence between the production distributions.
+"""
+
+from dreamcoder.grammar import ContextualGrammar, Grammar
+
+import numpy as np
+
+
+GRAMMARDISTANCES = ["linf", "kl"]
+
+
+def componentGrammars(g):
+    """The Grammar's that make up g, in a canonical order"""
+    if isinstance(g, ContextualGrammar):
+        return [g.noParent, g.variableParent] + [c for e in g.library for c in g.library[e]]
+    return [g]
+
+
+def grammarSignature(g):
+    """Grammars can only be compared (and averaged) if their signatures are the same"""
+    if isinstance(g, ContextualGrammar):
+        return ("contextual", tuple(p for _, _, p in g.noParent.productions),
+                tuple((e, len(gs)) for e, gs in g.library.items()))
+    return ("grammar", tuple(p for _, _, p in g.productions))
+
+
+def grammarMatrix(g):
+    """One row for each component grammar: its normalized log probabilities,
+    starting with the variable and then following its productions"""
+    m = np.array([[c.logVariable] + [l for l, _, _ in c.productions]
+                  for c in componentGrammars(g)], dtype=float)
+    return m - np.logaddexp.reduce(m, axis=1, keepdims=True)
+
+
+def matrixDistance(a, b, distance="linf"):
+    if distance == "linf":
+        return float(np.max(np.abs(a - b)))
+    if distance == "kl":
+        # KL(a||b) + KL(b||a)
+        return float(np.max(np.sum((np.exp(a) - np.exp(b)) * (a - b), axis=1)))
+    assert False, "Invalid grammar distance %s; options are %s" % (distance, ", ".join(GRAMMARDISTANCES))
+
+
+def grammarDistance(a, b, distance="linf"):
+    if grammarSignature(a) != grammarSignature(b):
+        return float('inf')
+    return matrixDistance(grammarMatrix(a), grammarMatrix(b), distance)
+
+
+def grammarFromMatrix(template, m):
+    """A grammar like template, but with the weights in the rows of m"""
+    def component(c, row):
+        # Plain floats: lse treats anything else as a tensor
+        row = [float(l) for l in row]
+        return Grammar(row[0], [(l, t, p) for l, (_, t, p) in zip(row[1:], c.productions)],
+                       continuationType=c.continuationType)
+
+    if not isinstance(template, ContextualGrammar):
+        return component(template, m[0])
+    rows = iter(range(m.shape[0]))
+    noParent = component(template.noParent, m[next(rows)])
+    variableParent = component(template.variableParent, m[next(rows)])
+    library = {e: [component(c, m[next(rows)]) for c in gs]
+               for e, gs in template.library.items()}
+    return ContextualGrammar(noParent, variableParent, library)
+
+
+def centroidGrammar(grammars):
+    """The grammar whose log probabilities are the mean of those of grammars,
+    which all have to have the same signature"""
+    if len(grammars) == 1:
+        return grammars[0]
+    return grammarFromMatrix(grammars[0], np.mean([grammarMatrix(g) for g in grammars], axis=0))
+
+
+def bucketGrammars(tasks, task2grammar, threshold, distance="linf"):
+    """Returns a list of (grammar, tasks), where tasks all have the same
+    request, and grammar is the centroid of their grammars, which are all
+    within threshold of each other. Tasks go into the first bucket that
+    will take them, so the buckets come out in the order of tasks."""
+    signatures = {}
+    matrices = {}
+    for t in tasks:
+        g = task2grammar[t]
+        signatures[t] = (t.request, grammarSignature(g))
+        matrices[t] = grammarMatrix(g)
+
+    buckets = []
+    for t in tasks:
+        for b in buckets:
+            if signatures[b[0]] == signatures[t] and \
+               all(matrixDistance(matrices[t], matrices[m], distance) <= threshold for m in b):
+                b.append(t)
+                break
+        else:
+            buckets.append([t])
+
+    return [(centroidGrammar([task2grammar[t] for t in b]), b) for b in buckets]
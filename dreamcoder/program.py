@@ -4,7 +4,10 @@ from dreamcoder.type import *
 from dreamcoder.utilities import *
 
 from time import time
+import collections
 import math
+import re
+import weakref
 
 
 class InferenceFailure(Exception):
@@ -19,6 +22,19 @@ class RunFailure(Exception):
 
 
 class Program(object):
+    # Nodes that hold no other state than their children use __slots__
+    __slots__ = ()
+
+    # Interned programs are hash-consed: there is only one interned copy of
+    # each program (made of the same primitive objects), so structurally
+    # equal subtrees share memory, and equal interned programs are almost
+    # always the same object. Unequal interned programs tell themselves apart
+    # by their precomputed hashes. See intern().
+    isInterned = False
+    # Map from (kind of node, its children...) to the interned node. Children
+    # appear by id: they are interned, and their parent keeps them alive.
+    INTERNED = weakref.WeakValueDictionary()
+
     def __repr__(self): return str(self)
 
     def __ne__(self, o): return not (self == o)
@@ -99,15 +115,39 @@ class Program(object):
             return False
 
     def runWithArguments(self, xs):
-        f = self.evaluate([])
+        f = self.compile()
         for x in xs:
             f = f(x)
         return f
 
+    def compile(self):
+        """The value of this (closed) program, like self.evaluate([]), but
+        computed by Python closures that COMPILECACHE makes once per program,
+        instead of by walking the tree. Raises IndexError if the program has
+        free variables."""
+        return COMPILECACHE.closure(self)(None)
+
+    def compileClosure(self, depth):
+        """A function from environments to the value of this program, where
+        there are depth variables in scope. Environments are linked frames:
+        None, or (value of $0, environment of the rest)"""
+        def closure(environment):
+            values = []
+            while environment is not None:
+                values.append(environment[0])
+                environment = environment[1]
+            return self.evaluate(values)
+        return closure
+
     def applicationParses(self): yield self, []
 
     def applicationParse(self): return self, []
 
+    def intern(self):
+        """The interned copy of this program. Nodes that can't be interned
+        (e.g. Union) return themselves, as do programs that contain them."""
+        return self
+
     @property
     def closed(self):
         for surroundingAbstractions, child in self.walk():
@@ -156,31 +196,64 @@ class Program(object):
 
     @staticmethod
     def parse(s):
-        s = parseSExpression(s)
-        def p(e):
-            if isinstance(e,list):
-                if e[0] == '#':
-                    assert len(e) == 2
-                    return Invented(p(e[1]))
-                if e[0] == 'lambda':
-                    assert len(e) == 2
-                    return Abstraction(p(e[1]))                    
-                try:
-                    f = p(e[0])
-                except:
-                    print(e, e[0])
-                    breakpoint()
-                for x in e[1:]:
-                    f = Application(f,p(x))
-                return f
-            assert isinstance(e,str)
-            if e[0] == '$': return Index(int(e[1:]))
-            if e in Primitive.GLOBALS: return Primitive.GLOBALS[e]
-            if e == '??' or e == '?': return FragmentVariable.single
-            if e == '<HOLE>': return Hole.single
-            print(Primitive.GLOBALS)
-            raise ParseFailure((s,e))
-        return p(s)
+        """Parses s, which comes out of Program.show, into an interned program.
+        Parses are remembered by PARSECACHE."""
+        return PARSECACHE.parse(s)
+
+    @staticmethod
+    def parseUncached(s):
+        """One pass over the tokens of s, with an explicit stack instead of
+        recursion, so deep programs don't hit the recursion limit"""
+        # Each frame holds the expressions of a parenthesized list so far
+        stack = [[]]
+        for token in PROGRAMTOKENS.findall(s):
+            frame = stack[-1]
+            if token == '(':
+                stack.append([])
+                continue
+            if token == '#':
+                frame.append(INVENTMARKER)
+                continue
+            if token == 'lambda' and not frame and len(stack) > 1:
+                frame.append(LAMBDAMARKER)
+                continue
+            if token == ')':
+                if len(stack) == 1: raise ParseFailure(s)
+                e = Program._parseList(s, stack.pop())
+                frame = stack[-1]
+            else:
+                e = Program._parseAtom(s, token)
+            while frame and frame[-1] is INVENTMARKER:
+                frame.pop()
+                e = Invented.interned(e) if e.isInterned else Invented(e)
+            frame.append(e)
+
+        if len(stack) > 1 or len(stack[0]) != 1 or not isinstance(stack[0][0], Program):
+            raise ParseFailure(s)
+        return stack[0][0]
+
+    @staticmethod
+    def _parseAtom(s, token):
+        if token[0] == '$':
+            if not token[1:].isdigit(): raise ParseFailure((s, token))
+            return Index.interned(int(token[1:]))
+        if token in Primitive.GLOBALS: return Primitive.GLOBALS[token].intern()
+        if token == '??' or token == '?': return FragmentVariable.single
+        if token == '<HOLE>': return Hole.single
+        raise ParseFailure((s, token))
+
+    @staticmethod
+    def _parseList(s, items):
+        if not items or any(e is INVENTMARKER for e in items):
+            raise ParseFailure(s)
+        if items[0] is LAMBDAMARKER:
+            if len(items) != 2: raise ParseFailure(s)
+            b = items[1]
+            return Abstraction.interned(b) if b.isInterned else Abstraction(b)
+        f = items[0]
+        for x in items[1:]:
+            f = Application.interned(f, x) if f.isInterned and x.isInterned else Application(f, x)
+        return f
 
     @staticmethod
     def _parse(s,n):
@@ -236,24 +309,47 @@ class Program(object):
 
 class Application(Program):
     '''Function application'''
+    __slots__ = ("f", "x", "hashCode", "isConditional", "isInterned", "annotatedType", "__weakref__")
 
     def __init__(self, f, x):
         self.f = f
         self.x = x
         self.hashCode = None
+        self.isInterned = False
         self.isConditional = (not isinstance(f,int)) and \
                              f.isApplication and \
                              f.f.isApplication and \
                              f.f.f.isPrimitive and \
                              f.f.f.name == "if"
-        if self.isConditional:
-            self.falseBranch = x
-            self.trueBranch = f.x
-            self.branch = f.f.x
-        else:
-            self.falseBranch = None
-            self.trueBranch = None
-            self.branch = None
+
+    @staticmethod
+    def interned(f, x):
+        """The interned application of f to x, which have to be interned"""
+        key = (Application, id(f), id(x))
+        e = Program.INTERNED.get(key)
+        if e is None:
+            e = Application(f, x)
+            e.hashCode = hash((hash(f), hash(x)))
+            e.isInterned = True
+            Program.INTERNED[key] = e
+        return e
+
+    def intern(self):
+        if self.isInterned: return self
+        f = self.f.intern()
+        x = self.x.intern()
+        if f.isInterned and x.isInterned:
+            return Application.interned(f, x)
+        return Application(f, x)
+
+    @property
+    def falseBranch(self): return self.x if self.isConditional else None
+
+    @property
+    def trueBranch(self): return self.f.x if self.isConditional else None
+
+    @property
+    def branch(self): return self.f.f.x if self.isConditional else None
 
     def betaReduce(self):
         # See if either the function or the argument can be reduced
@@ -289,11 +385,11 @@ class Application(Program):
     @property
     def isApplication(self): return True
 
-    def __eq__(
-        self,
-        other): return isinstance(
-        other,
-        Application) and self.f == other.f and self.x == other.x
+    def __eq__(self, other):
+        if self is other: return True
+        if not isinstance(other, Application): return False
+        if self.isInterned and other.isInterned and self.hashCode != other.hashCode: return False
+        return self.f == other.f and self.x == other.x
 
     def __hash__(self):
         if self.hashCode is None:
@@ -305,7 +401,7 @@ class Application(Program):
         return self.f, self.x, self.isConditional, self.falseBranch, self.trueBranch, self.branch
     def __setstate__(self, state):
         try:
-            self.f, self.x, self.isConditional, self.falseBranch, self.trueBranch, self.branch = state
+            self.f, self.x, self.isConditional, _, _, _ = state
         except ValueError:
             # backward compatibility
             assert 'x' in state
@@ -319,16 +415,9 @@ class Application(Program):
                                  f.f.isApplication and \
                                  f.f.f.isPrimitive and \
                                  f.f.f.name == "if"
-            if self.isConditional:
-                self.falseBranch = x
-                self.trueBranch = f.x
-                self.branch = f.f.x
-            else:
-                self.falseBranch = None
-                self.trueBranch = None
-                self.branch = None
 
         self.hashCode = None
+        self.isInterned = False
 
     def visit(self,
               visitor,
@@ -343,12 +432,31 @@ class Application(Program):
         else:
             return "(%s %s)" % (self.f.show(True), self.x.show(False))
 
+    def compileClosure(self, depth):
+        if self.isConditional:
+            branch = self.f.f.x.compileClosure(depth)
+            trueBranch = self.f.x.compileClosure(depth)
+            falseBranch = self.x.compileClosure(depth)
+            return lambda environment: trueBranch(environment) if branch(environment) \
+                else falseBranch(environment)
+        x = self.x.compileClosure(depth)
+        # Primitives at the head of an application are the common case
+        if self.f.isPrimitive:
+            f = self.f.value
+            return lambda environment: f(x(environment))
+        if self.f.isApplication and self.f.f.isPrimitive:
+            f = self.f.f.value
+            y = self.f.x.compileClosure(depth)
+            return lambda environment: f(y(environment))(x(environment))
+        f = self.f.compileClosure(depth)
+        return lambda environment: f(environment)(x(environment))
+
     def evaluate(self, environment):
         if self.isConditional:
-            if self.branch.evaluate(environment):
-                return self.trueBranch.evaluate(environment)
+            if self.f.f.x.evaluate(environment):
+                return self.f.x.evaluate(environment)
             else:
-                return self.falseBranch.evaluate(environment)
+                return self.x.evaluate(environment)
         else:
             return self.f.evaluate(environment)(self.x.evaluate(environment))
 
@@ -421,16 +529,39 @@ class Index(Program):
     deBruijn index: https://en.wikipedia.org/wiki/De_Bruijn_index
     These indices encode variables.
     '''
+    __slots__ = ("i", "isInterned", "annotatedType", "__weakref__")
 
     def __init__(self, i):
         self.i = i
+        self.isInterned = False
+
+    @staticmethod
+    def interned(i):
+        key = (Index, i)
+        e = Program.INTERNED.get(key)
+        if e is None:
+            e = Index(i)
+            e.isInterned = True
+            Program.INTERNED[key] = e
+        return e
+
+    def intern(self):
+        if self.isInterned: return self
+        return Index.interned(self.i)
 
     def show(self, isFunction): return "$%d" % self.i
 
-    def __eq__(self, o): return isinstance(o, Index) and o.i == self.i
+    def __eq__(self, o): return self is o or (isinstance(o, Index) and o.i == self.i)
 
     def __hash__(self): return self.i
 
+    def __getstate__(self):
+        return self.i
+    def __setstate__(self, state):
+        # backward compatibility: Index used to pickle its __dict__
+        self.i = state['i'] if isinstance(state, dict) else state
+        self.isInterned = False
+
     def visit(self,
               visitor,
               *arguments,
@@ -441,6 +572,18 @@ class Index(Program):
     def evaluate(self, environment):
         return environment[self.i]
 
+    def compileClosure(self, depth):
+        i = self.i
+        if i >= depth: raise IndexError("free variable $%d" % i)
+        if i == 0: return lambda environment: environment[0]
+        if i == 1: return lambda environment: environment[1][0]
+        if i == 2: return lambda environment: environment[1][1][0]
+        def closure(environment):
+            for _ in range(i):
+                environment = environment[1]
+            return environment[0]
+        return closure
+
     def inferType(self, context, environment, freeVariables):
         if self.bound(len(environment)):
             return (context, environment[self.i].apply(context))
@@ -513,16 +656,40 @@ class Index(Program):
 
 class Abstraction(Program):
     '''Lambda abstraction. Creates a new function.'''
+    __slots__ = ("body", "hashCode", "isInterned", "annotatedType", "__weakref__")
 
     def __init__(self, body):
         self.body = body
         self.hashCode = None
+        self.isInterned = False
+
+    @staticmethod
+    def interned(body):
+        """The interned abstraction of body, which has to be interned"""
+        key = (Abstraction, id(body))
+        e = Program.INTERNED.get(key)
+        if e is None:
+            e = Abstraction(body)
+            e.hashCode = hash((hash(body),))
+            e.isInterned = True
+            Program.INTERNED[key] = e
+        return e
+
+    def intern(self):
+        if self.isInterned: return self
+        body = self.body.intern()
+        if body.isInterned:
+            return Abstraction.interned(body)
+        return Abstraction(body)
 
     @property
     def isAbstraction(self): return True
 
-    def __eq__(self, o): return isinstance(
-        o, Abstraction) and o.body == self.body
+    def __eq__(self, o):
+        if self is o: return True
+        if not isinstance(o, Abstraction): return False
+        if self.isInterned and o.isInterned and self.hashCode != o.hashCode: return False
+        return o.body == self.body
 
     def __hash__(self):
         if self.hashCode is None:
@@ -535,6 +702,7 @@ class Abstraction(Program):
     def __setstate__(self, state):
         self.body = state
         self.hashCode = None
+        self.isInterned = False
 
     def isBetaLong(self): return self.body.isBetaLong()
 
@@ -561,6 +729,10 @@ class Abstraction(Program):
     def evaluate(self, environment):
         return lambda x: self.body.evaluate([x] + environment)
 
+    def compileClosure(self, depth):
+        body = self.body.compileClosure(depth + 1)
+        return lambda environment: lambda x: body((x, environment))
+
     def betaReduce(self):
         b = self.body.betaReduce()
         if b is None: return None
@@ -605,8 +777,46 @@ class Abstraction(Program):
         return Abstraction(b), n
 
 
+class PrimitiveTable(dict):
+    """A dict that counts the changes made to it, so that whatever depends
+    on it (e.g. PARSECACHE) knows when to start over"""
+
+    def __init__(self, *arguments, **keywords):
+        super(PrimitiveTable, self).__init__(*arguments, **keywords)
+        self.version = 0
+
+    def __setitem__(self, key, value):
+        self.version += 1
+        super(PrimitiveTable, self).__setitem__(key, value)
+
+    def __delitem__(self, key):
+        self.version += 1
+        super(PrimitiveTable, self).__delitem__(key)
+
+    def clear(self):
+        self.version += 1
+        super(PrimitiveTable, self).clear()
+
+    def pop(self, *arguments):
+        self.version += 1
+        return super(PrimitiveTable, self).pop(*arguments)
+
+    def popitem(self):
+        self.version += 1
+        return super(PrimitiveTable, self).popitem()
+
+    def setdefault(self, key, default=None):
+        if key not in self:
+            self.version += 1
+        return super(PrimitiveTable, self).setdefault(key, default)
+
+    def update(self, *arguments, **keywords):
+        self.version += 1
+        super(PrimitiveTable, self).update(*arguments, **keywords)
+
+
 class Primitive(Program):
-    GLOBALS = {}
+    GLOBALS = PrimitiveTable()
 
     def __init__(self, name, ty, value):
         self.tp = ty
@@ -623,6 +833,13 @@ class Primitive(Program):
 
     def __hash__(self): return hash(self.name)
 
+    # Every primitive is its own interned copy. Primitives with the same
+    # name are equal, but can have different values, so interning one of
+    # them in place of another would change what programs compute.
+    isInterned = True
+
+    def intern(self): return self
+
     def visit(self,
               visitor,
               *arguments,
@@ -639,6 +856,10 @@ class Primitive(Program):
 
     def evaluate(self, environment): return self.value
 
+    def compileClosure(self, depth):
+        value = self.value
+        return lambda environment: value
+
     def betaReduce(self): return None
 
     def isBetaLong(self): return True
@@ -688,11 +909,32 @@ class Primitive(Program):
 
 class Invented(Program):
     '''New invented primitives'''
+    __slots__ = ("body", "tp", "hashCode", "isInterned", "annotatedType", "__weakref__")
 
     def __init__(self, body):
         self.body = body
         self.tp = self.body.infer()
         self.hashCode = None
+        self.isInterned = False
+
+    @staticmethod
+    def interned(body):
+        """The interned invention with body, which has to be interned"""
+        key = (Invented, id(body))
+        e = Program.INTERNED.get(key)
+        if e is None:
+            e = Invented(body)
+            e.hashCode = hash((0, hash(body)))
+            e.isInterned = True
+            Program.INTERNED[key] = e
+        return e
+
+    def intern(self):
+        if self.isInterned: return self
+        body = self.body.intern()
+        if body.isInterned:
+            return Invented.interned(body)
+        return Invented(body)
 
     @property
     def isInvented(self): return True
@@ -706,7 +948,11 @@ class Invented(Program):
                                                    *arguments,
                                                    **keywords)
 
-    def __eq__(self, o): return isinstance(o, Invented) and o.body == self.body
+    def __eq__(self, o):
+        if self is o: return True
+        if not isinstance(o, Invented): return False
+        if self.isInterned and o.isInterned and self.hashCode != o.hashCode: return False
+        return o.body == self.body
 
     def __hash__(self):
         if self.hashCode is None:
@@ -719,6 +965,7 @@ class Invented(Program):
     def __setstate__(self, state):
         self.body, self.tp = state
         self.hashCode = None
+        self.isInterned = False
 
     def clone(self): return Invented(self.body)
 
@@ -727,6 +974,10 @@ class Invented(Program):
 
     def evaluate(self, e): return self.body.evaluate([])
 
+    def compileClosure(self, depth):
+        body = COMPILECACHE.closure(self.body)
+        return lambda environment: body(None)
+
     def betaReduce(self): return self.body
 
     def isBetaLong(self): return True
@@ -766,6 +1017,11 @@ class FragmentVariable(Program):
 
     def show(self, isFunction): return "??"
 
+    @property
+    def isInterned(self): return self is FragmentVariable.single
+
+    def intern(self): return FragmentVariable.single
+
     def __eq__(self, o): return isinstance(o, FragmentVariable)
 
     def __hash__(self): return 42
@@ -827,6 +1083,11 @@ class Hole(Program):
 
     def show(self, isFunction): return "<HOLE>"
 
+    @property
+    def isInterned(self): return self is Hole.single
+
+    def intern(self): return Hole.single
+
     @property
     def isHole(self): return True
 
@@ -863,6 +1124,98 @@ class Hole(Program):
 Hole.single = Hole()
 
 
+# Tokens of Program.show: parentheses, the # that starts an invention, and names
+PROGRAMTOKENS = re.compile(r"[()]|#|[^\s()#][^\s()]*")
+INVENTMARKER = object()
+LAMBDAMARKER = object()
+
+
+class ParseCache(object):
+    """Bounded LRU cache from strings to the programs that Program.parse
+    makes of them. What a string parses to depends on Primitive.GLOBALS, so
+    the cache empties itself whenever that changes (or is replaced).
+    Solver threads share the cache, so it never assumes that a key it has
+    just seen is still there."""
+
+    def __init__(self, size=2**16):
+        self.size = size
+        self.programs = collections.OrderedDict()
+        self.primitives = None
+        self.hits = 0
+        self.misses = 0
+
+    def clear(self):
+        self.programs.clear()
+
+    def parse(self, s):
+        primitives = (id(Primitive.GLOBALS), getattr(Primitive.GLOBALS, "version", len(Primitive.GLOBALS)))
+        if primitives != self.primitives:
+            self.programs.clear()
+            self.primitives = primitives
+        p = self.programs.get(s)
+        if p is not None:
+            self.hits += 1
+            try:
+                self.programs.move_to_end(s)
+            except KeyError:
+                pass
+            return p
+        self.misses += 1
+        p = Program.parseUncached(s)
+        if self.size > 0:
+            self.programs[s] = p
+            if len(self.programs) > self.size:
+                try:
+                    self.programs.popitem(last=False)
+                except KeyError:
+                    pass
+        return p
+
+
+PARSECACHE = ParseCache()
+
+
+class CompileCache(object):
+    """Bounded LRU cache from programs to what Program.compileClosure makes
+    of them. Programs are interned first, and looked up by identity: equal
+    programs can be made of different primitives with the same name."""
+
+    def __init__(self, size=2**14):
+        self.size = size
+        self.closures = collections.OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def clear(self):
+        self.closures.clear()
+
+    def closure(self, p):
+        p = p.intern()
+        # The program itself is kept along with its closure, so its id stays unique
+        _, c = self.closures.get(id(p), (None, None))
+        if c is not None:
+            self.hits += 1
+            # Another thread may have evicted it since
+            try:
+                self.closures.move_to_end(id(p))
+            except KeyError:
+                pass
+            return c
+        self.misses += 1
+        c = p.compileClosure(0)
+        if self.size > 0:
+            self.closures[id(p)] = (p, c)
+            if len(self.closures) > self.size:
+                try:
+                    self.closures.popitem(last=False)
+                except KeyError:
+                    pass
+        return c
+
+
+COMPILECACHE = CompileCache()
+
+
 class ShareVisitor(object):
     def __init__(self):
         self.primitiveTable = {}
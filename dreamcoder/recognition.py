@@ -1177,6 +1177,8 @@ class RecognitionModel(nn.Module):
         # And type stuff is expensive!
         frontiers = [self.replaceProgramsWithLikelihoodSummaries(f).normalize()
                      for f in frontiers]
+        eprint("Likelihood summary cache: %(hits)d hits, %(misses)d misses, %(size)d entries" %
+               SUMMARYCACHE.statistics())
 
         feature_extractor_names = [
             str(encoder.__class__.__name__) for encoder in (self.featureExtractor, self.language_encoder)
@@ -1319,6 +1321,9 @@ class RecognitionModel(nn.Module):
         samples = [z for z in samples if z is not None]
         eprint()
         eprint("Got %d/%d valid samples." % (len(samples), N))
+        if hasattr(self.generativeModel, "candidateCacheStatistics"):
+            eprint("Candidate cache: %(hits)d hits, %(misses)d misses, %(size)d entries" %
+                   self.generativeModel.candidateCacheStatistics())
         flushEverything()
 
         return samples
@@ -1332,7 +1337,16 @@ class RecognitionModel(nn.Module):
                            frontierSize=None,
                            maximumFrontier=None,
                            evaluationTimeout=None,
-                           max_mem_per_enumeration_thread=1000000):
+                           max_mem_per_enumeration_thread=None,
+                           persistentSolver=False,
+                           streamHits=False,
+                           budgetPolicy="fixed",
+                           enumerationMemo=None,
+                           observationalEquivalence=False,
+                           enumerationTelemetry=None,
+                           enumerationCoordinator=None,
+                           grammarBucketing=None,
+                           grammarBucketingDistance="linf"):
         with timing("Evaluated recognition model"):
             grammars = {task: self.grammarOfTask(task)
                         for task in tasks}
@@ -1346,8 +1360,43 @@ class RecognitionModel(nn.Module):
                                     CPUs=CPUs, maximumFrontier=maximumFrontier,
                                     evaluationTimeout=evaluationTimeout,
                                     unigramGrammar=self.generativeModel,
-                                    max_mem_per_enumeration_thread=max_mem_per_enumeration_thread)
-
+                                    max_mem_per_enumeration_thread=max_mem_per_enumeration_thread,
+                                    persistentSolver=persistentSolver,
+                                    streamHits=streamHits,
+                                    budgetPolicy=budgetPolicy,
+                                    enumerationMemo=enumerationMemo,
+                                    observationalEquivalence=observationalEquivalence,
+                                    enumerationTelemetry=enumerationTelemetry,
+                                    enumerationCoordinator=enumerationCoordinator,
+                                    grammarBucketing=grammarBucketing,
+                                    grammarBucketingDistance=grammarBucketingDistance)
+
+
+def enumerateFromEnsemble(recognizers, tasks, enumerationTimeout=None, **keywords):
+    """
+    Enumerates from every model of an ensemble at once, under one scheduler
+    that splits the CPUs between them, and that stops after
+    enumerationTimeout seconds of wall time, however many models there are.
+    Each task gets one frontier for the whole ensemble: a program that one
+    model finds is not found again by the others, and once a task has
+    maximumFrontier solutions none of them enumerate for it any more.
+    keywords: as for multicoreEnumeration.
+    Returns (frontiers, map from task to search time, [map from task to grammar for each recognizer])
+    """
+    grammars = []
+    with timing("Evaluated %d recognition models" % len(recognizers)):
+        for recognizer in recognizers:
+            task2grammar = {task: recognizer.grammarOfTask(task) for task in tasks}
+            grammars.append({task: grammar.untorch() for task, grammar in task2grammar.items()
+                             if grammar is not None})
+    tasks = [task for task in tasks if any(task in task2grammar for task2grammar in grammars)]
+
+    frontiers, times = multicoreEnumeration(grammars, tasks,
+                                            enumerationTimeout=enumerationTimeout,
+                                            wallClockTimeout=enumerationTimeout,
+                                            unigramGrammar=recognizers[0].generativeModel,
+                                            **keywords)
+    return frontiers, times, grammars
 
 class RecurrentFeatureExtractor(nn.Module):
     def __init__(self, _=None,
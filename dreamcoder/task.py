@@ -78,7 +78,7 @@ class Task(object):
             signal.setitimer(signal.ITIMER_VIRTUAL, timeout)
 
             try:
-                f = e.evaluate([])
+                f = e.compile()
             except IndexError:
                 # free variable
                 return False
@@ -115,6 +115,46 @@ class Task(object):
                 signal.signal(signal.SIGVTALRM, lambda *_: None)
                 signal.setitimer(signal.ITIMER_VIRTUAL, 0)
 
+    def checkMany(self, e, outputs, timeout=None):
+        """Like check, but for several tasks that all have the same inputs as this one.
+        outputs: for each of those tasks, the list of its outputs.
+        Runs e only once on each input, and only for as long as some task could still be solved.
+        Returns the indices into outputs of the tasks that e solves."""
+        if timeout is not None:
+            def timeoutCallBack(_1, _2): raise EvaluationTimeout()
+            signal.signal(signal.SIGVTALRM, timeoutCallBack)
+            signal.setitimer(signal.ITIMER_VIRTUAL, timeout)
+        try:
+            try:
+                f = e.compile()
+            except IndexError:
+                # free variable
+                return []
+            except Exception as exception:
+                eprint("Exception during evaluation:", exception)
+                return []
+
+            solved = list(range(len(outputs)))
+            for i, (x, _) in enumerate(self.examples):
+                try:
+                    p = self.predict(f, x)
+                except EvaluationTimeout:
+                    raise
+                except BaseException as err:
+                    print("Err during evaluation" + str(err))
+                    p = None
+                solved = [n for n in solved if not (p != outputs[n][i])]
+                if not solved:
+                    break
+            return solved
+        except EvaluationTimeout:
+            eprint("Timed out while evaluating", e)
+            return []
+        finally:
+            if timeout is not None:
+                signal.signal(signal.SIGVTALRM, lambda *_: None)
+                signal.setitimer(signal.ITIMER_VIRTUAL, 0)
+
     def logLikelihood(self, e, timeout=None):
         if self.check(e, timeout):
             return 0.0
@@ -7,6 +7,9 @@ class Occurs(UnificationFailure):
 
 
 class Type(object):
+    # Interned types are equal exactly when they are the same object
+    isInterned = False
+
     def __str__(self): return self.show(True)
 
     def __repr__(self): return str(self)
@@ -20,10 +23,57 @@ class Type(object):
 
 
 class TypeConstructor(Type):
-    def __init__(self, name, arguments):
-        self.name = name
-        self.arguments = arguments
-        self.isPolymorphic = any(a.isPolymorphic for a in arguments)
+    """Monomorphic types are interned: constructing one that we have already
+    made gives back the same object. There are only so many of them, so the
+    table that keeps them is never emptied. Types never change once they are
+    made, so each of them remembers its hash, and what functionArguments and
+    returns give, the first time it is asked for them."""
+
+    # Map from (name, id of each argument) to the monomorphic type with that
+    # name and those arguments, which are interned too
+    INTERNED = {}
+
+    hashCode = None
+    returnType = None
+    argumentTypes = None
+
+    def __new__(cls, name=None, arguments=None):
+        if name is None:
+            # Unpickling a type that was pickled before types were interned
+            return object.__new__(cls)
+
+        interned = True
+        for a in arguments:
+            if a.isPolymorphic:
+                self = object.__new__(cls)
+                self.name = name
+                self.arguments = arguments
+                self.isPolymorphic = True
+                return self
+            interned = interned and a.isInterned
+        if not interned:
+            arguments = [a.intern() for a in arguments]
+        key = (name,) + tuple(map(id, arguments))
+        self = TypeConstructor.INTERNED.get(key)
+        if self is None:
+            self = object.__new__(cls)
+            self.name = name
+            self.arguments = arguments
+            self.isPolymorphic = False
+            self.isInterned = True
+            # setdefault is atomic, so threads building the same type agree on one copy
+            self = TypeConstructor.INTERNED.setdefault(key, self)
+        return self
+
+    def intern(self):
+        """The interned type equal to this monomorphic type"""
+        assert not self.isPolymorphic
+        if self.isInterned:
+            return self
+        return TypeConstructor(self.name, self.arguments)
+
+    def __reduce__(self):
+        return (TypeConstructor, (self.name, self.arguments))
 
     def makeDummyMonomorphic(self, mapping=None):
         mapping = mapping if mapping is not None else {}
@@ -31,11 +81,17 @@ class TypeConstructor(Type):
                                [ a.makeDummyMonomorphic(mapping) for a in self.arguments ])
 
     def __eq__(self, other):
-        return isinstance(other, TypeConstructor) and \
-            self.name == other.name and \
+        if self is other:
+            return True
+        if not isinstance(other, TypeConstructor) or (self.isInterned and other.isInterned):
+            return False
+        return self.name == other.name and \
             all(x == y for x, y in zip(self.arguments, other.arguments))
 
-    def __hash__(self): return hash((self.name,) + tuple(self.arguments))
+    def __hash__(self):
+        if self.hashCode is None:
+            self.hashCode = hash((self.name,) + tuple(self.arguments))
+        return self.hashCode
 
     def __ne__(self, other):
         return not (self == other)
@@ -62,22 +118,32 @@ class TypeConstructor(Type):
     def isArrow(self): return self.name == ARROW
 
     def functionArguments(self):
-        if self.name == ARROW:
-            xs = self.arguments[1].functionArguments()
-            return [self.arguments[0]] + xs
-        return []
+        if self.argumentTypes is None:
+            xs = []
+            t = self
+            while t.isArrow():
+                xs.append(t.arguments[0])
+                t = t.arguments[1]
+            self.argumentTypes = tuple(xs)
+        return list(self.argumentTypes)
 
     def returns(self):
-        if self.name == ARROW:
-            return self.arguments[1].returns()
-        else:
-            return self
+        if self.returnType is None:
+            t = self
+            while t.isArrow():
+                t = t.arguments[1]
+            self.returnType = t
+        return self.returnType
 
     def apply(self, context):
         if not self.isPolymorphic:
             return self
-        return TypeConstructor(self.name,
-                               [x.apply(context) for x in self.arguments])
+        arguments = [x.apply(context) for x in self.arguments]
+        for x, y in zip(arguments, self.arguments):
+            if x is not y:
+                return TypeConstructor(self.name, arguments)
+        # Nothing in here is bound yet
+        return self
 
     def applyMutable(self, context):
         if not self.isPolymorphic:
@@ -156,10 +222,15 @@ class TypeVariable(Type):
     def functionArguments(self): return []
 
     def apply(self, context):
-        for v, t in context.substitution:
-            if v == self.v:
-                return t.apply(context)
-        return self
+        t = context.bindings.get(self.v)
+        if t is None:
+            return self
+        if not t.isPolymorphic:
+            return t
+        new = t.apply(context)
+        if new is not t:
+            context.bindings[self.v] = new
+        return new
 
     def applyMutable(self, context):
         s = context.substitution[self.v]
@@ -175,9 +246,8 @@ class TypeVariable(Type):
             bindings = {}
         if self.v in bindings:
             return (context, bindings[self.v])
-        new = TypeVariable(context.nextVariable)
+        context, new = context.makeVariable()
         bindings[self.v] = new
-        context = Context(context.nextVariable + 1, context.substitution)
         return (context, new)
 
     def instantiateMutable(self, context, bindings=None):
@@ -201,25 +271,63 @@ class TypeVariable(Type):
 
 
 class Context(object):
+    """An immutable substitution from type variables to types, together with
+    the number of type variables that have been used so far.
+
+    Bindings live in a dict from variable to type, which is shared with the
+    contexts that only differ from this one in nextVariable, and copied when
+    the context is extended; substitutions stay small, so the copy is cheaper
+    than anything that would avoid it. TypeVariable.apply compresses chains
+    of bindings as it follows them, as in union-find: that writes to the dict
+    in place, but does not change what any context that shares it means."""
+    __slots__ = ("nextVariable", "bindings")
+
     def __init__(self, nextVariable=0, substitution=[]):
         self.nextVariable = nextVariable
-        self.substitution = substitution
+        # Earlier bindings take precedence over later ones
+        self.bindings = dict(reversed(substitution))
+
+    @staticmethod
+    def make(nextVariable, bindings):
+        k = Context.__new__(Context)
+        k.nextVariable = nextVariable
+        k.bindings = bindings
+        return k
+
+    @property
+    def substitution(self):
+        """List of (variable, type) for each variable that is bound"""
+        return list(self.bindings.items())
 
     def extend(self, j, t):
-        return Context(self.nextVariable, [(j, t)] + self.substitution)
+        bindings = self.bindings.copy()
+        bindings[j] = t
+        return Context.make(self.nextVariable, bindings)
+
+    def extendMany(self, nextVariable, substitution):
+        """This context with nextVariable variables, and the bindings in
+        substitution put in front of ours"""
+        bindings = self.bindings.copy()
+        bindings.update(reversed(substitution))
+        return Context.make(nextVariable, bindings)
 
     def makeVariable(self):
-        return (Context(self.nextVariable + 1, self.substitution),
+        return (Context.make(self.nextVariable + 1, self.bindings),
                 TypeVariable(self.nextVariable))
 
     def unify(self, t1, t2):
         t1 = t1.apply(self)
         t2 = t2.apply(self)
+        if t1 is t2:
+            return self
+        if not t1.isPolymorphic and not t2.isPolymorphic:
+            # Different interned types are different types
+            if (t1.isInterned and t2.isInterned) or t1 != t2:
+                raise UnificationFailure(t1, t2)
+            return self
         if t1 == t2:
             return self
         # t1&t2 are not equal
-        if not t1.isPolymorphic and not t2.isPolymorphic:
-            raise UnificationFailure(t1, t2)
 
         if isinstance(t1, TypeVariable):
             if t2.occurs(t1.v):
@@ -236,6 +344,14 @@ class Context(object):
             k = k.unify(x, y)
         return k
 
+    def __getstate__(self):
+        return (self.nextVariable, self.substitution)
+
+    def __setstate__(self, state):
+        if isinstance(state, dict):
+            state = (state["nextVariable"], state["substitution"])
+        self.__init__(*state)
+
     def __str__(self):
         return "Context(next = %d, {%s})" % (self.nextVariable, ", ".join(
             "t%d ||> %s" % (k, v.apply(self)) for k, v in self.substitution))
@@ -258,11 +374,15 @@ class MutableContext(object):
         t1 = t1.applyMutable(self)
         t2 = t2.applyMutable(self)
 
+        if t1 is t2: return
+        if not t1.isPolymorphic and not t2.isPolymorphic:
+            if (t1.isInterned and t2.isInterned) or t1 != t2:
+                raise UnificationFailure(t1, t2)
+            return
+
         if t1 == t2: return
 
         # t1&t2 are not equal
-        if not t1.isPolymorphic and not t2.isPolymorphic:
-            raise UnificationFailure(t1, t2)
 
         if isinstance(t1, TypeVariable):
             if t2.occurs(t1.v):
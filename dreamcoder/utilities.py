@@ -9,6 +9,7 @@ import os
 import subprocess
 import math
 import pickle as pickle
+import struct
 from itertools import chain
 import heapq
 from frozendict import frozendict
@@ -488,7 +489,153 @@ def get_data_dir():
     return os.path.join(get_root_dir(), 'data')
 
 
+COMPILEDINTERPRETER = "pypy3"
+
+
+class CompiledWorkerDied(Exception):
+    pass
+
+
+class CompiledWorker(object):
+    """A pypy3 process running compiledDriver.py --server, which answers one
+    request after another and so keeps its JIT warm across calls. Messages in
+    both directions are their length, as 8 bytes big endian, followed by a pickle."""
+
+    def __init__(self):
+        compiled_driver_file = os.path.join(get_root_dir(), 'bin', 'compiledDriver.py')
+        self.process = subprocess.Popen([COMPILEDINTERPRETER, compiled_driver_file, "--server"],
+                                        stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+
+    @property
+    def pid(self): return self.process.pid
+
+    @property
+    def alive(self): return self.process.poll() is None
+
+    def kill(self):
+        if self.alive:
+            self.process.kill()
+        self.process.wait()
+        for handle in [self.process.stdin, self.process.stdout]:
+            try:
+                handle.close()
+            except Exception:
+                pass
+
+    def close(self):
+        """Closing stdin asks the worker to exit"""
+        try:
+            self.process.stdin.close()
+            self.process.wait(timeout=5)
+        except Exception:
+            pass
+        self.kill()
+
+    def read(self, n, deadline):
+        import select
+        data = b""
+        fd = self.process.stdout.fileno()
+        while len(data) < n:
+            if deadline is not None:
+                remaining = deadline - time.time()
+                if remaining <= 0 or not select.select([fd], [], [], remaining)[0]:
+                    raise CompiledTimeout()
+            chunk = os.read(fd, n - len(data))
+            if not chunk:
+                raise CompiledWorkerDied()
+            data += chunk
+        return data
+
+    def call(self, message, timeout=None):
+        """message: the pickled request. Returns the pickled response.
+        Raises CompiledTimeout or CompiledWorkerDied, after which the worker is dead."""
+        deadline = None if timeout is None else time.time() + timeout
+        try:
+            self.process.stdin.write(struct.pack(">Q", len(message)))
+            self.process.stdin.write(message)
+            self.process.stdin.flush()
+            header = self.read(8, deadline)
+            return self.read(struct.unpack(">Q", header)[0], deadline)
+        except (BrokenPipeError, CompiledWorkerDied):
+            self.kill()
+            raise CompiledWorkerDied()
+        except CompiledTimeout:
+            self.kill()
+            raise
+
+
+class CompiledWorkerPool(object):
+    """Keeps up to size idle workers. Each caller gets a worker of its own,
+    so the pool can be shared between threads, but not across a fork: a
+    forked child starts a pool of its own (see compiledWorkerPool)."""
+
+    def __init__(self, size=2):
+        import threading
+        self.size = size
+        self.idle = []
+        self.lock = threading.Lock()
+        self.pid = os.getpid()
+
+    def acquire(self):
+        with self.lock:
+            while self.idle:
+                worker = self.idle.pop()
+                if worker.alive:
+                    return worker
+                worker.kill()
+        return CompiledWorker()
+
+    def release(self, worker):
+        with self.lock:
+            if worker.alive and len(self.idle) < self.size:
+                self.idle.append(worker)
+                return
+        worker.close()
+
+    def call(self, message, timeout=None, PIDCallBack=None):
+        """Restarts the worker and tries once more if it dies on us"""
+        for attempt in range(2):
+            worker = self.acquire()
+            if PIDCallBack is not None:
+                PIDCallBack(worker.pid)
+            try:
+                response = worker.call(message, timeout=timeout)
+            except CompiledWorkerDied:
+                eprint("(Python side of compiled driver) Worker %d died, restarting it" % worker.pid)
+                continue
+            self.release(worker)
+            return response
+        raise CompiledWorkerDied()
+
+    def close(self):
+        with self.lock:
+            idle, self.idle = self.idle, []
+        for worker in idle:
+            worker.close()
+
+
+COMPILEDWORKERS = None
+
+
+def compiledWorkerPool(size=None):
+    """The pool of workers used by callCompiled. Passing size resizes it."""
+    global COMPILEDWORKERS
+    if COMPILEDWORKERS is None or COMPILEDWORKERS.pid != os.getpid():
+        # The workers of our parent belong to our parent
+        import atexit
+        COMPILEDWORKERS = CompiledWorkerPool()
+        atexit.register(COMPILEDWORKERS.close)
+    if size is not None:
+        COMPILEDWORKERS.size = size
+    return COMPILEDWORKERS
+
+
 def callCompiled(f, *arguments, **keywordArguments):
+    """Calls f in pypy3. Unless persistent=False (or we are profiling), this
+    goes to a worker from compiledWorkerPool, which outlives the call.
+    The pool belongs to the process that made it, so calls from a forked
+    child start cold workers of their own; multicoreEnumeration calls
+    solveForTask_pypy from threads for that reason."""
     import dill
 
     pypyArgs = []
@@ -500,20 +647,43 @@ def callCompiled(f, *arguments, **keywordArguments):
 
     timeout = keywordArguments.pop('compiledTimeout', None)
 
+    persistent = keywordArguments.pop('persistent', True) and not profile
+
+    request = {
+        "function": f,
+        "arguments": arguments,
+        "keywordArguments": keywordArguments,
+    }
+
+    if persistent:
+        start = time.time()
+        message = dill.dumps(request)
+        dt = time.time() - start
+        if dt > 1:
+            eprint("(Python side of compiled driver: SLOW) Serialized message for {} in time {}".format(
+                f.__name__,
+                dt))
+        if timeout is not None:
+            eprint("Running with timeout", timeout)
+        try:
+            success, result = dill.loads(compiledWorkerPool().call(message,
+                                                                   timeout=timeout,
+                                                                   PIDCallBack=PIDCallBack))
+        except CompiledWorkerDied:
+            success = False
+        if not success:
+            sys.exit(1)
+        return result
+
     # Use absolute paths.
     compiled_driver_file = os.path.join(get_root_dir(), 'bin', 'compiledDriver.py')
-    p = subprocess.Popen(['pypy3'] + pypyArgs + [compiled_driver_file],
+    p = subprocess.Popen([COMPILEDINTERPRETER] + pypyArgs + [compiled_driver_file],
                          stdin=subprocess.PIPE, stdout=subprocess.PIPE)
 
 
     if PIDCallBack is not None:
         PIDCallBack(p.pid)
 
-    request = {
-        "function": f,
-        "arguments": arguments,
-        "keywordArguments": keywordArguments,
-    }
     start = time.time()
     dill.dump(request, p.stdin)
 
@@ -736,8 +906,8 @@ def makeTemporaryFile(directory="/tmp"):
     return p
 
 class Stopwatch():
-    def __init__(self):
-        self._elapsed = 0.
+    def __init__(self, elapsed=0.):
+        self._elapsed = elapsed
         self.running = False
         self._latestStart = None
 
@@ -53,6 +53,9 @@ class VersionTable():
         self.recursiveTable = []
         self.substitutionTable = {}
         self.expression2index = {}
+        # Map from interned program to its index, so that we only walk each
+        # subtree that programs share once
+        self.interned2index = {}
         self.maximumShift = []
         # Table containing (minimum cost, set of minimum cost programs)
         self.inhabitantTable = []
@@ -147,6 +150,15 @@ class VersionTable():
                 
     def incorporate(self,p):
         #assert isinstance(p,Union)# or p.wellTyped()
+        if p.isInterned:
+            j = self.interned2index.get(p)
+            if j is None:
+                j = self._incorporateStructure(p)
+                self.interned2index[p] = j
+            return j
+        return self._incorporateStructure(p)
+
+    def _incorporateStructure(self,p):
         if p.isIndex or p.isPrimitive or p.isInvented:
             pass
         elif p.isAbstraction:
@@ -0,0 +1,118 @@
+from dreamcoder.utilities import eprint
+
+import time
+
+
+class FixedWakeScheduler:
+    """Gives every job enumerationTimeout seconds of search, however well it is doing"""
+
+    def __init__(self):
+        self.deadline = None
+
+    def begin(self, jobs, enumerationTimeout, CPUs):
+        self.enumerationTimeout = enumerationTimeout
+
+    def timeLimits(self, jobs, elapsed):
+        return {j: self.enumerationTimeout for j in jobs}
+
+    def priority(self, job, lowerBound):
+        return lowerBound
+
+    def update(self, job, elapsed, unsolved, remaining):
+        pass
+
+    def summary(self):
+        return "%s seconds per job" % self.enumerationTimeout
+
+
+class DeadlineWakeScheduler(FixedWakeScheduler):
+    """Spends phaseBudget seconds of wall clock (by default enumerationTimeout) on
+    the whole wake phase, giving more of it to the jobs that are solving tasks fastest"""
+
+    def __init__(self, phaseBudget=None, priorHits=1., priorTime=10.,
+                 saturatedWeight=0.1, minimumTime=1., maximumJobTime=None,
+                 verbose=False):
+        super(DeadlineWakeScheduler, self).__init__()
+        self.phaseBudget = phaseBudget
+        self.priorHits = priorHits
+        self.priorTime = priorTime
+        self.saturatedWeight = saturatedWeight
+        self.minimumTime = minimumTime
+        self.maximumJobTime = maximumJobTime
+        self.verbose = verbose
+
+    def begin(self, jobs, enumerationTimeout, CPUs):
+        super(DeadlineWakeScheduler, self).begin(jobs, enumerationTimeout, CPUs)
+        budget = self.phaseBudget if self.phaseBudget is not None else enumerationTimeout
+        self.startTime = time.time()
+        self.deadline = self.startTime + budget
+        self.CPUs = CPUs
+        self.size = {j: len(ts) for j, ts in jobs.items()}
+        self.solved = {j: 0 for j in jobs}
+        self.elapsed = {j: 0. for j in jobs}
+        self.unsolved = dict(self.size)
+        self.remaining = dict(self.size)
+
+    def rate(self, job):
+        """Tasks solved for the first time per second of search, starting
+        from priorHits in priorTime seconds so that untried jobs look promising"""
+        return (self.solved[job] + self.priorHits) / (self.elapsed[job] + self.priorTime)
+
+    def gain(self, job):
+        """rate times the fraction of tasks left; ones that are solved but want
+        more solutions count for saturatedWeight of an unsolved one"""
+        unsolved = self.unsolved[job]
+        weight = unsolved + self.saturatedWeight * (self.remaining[job] - unsolved)
+        return self.rate(job) * weight / max(1, self.size[job])
+
+    def timeLimits(self, jobs, elapsed):
+        # Every job gets a share of the job-seconds left before the deadline in
+        # proportion to its gain, so saturated jobs make way for promising ones;
+        # none gets less than minimumTime or more than maximumJobTime
+        left = max(0., self.deadline - time.time()) * min(self.CPUs, len(jobs))
+        gains = {j: self.gain(j) for j in jobs}
+        total = sum(gains.values())
+        limits = {}
+        for j in jobs:
+            share = left * gains[j] / total if total > 0 else left / len(jobs)
+            limit = max(self.minimumTime, elapsed[j] + share)
+            if self.maximumJobTime is not None:
+                limit = min(limit, self.maximumJobTime)
+            limits[j] = limit
+        return limits
+
+    def priority(self, job, lowerBound):
+        return (-self.gain(job), lowerBound)
+
+    def update(self, job, elapsed, unsolved, remaining):
+        self.elapsed[job] = elapsed
+        self.solved[job] += max(0, self.unsolved[job] - unsolved)
+        self.unsolved[job] = unsolved
+        self.remaining[job] = remaining
+        if self.verbose:
+            eprint("(python) Wake scheduler: %s solved %d/%d tasks in %.2fs; %.3f tasks/s, gain %.4f" %
+                   (job[1], self.size[job] - unsolved, self.size[job], elapsed, self.rate(job), self.gain(job)))
+
+    def summary(self):
+        spent = sorted(self.elapsed.values())
+        if not spent:
+            return "no jobs"
+        return "%d jobs in %.2fs of a %.2fs budget, %.2f-%.2fs per job, %d/%d tasks solved" % \
+            (len(spent), time.time() - self.startTime, self.deadline - self.startTime,
+             spent[0], spent[-1], sum(self.size[j] - self.unsolved[j] for j in self.size),
+             sum(self.size.values()))
+
+
+WAKE_SCHEDULERS = {"fixed": FixedWakeScheduler,
+                   "deadline": DeadlineWakeScheduler}
+
+
+def makeWakeScheduler(scheduler, verbose=False):
+    """scheduler: either the name of a wake scheduler, or a scheduler object"""
+    if not isinstance(scheduler, str):
+        return scheduler
+    assert scheduler in WAKE_SCHEDULERS, \
+        "Invalid wake scheduler %s; options are %s" % (scheduler, ", ".join(WAKE_SCHEDULERS))
+    if scheduler == "deadline":
+        return DeadlineWakeScheduler(verbose=verbose)
+    return WAKE_SCHEDULERS[scheduler]()
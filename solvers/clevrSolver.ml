@@ -19,7 +19,11 @@ open FastType
 let load_problems channel =
   let open Yojson.Basic.Util in
   let j = Yojson.Basic.from_channel channel in
-  let g = j |> member "DSL" in
+  let store = j |> member "taskStore" in
+  let g = match j |> member "DSL" with
+    | `Null -> load_stored store (j |> member "DSLKey")
+    | g -> g
+  in
   let g =
     try deserialize_grammar g |> make_dummy_contextual
     with _ -> deserialize_contextual_grammar g
@@ -63,6 +67,11 @@ let load_problems channel =
     with _-> raise (Failure "could not unpack clevr output")
   in
   let tf = j |> member "tasks" |> to_list |> List.map ~f:(fun j ->
+      let maximum_frontier = j |> member "maximumFrontier" |> to_int in
+      let j = match j |> member "examples" with
+        | `Null -> load_stored store (j |> member "key")
+        | _ -> j
+      in
       let e = j |> member "examples" |> to_list in
       let task_type = j |> member "request" |> deserialize_type in
       let return_type = return_of_type task_type in
@@ -71,7 +80,6 @@ let load_problems channel =
         let output = ex |> member "output" in
         let unpacked_outputs = unpack_clevr_output output return_type in
         (unpacked_inputs, unpacked_outputs)) in
-      let maximum_frontier = j |> member "maximumFrontier" |> to_int in
       let name = j |> member "name" |> to_string in
 
       let task =
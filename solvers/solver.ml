@@ -15,13 +15,35 @@ open Grammar
 open Task
 open FastType
 
-let load_problems channel =
+(* When running as a server (solver --server) we keep every grammar and
+   task that we have deserialized, keyed by the identifier that the Python
+   frontend sends along with it (the key it has in the task store),
+   so that later jobs can refer to them *)
+let grammar_cache = Hashtbl.create (module String)
+let task_cache = Hashtbl.create (module String)
+
+let cached table key build =
+  match key with
+  | `String(key) -> begin
+      match Hashtbl.find table key with
+      | Some(v) -> v
+      | None ->
+        let v = build () in
+        Hashtbl.set table ~key:key ~data:v;
+        v
+    end
+  | _ -> build ()
+
+let load_problems_json j =
   let open Yojson.Basic.Util in
-  let j = Yojson.Basic.from_channel channel in
-  let g = j |> member "DSL" in
-  let g =
-    try deserialize_grammar g |> make_dummy_contextual
-    with _ -> deserialize_contextual_grammar g
+  let store = j |> member "taskStore" in
+  let g = cached grammar_cache (j |> member "DSLKey") (fun () ->
+      let g = match j |> member "DSL" with
+        | `Null -> load_stored store (j |> member "DSLKey")
+        | g -> g
+      in
+      try deserialize_grammar g |> make_dummy_contextual
+      with _ -> deserialize_contextual_grammar g)
   in
 
   let timeout = try
@@ -57,21 +79,24 @@ let load_problems channel =
   in
 
   let tf = j |> member "tasks" |> to_list |> List.map ~f:(fun j ->
-      let e = j |> member "examples" |> to_list in
-      let task_type = j |> member "request" |> deserialize_type in
-      let examples = e |> List.map ~f:(fun ex -> (ex |> member "inputs" |> to_list |> List.map ~f:unpack,
-                                                  ex |> member "output" |> unpack)) in
       let maximum_frontier = j |> member "maximumFrontier" |> to_int in
-      let name = j |> member "name" |> to_string in
-
-      let task =
-        (try
-           let special = j |> member "specialTask" |> to_string in
-           match special |> Hashtbl.find task_handler with
-           | Some(handler) -> handler (j |> member "extras")
-           | None -> (Printf.eprintf " (ocaml) FATAL: Could not find handler for %s\n" special;
-                      exit 1)
-         with _ -> supervised_task) ~timeout:timeout name task_type examples
+      let task = cached task_cache (j |> member "key") (fun () ->
+          let j = match j |> member "examples" with
+            | `Null -> load_stored store (j |> member "key")
+            | _ -> j
+          in
+          let e = j |> member "examples" |> to_list in
+          let task_type = j |> member "request" |> deserialize_type in
+          let examples = e |> List.map ~f:(fun ex -> (ex |> member "inputs" |> to_list |> List.map ~f:unpack,
+                                                      ex |> member "output" |> unpack)) in
+          let name = j |> member "name" |> to_string in
+          (try
+             let special = j |> member "specialTask" |> to_string in
+             match special |> Hashtbl.find task_handler with
+             | Some(handler) -> handler (j |> member "extras")
+             | None -> (Printf.eprintf " (ocaml) FATAL: Could not find handler for %s\n" special;
+                        exit 1)
+           with _ -> supervised_task) ~timeout:timeout name task_type examples)
       in
       (task, maximum_frontier))
   in
@@ -86,7 +111,7 @@ let load_problems channel =
 
   let _ = try
       shatter_factor := (j |> member "shatter" |> to_int)
-    with _ -> ()
+    with _ -> shatter_factor := 10
   in
 
 
@@ -116,34 +141,78 @@ let load_problems channel =
    maxParameters,
    nc,timeout,verbose)
 
+let load_problems channel = load_problems_json (Yojson.Basic.from_channel channel)
+
+let serialize_hit s : (string * Yojson.Basic.t) list =
+  [("program", `String(s.hit_program));
+   ("time", `Float(s.hit_time));
+   ("logLikelihood", `Float(s.hit_likelihood));
+   ("logPrior", `Float(s.hit_prior));
+   ("tokens", `String(s.hit_tokens))]
+
+let serialize_frontiers number_enumerated tf solutions : Yojson.Basic.t =
+  `Assoc(("number_enumerated",`Int(number_enumerated)) ::
+         List.map2_exn tf solutions ~f:(fun (t,_) ss ->
+      (t.name, `List(ss |> List.map ~f:(fun s -> `Assoc(serialize_hit s))))))
+
+(* When the frontend asks us to stream, every hit is written as its own line
+   as soon as we find it, ahead of the (single line) final response.
+   One write per line, so lines from forked workers do not interleave. *)
+let stream_hit t s =
+  let line = Yojson.Basic.to_string (`Assoc(("hit", `String(t.name)) :: serialize_hit s)) in
+  Out_channel.output_string stdout (line ^ "\n");
+  Out_channel.flush stdout
+
 let export_frontiers number_enumerated tf solutions: string =
-  let open Yojson.Basic.Util in
-  let open Yojson.Basic in
-  let serialization : Yojson.Basic.t =
-    `Assoc(("number_enumerated",`Int(number_enumerated)) ::
-           List.map2_exn tf solutions ~f:(fun (t,_) ss ->
-        (t.name, `List(ss |> List.map ~f:(fun s ->
-             `Assoc([("program", `String(s.hit_program));
-                     ("time", `Float(s.hit_time));
-                     ("logLikelihood", `Float(s.hit_likelihood));
-                     ("logPrior", `Float(s.hit_prior));
-                     ("tokens", `String(s.hit_tokens))]))))))
-  in pretty_to_string serialization
+  serialize_frontiers number_enumerated tf solutions |> Yojson.Basic.pretty_to_string
 ;;
 
+let streaming j =
+  try Yojson.Basic.Util.(j |> member "stream" |> to_bool) with _ -> false
 
-let _ =
-
+let solve j =
+  let report_hit = if streaming j then stream_hit else fun _ _ -> () in
   let (tf,g,
        lowerBound,upperBound,budgetIncrement,
        mfp,
      nc,timeout, verbose) =
-    load_problems Pervasives.stdin in
+    load_problems_json j in
   let solutions, number_enumerated =
     enumerate_for_tasks ~maxFreeParameters:mfp ~lowerBound:lowerBound ~upperBound:upperBound ~budgetIncrement:budgetIncrement
-    ~verbose:verbose ~nc:nc ~timeout:timeout g tf
+    ~verbose:verbose ~nc:nc ~report_hit:report_hit ~timeout:timeout g tf
+  in
+  (tf, solutions, number_enumerated)
+
+(* Server mode: every line on stdin is one job, and for every job we
+   write exactly one line on stdout (after any streamed hits).
+   Lives until stdin is closed. *)
+let serve () =
+  let rec loop () =
+    match In_channel.input_line In_channel.stdin with
+    | None -> ()
+    | Some(line) ->
+      let response =
+        try
+          let (tf, solutions, number_enumerated) = solve (Yojson.Basic.from_string line) in
+          serialize_frontiers number_enumerated tf solutions
+        with e -> `Assoc([("error", `String(Exn.to_string e))])
+      in
+      print_endline (Yojson.Basic.to_string response);
+      flush_everything();
+      loop ()
   in
-  export_frontiers number_enumerated tf solutions |> print_string ;;
+  loop ()
+;;
+
+
+let _ =
+  if Array.length Sys.argv > 1 && String.equal Sys.argv.(1) "--server" then serve () else
+    let j = Yojson.Basic.from_channel Pervasives.stdin in
+    let (tf, solutions, number_enumerated) = solve j in
+    if streaming j then
+      print_endline (Yojson.Basic.to_string (serialize_frontiers number_enumerated tf solutions))
+    else
+      export_frontiers number_enumerated tf solutions |> print_string ;;
 
 (* let tune_differentiation () = *)
 (*   let (tf,g, *)
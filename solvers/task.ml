@@ -409,6 +409,8 @@ let enumerate_for_tasks (g: contextual_grammar) ?verbose:(verbose = true)
     ?lowerBound:(lowerBound = 0.)
     ?upperBound:(upperBound = 99.)
     ?nc:(nc=1)
+    (* Called on every hit as soon as it is found, possibly from a forked worker *)
+    ?report_hit:(report_hit = fun (_: task) (_: hit_result) -> ())
     ~timeout
     (* tasks and maximum frontier sizes *)
     (tf: (task*int) list)
@@ -468,12 +470,13 @@ let enumerate_for_tasks (g: contextual_grammar) ?verbose:(verbose = true)
                  if is_valid logLikelihood then begin
                    let dt = Time.abs_diff startTime (Time.now ())
                             |> Time.Span.to_sec in
-                   Heap.add hits.(j)
-                     {hit_program = string_of_program p;
-                      hit_prior = logPrior;
-                      hit_likelihood = logLikelihood;
-                      hit_time = dt;
-                      hit_tokens = string_of_tokens false p} ;
+                   let hit = {hit_program = string_of_program p;
+                              hit_prior = logPrior;
+                              hit_likelihood = logLikelihood;
+                              hit_time = dt;
+                              hit_tokens = string_of_tokens false p} in
+                   Heap.add hits.(j) hit;
+                   report_hit tasks.(j) hit;
                    while Heap.length hits.(j) > maximumFrontier.(j) do
                      Heap.remove_top hits.(j)
                    done;
@@ -410,3 +410,11 @@ let rec ensure_resizable_length a l default =
 let clear_resizable a =
   a.ra_occupancy <- 0;
   a.ra_contents <- Array.create ~len:10 None
+
+(* The Python frontend spills tasks and grammars into its task store,
+   as <store>/<key>.json, and then only sends us their keys *)
+let load_stored store key =
+  match store, key with
+  | `String(store), `String(key) ->
+    Yojson.Basic.from_file (Filename.concat store (key ^ ".json"))
+  | _ -> raise (Failure "load_stored: expected a task store and a key")
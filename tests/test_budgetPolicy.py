@@ -0,0 +1,66 @@
+import json
+import math
+import unittest
+from unittest import mock
+
+from dreamcoder.budgetPolicy import AdaptiveBudgetPolicy, FixedBudgetPolicy, makeBudgetPolicy
+from dreamcoder.enumeration import multicoreEnumeration
+from dreamcoder.grammar import Grammar
+from dreamcoder.task import Task
+from dreamcoder.type import arrow, tint
+
+
+JOB = (None, arrow(tint, tint))
+
+
+class TestBudgetPolicy(unittest.TestCase):
+
+    def test_fixed_budget_policy(self):
+        policy = makeBudgetPolicy("fixed")
+        self.assertIsInstance(policy, FixedBudgetPolicy)
+        policy.update(JOB, 0., 1.5, 1, 1000, 1.)
+        self.assertEqual(policy.budgetIncrement(JOB, 1.5, 1), 1.5)
+
+    def test_adaptive_budget_fills_target_time(self):
+        policy = AdaptiveBudgetPolicy(targetTime=10., beta=1.)
+        self.assertEqual(policy.budgetIncrement(JOB, 0., 1), 1.5)
+        # 1000 programs in 1 second: aim for 10000 programs in the next window
+        policy.update(JOB, 0., 1.5, 1, 1000, 1.)
+        increment = policy.budgetIncrement(JOB, 1.5, 1)
+        density = 1000 / math.expm1(1.5) * math.exp(1.5)
+        self.assertAlmostEqual(density * math.expm1(increment), 10000)
+        # Twice the CPUs get a wider window
+        self.assertGreater(policy.budgetIncrement(JOB, 1.5, 2), increment)
+
+    def test_adaptive_budget_without_programs_doubles(self):
+        policy = AdaptiveBudgetPolicy(maximumIncrement=5.)
+        policy.update(JOB, 0., 1.5, 1, 0, 1.)
+        self.assertEqual(policy.budgetIncrement(JOB, 1.5, 1), 3.)
+        policy.update(JOB, 1.5, 3., 1, 0, 1.)
+        self.assertEqual(policy.budgetIncrement(JOB, 4.5, 1), 5.)
+
+    def test_adaptive_budget_learns_growth_rate(self):
+        policy = AdaptiveBudgetPolicy(beta=1.)
+        # Programs per nat are growing like exp(2 * MDL)
+        for lowerBound in [0., 1., 2.]:
+            policy.update(JOB, lowerBound, 1., 1, 100 * math.exp(2 * lowerBound) * math.expm1(2.) / 2., 1.)
+        self.assertGreater(policy.beta[JOB], 1.5)
+
+    @mock.patch('dreamcoder.enumeration.subprocess')
+    def test_multicore_enumeration_uses_policy(self, mock_subprocess):
+        mock_process = mock.MagicMock()
+        mock_process.communicate.return_value = ('{"add1": [], "number_enumerated": 0}'.encode('utf-8'), None)
+        mock_subprocess.Popen.return_value = mock_process
+        task = Task("add1", arrow(tint, tint), [((1,), 2)])
+        policy = AdaptiveBudgetPolicy(maximumIncrement=4.)
+        multicoreEnumeration(Grammar.uniform([]), [task], maximumFrontier=1, enumerationTimeout=1,
+                             budgetPolicy=policy)
+        windows = [json.loads(c[0][0].decode('utf-8'))
+                   for c in mock_process.communicate.call_args_list]
+        increments = [m["upperBound"] - m["lowerBound"] for m in windows]
+        self.assertEqual(increments[:3], [1.5, 3., 4.])
+        self.assertEqual(len(policy.history), len(windows))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,84 @@
+import os
+import sys
+import time
+import unittest
+from unittest import mock
+
+from dreamcoder import utilities
+from dreamcoder.enumeration import multicoreEnumeration
+from dreamcoder.frontier import Frontier
+from dreamcoder.grammar import Grammar
+from dreamcoder.task import Task
+from dreamcoder.type import arrow, tint, tlist
+from dreamcoder.utilities import CompiledTimeout, callCompiled, compiledWorkerPool
+
+
+# pypy3 need not be installed: the driver runs just as well in CPython
+@mock.patch('dreamcoder.utilities.COMPILEDINTERPRETER', sys.executable)
+class TestCompiledWorkers(unittest.TestCase):
+
+    def tearDown(self):
+        compiledWorkerPool().close()
+        utilities.COMPILEDWORKERS = None
+
+    def test_workers_are_reused(self):
+        pids = [callCompiled(os.getpid) for _ in range(3)]
+        self.assertEqual(len(set(pids)), 1)
+        self.assertNotEqual(pids[0], os.getpid())
+        self.assertEqual(callCompiled(sorted, [3, 1, 2], reverse=True), [3, 2, 1])
+        # ... unless we ask for a process of our own
+        self.assertNotIn(callCompiled(os.getpid, persistent=False), pids)
+
+    def test_timeout_restarts_worker(self):
+        pid = callCompiled(os.getpid)
+        start = time.time()
+        with self.assertRaises(CompiledTimeout):
+            callCompiled(time.sleep, 10, compiledTimeout=0.5)
+        self.assertLess(time.time() - start, 5)
+        self.assertNotEqual(callCompiled(os.getpid), pid)
+
+    def test_failures(self):
+        pid = callCompiled(os.getpid)
+        # An exception in the worker leaves it alive, and fails as before
+        with self.assertRaises(SystemExit):
+            callCompiled(int, "not a number")
+        self.assertEqual(callCompiled(os.getpid), pid)
+        # A worker that dies is restarted
+        with self.assertRaises(SystemExit):
+            callCompiled(os._exit, 1)
+        self.assertNotEqual(callCompiled(os.getpid), pid)
+
+    def test_concurrent_callers_get_their_own_workers(self):
+        pool = compiledWorkerPool(size=2)
+        first, second = pool.acquire(), pool.acquire()
+        self.assertNotEqual(first.pid, second.pid)
+        pool.release(first)
+        pool.release(second)
+        self.assertEqual(callCompiled(os.getpid), second.pid)
+        # Workers beyond size are closed instead of kept
+        pool.size = 1
+        pool.release(pool.acquire())
+        self.assertEqual(len(pool.idle), 1)
+        self.assertTrue(first.alive)
+        self.assertFalse(second.alive)
+
+    def test_enumeration_windows_run_in_this_process(self):
+        pids = []
+
+        def solve(f, g, tasks, likelihoodModel, **keywords):
+            # Stands in for pypy, which would be using compiledWorkerPool() of the caller
+            pids.append(os.getpid())
+            return {t: Frontier([], task=t) for t in tasks}, {t: None for t in tasks}, 0
+
+        tasks = [Task("incr", arrow(tint, tint), [((1,), 2)]),
+                 Task("length", arrow(tlist(tint), tint), [(([1],), 1)])]
+        with mock.patch('dreamcoder.enumeration.callCompiled', side_effect=solve):
+            frontiers, _ = multicoreEnumeration(Grammar.uniform([]), tasks, solver="pypy",
+                                                maximumFrontier=1, enumerationTimeout=1, CPUs=2)
+        self.assertTrue(all(f.empty for f in frontiers))
+        self.assertGreater(len(pids), 1)
+        self.assertEqual(set(pids), {os.getpid()})
+        self.assertEqual(compiledWorkerPool().size, 2)
+
+if __name__ == '__main__':
+    unittest.main()
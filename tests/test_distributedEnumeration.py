@@ -0,0 +1,163 @@
+import json
+import os
+import shutil
+import socket
+import stat
+import sys
+import tempfile
+import threading
+import unittest
+
+from dreamcoder.distributedEnumeration import EnumerationCoordinator, EnumerationWorker, parseAddress, \
+    runEnumerationWorker
+from dreamcoder.enumeration import multicoreEnumeration
+from dreamcoder.grammar import Grammar
+from dreamcoder.program import Primitive
+from dreamcoder.task import Task
+from dreamcoder.type import arrow, tint, tlist
+
+
+# Solves the task called `solved`, and logs the messages that it gets
+FAKE_SOLVER = """#!%s
+import json, os, sys
+m = json.load(sys.stdin)
+with open(os.path.join(os.path.dirname(__file__), "log"), "a") as f:
+    f.write(json.dumps({"pid": os.getpid(), "message": m}) + "\\n")
+response = {t["name"]: [] for t in m["tasks"]}
+if "solved" in response:
+    response["solved"].append({"program": "(lambda (test_remote_incr $0))", "time": 0.1,
+                               "logLikelihood": 0., "logPrior": -1., "tokens": "test_remote_incr"})
+response["number_enumerated"] = 7
+sys.stdout.write(json.dumps(response))
+"""
+
+
+class TestDistributedEnumeration(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        solver = os.path.join(self.directory, "solver")
+        with open(solver, "w") as f:
+            f.write(FAKE_SOLVER % sys.executable)
+        os.chmod(solver, os.stat(solver).st_mode | stat.S_IEXEC)
+        self.coordinator = EnumerationCoordinator(heartbeatInterval=0.1, heartbeatTimeout=0.5)
+        self.workers = []
+
+    def tearDown(self):
+        self.coordinator.close()
+        for w in self.workers:
+            w.join(timeout=5)
+        shutil.rmtree(self.directory)
+
+    def startWorker(self, **keywords):
+        worker = EnumerationWorker(*self.coordinator.address, solverDirectory=self.directory,
+                                   heartbeatInterval=0.1, **keywords)
+        thread = threading.Thread(target=worker.run, daemon=True)
+        thread.start()
+        self.workers.append(thread)
+        return worker
+
+    def log(self):
+        with open(os.path.join(self.directory, "log")) as f:
+            return [json.loads(l) for l in f]
+
+    def message(self, name="add1"):
+        return json.dumps({"tasks": [{"name": name}], "nc": 1})
+
+    def test_workers_on_localhost(self):
+        workers = [self.startWorker(CPUs=4) for _ in range(2)]
+        grammar = Grammar.uniform([Primitive("test_remote_incr", arrow(tint, tint), lambda x: x + 1)])
+        solved = Task("solved", arrow(tint, tint), [((1,), 2)])
+        unsolved = Task("unsolved", arrow(tlist(tint), tint), [(([1],), 2)])
+        frontiers, times = multicoreEnumeration(grammar, [solved, unsolved], maximumFrontier=1,
+                                                enumerationTimeout=1, CPUs=2,
+                                                enumerationCoordinator=self.coordinator)
+        self.assertEqual([str(e.program) for e in frontiers[0]], ["(lambda (test_remote_incr $0))"])
+        self.assertTrue(frontiers[1].empty)
+        self.assertIsNotNone(times[solved])
+        # The workers got the whole task, not a key into a task store, and used their own CPUs
+        log = self.log()
+        self.assertTrue(all("examples" in m["message"]["tasks"][0] for m in log))
+        self.assertTrue(all(m["message"]["nc"] == 4 for m in log))
+        self.assertEqual(sum(w.jobsRun for w in workers), len(log))
+        self.assertEqual(self.coordinator.completed, len(log))
+
+    def test_requeue_when_worker_disconnects(self):
+        # A worker that takes a job and then dies
+        with socket.create_connection(self.coordinator.address) as connection:
+            f = connection.makefile("rwb")
+            f.write(b'{"type": "ready"}\n')
+            f.flush()
+            result = {}
+            thread = threading.Thread(target=lambda: result.update(r=self.coordinator.solve(self.message())))
+            thread.start()
+            self.assertEqual(json.loads(f.readline())["type"], "job")
+        self.startWorker()
+        thread.join(timeout=10)
+        self.assertEqual(json.loads(result["r"])["number_enumerated"], 7)
+        self.assertEqual(self.coordinator.requeued, 1)
+
+    def test_requeue_when_heartbeats_stop(self):
+        # A worker that takes a job and then goes quiet
+        connection = socket.create_connection(self.coordinator.address)
+        f = connection.makefile("rwb")
+        f.write(b'{"type": "ready"}\n')
+        f.flush()
+        result = {}
+        thread = threading.Thread(target=lambda: result.update(r=self.coordinator.solve(self.message())))
+        thread.start()
+        job = json.loads(f.readline())
+        self.startWorker()
+        thread.join(timeout=10)
+        self.assertEqual(json.loads(result["r"])["number_enumerated"], 7)
+        self.assertEqual(self.coordinator.requeued, 1)
+        # Its late result does not count for anything
+        try:
+            f.write(bytes(json.dumps({"type": "result", "job": job["job"], "response": "late"}) + "\n",
+                          encoding="utf-8"))
+            f.flush()
+        except OSError:
+            pass
+        self.assertEqual(self.coordinator.completed, 1)
+        connection.close()
+
+    def test_workers_outlive_the_coordinator(self):
+        for shutdownWorkers in [False, True]:
+            coordinator = EnumerationCoordinator()
+            worker = EnumerationWorker(*coordinator.address, solverDirectory=self.directory)
+            result = {}
+            thread = threading.Thread(target=lambda: result.update(shutdown=worker.run()))
+            thread.start()
+            self.assertEqual(json.loads(coordinator.solve(self.message()))["add1"], [])
+            coordinator.close(shutdownWorkers=shutdownWorkers)
+            thread.join(timeout=10)
+            self.assertEqual(result["shutdown"], shutdownWorkers)
+
+    def test_one_worker_serves_several_rounds(self):
+        with socket.socket() as s:
+            s.bind(("localhost", 0))
+            port = s.getsockname()[1]
+        thread = threading.Thread(target=runEnumerationWorker, args=("localhost", port),
+                                  kwargs={"solverDirectory": self.directory, "heartbeatInterval": 0.1},
+                                  daemon=True)
+        thread.start()
+        grammar = Grammar.uniform([Primitive("test_remote_incr", arrow(tint, tint), lambda x: x + 1)])
+        for _ in range(2):
+            task = Task("solved", arrow(tint, tint), [((1,), 2)])
+            frontiers, _ = multicoreEnumeration(grammar, [task], maximumFrontier=1,
+                                                enumerationTimeout=10, CPUs=1,
+                                                enumerationCoordinator="localhost:%d" % port)
+            self.assertFalse(frontiers[0].empty)
+            self.assertTrue(thread.is_alive())
+        coordinator = EnumerationCoordinator("localhost", port)
+        coordinator.solve(self.message())
+        coordinator.close(shutdownWorkers=True)
+        thread.join(timeout=10)
+        self.assertFalse(thread.is_alive())
+
+    def test_parse_address(self):
+        self.assertEqual(parseAddress("localhost:1234"), ("localhost", 1234))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,12 +1,25 @@
+import functools
+import json
+import os
 import random
+import shutil
+import stat
+import sys
+import tempfile
+import time
 import unittest
 from unittest import mock
 
-from dreamcoder.enumeration import multicoreEnumeration
-from dreamcoder.frontier import Frontier
+from dreamcoder.enumeration import multicoreEnumeration, enumerateForTasks, bottomUpEnumerateForTasks, groupTasksByInputs, \
+    ObservationalEquivalence, SolverPool, TaskStore, taskMessage, killedForMemory, EnumerationJournal, \
+    BottomUpEnumerator, EnumerationTimeout, serializeTask
+from dreamcoder.frontier import Frontier, FrontierEntry
 from dreamcoder.grammar import Grammar
+from dreamcoder.likelihoodModel import AllOrNothingLikelihoodModel
+from dreamcoder.program import Primitive, Program
 from dreamcoder.task import Task
-from dreamcoder.type import arrow, tint
+from dreamcoder.type import arrow, tint, tlist
+from dreamcoder.utilities import computeMD5hash
 
 
 def add1():
@@ -115,6 +128,529 @@ class TestEnumerationMain(unittest.TestCase):
             multicoreEnumeration(
                 grammar, tasks, maximumFrontier=1, enumerationTimeout=1)
 
+    @mock.patch('dreamcoder.enumeration.subprocess')
+    def test_multicore_enumeration_sends_task_keys(self, mock_subprocess):
+        mock_process = mock.MagicMock()
+        mock_process.communicate.return_value = ('{"add1": []}'.encode('utf-8'), None)
+        mock_subprocess.Popen.return_value = mock_process
+        grammar = Grammar.uniform([])
+        task = get_add1_task()
+        multicoreEnumeration(grammar, [task], maximumFrontier=1, enumerationTimeout=1)
+        message = json.loads(mock_process.communicate.call_args[0][0].decode('utf-8'))
+        self.assertNotIn("DSL", message)
+        self.assertIn("taskStore", message)
+        self.assertEqual(message["tasks"],
+                         [{"key": computeMD5hash(serializeTask(task)), "name": "add1", "maximumFrontier": 1}])
+
+    def test_work_stealing(self):
+        directory = tempfile.mkdtemp()
+        solved = Task("solved", arrow(tint, tint), [((1,), 2)])
+        unsolved = Task("unsolved", arrow(tlist(tint), tint), [(([1],), 2)])
+        solver = functools.partial(fake_python_solver, os.path.join(directory, "log"))
+        try:
+            with mock.patch('dreamcoder.enumeration.solveForTask_python', solver):
+                frontiers, _ = multicoreEnumeration(
+                    Grammar.uniform([Primitive("test_incr", arrow(tint, tint), lambda x: x + 1)]),
+                    [solved, unsolved], solver="python",
+                    maximumFrontier=1, enumerationTimeout=2, CPUs=3)
+            with open(os.path.join(directory, "log")) as f:
+                windows = [json.loads(l) for l in f]
+        finally:
+            shutil.rmtree(directory)
+        self.assertEqual(len(frontiers[0]), 1)
+        # Once the first job was done, its CPUs went to sub-windows of the second one
+        windows = sorted((w["lowerBound"], w["upperBound"], w["CPUs"])
+                         for w in windows if w["tasks"] == ["unsolved"])
+        self.assertIn(0.75, [u - l for l, u, _ in windows])
+        self.assertTrue(all(c == 1 for _, _, c in windows))
+        # ... without any gaps or overlaps between them
+        for (_, u, _), (l, _, _) in zip(windows, windows[1:]):
+            self.assertAlmostEqual(u, l)
+
+    def test_enumeration_memo(self):
+        directory = tempfile.mkdtemp()
+        log = os.path.join(directory, "log")
+        solved = Task("solved", arrow(tint, tint), [((1,), 2)])
+        unsolved = Task("unsolved", arrow(tlist(tint), tint), [(([1],), 2)])
+        grammar = Grammar.uniform([Primitive("test_incr", arrow(tint, tint), lambda x: x + 1)])
+
+        def enumerate():
+            if os.path.exists(log): os.remove(log)
+            with mock.patch('dreamcoder.enumeration.solveForTask_python',
+                            functools.partial(fake_python_solver, log)):
+                frontiers, times = multicoreEnumeration(
+                    grammar, [solved, unsolved], solver="python", maximumFrontier=1,
+                    enumerationTimeout=1, CPUs=2, enumerationMemo=os.path.join(directory, "memo"))
+            with open(log) as f:
+                return frontiers, times, [json.loads(l) for l in f]
+
+        try:
+            _, _, first = enumerate()
+            frontiers, times, second = enumerate()
+        finally:
+            shutil.rmtree(directory)
+        # The solved task came straight out of the memo
+        self.assertEqual([str(e.program) for e in frontiers[0]], ["(lambda (test_incr $0))"])
+        self.assertEqual(times[solved], 0.)
+        self.assertFalse(any("solved" in w["tasks"] for w in second))
+        # ... and the unsolved one picked up where the first call left off
+        self.assertGreater(min(w["lowerBound"] for w in second),
+                           max(w["lowerBound"] for w in first))
+
+    def test_ensemble_enumeration(self):
+        directory = tempfile.mkdtemp()
+        log = os.path.join(directory, "log")
+        solved = Task("solved", arrow(tint, tint), [((1,), 2)])
+        unsolved = Task("unsolved", arrow(tlist(tint), tint), [(([1],), 2)])
+        primitives = [Primitive("test_incr", arrow(tint, tint), lambda x: x + 1)]
+        # Four models, each with a grammar of its own
+        ensemble = [{t: Grammar.fromProductions([(0., p) for p in primitives], logVariable=-m)
+                     for t in [solved, unsolved]}
+                    for m in range(4)]
+        try:
+            startTime = time.time()
+            with mock.patch('dreamcoder.enumeration.solveForTask_python',
+                            functools.partial(fake_python_solver, log)):
+                frontiers, times = multicoreEnumeration(
+                    ensemble, [solved, unsolved], solver="python", maximumFrontier=1,
+                    enumerationTimeout=2, wallClockTimeout=1, CPUs=2)
+            elapsed = time.time() - startTime
+            with open(log) as f:
+                windows = [json.loads(l) for l in f]
+        finally:
+            shutil.rmtree(directory)
+        # One frontier for each task, whichever models found the program
+        self.assertEqual([str(e.program) for e in frontiers[0]], ["(lambda (test_incr $0))"])
+        self.assertTrue(frontiers[1].empty)
+        # Every model got some of the CPUs, and all of them together got one timeout,
+        # where one after the other they would have taken 4 * 2 / 2 seconds
+        self.assertEqual({w["logVariable"] for w in windows if w["tasks"] == ["unsolved"]},
+                         {0, -1, -2, -3})
+        self.assertLess(elapsed, 3.)
+
+    @mock.patch('dreamcoder.enumeration.subprocess')
+    def test_enumeration_telemetry(self, mock_subprocess):
+        mock_process = mock.MagicMock()
+        mock_process.communicate.return_value = ('{"add1": [], "number_enumerated": 10}'.encode('utf-8'), None)
+        mock_subprocess.Popen.return_value = mock_process
+        directory = tempfile.mkdtemp()
+        try:
+            path = os.path.join(directory, "telemetry.jsonl")
+            multicoreEnumeration(Grammar.uniform([]), [get_add1_task()], maximumFrontier=1,
+                                 enumerationTimeout=1, enumerationTelemetry=path)
+            with open(path) as f:
+                records = [json.loads(l) for l in f]
+        finally:
+            shutil.rmtree(directory)
+        windows = [r for r in records if r["event"] == "window"]
+        self.assertEqual(len(windows), mock_process.communicate.call_count)
+        self.assertEqual(records[-1]["event"], "summary")
+        self.assertEqual(records[-1]["numberEnumerated"], {"add1": 10 * len(windows)})
+        w = windows[0]
+        self.assertEqual((w["lowerBound"], w["upperBound"], w["CPUs"]), (0., 1.5, 1))
+        self.assertEqual(w["tasks"], ["add1"])
+        self.assertEqual(w["numberEnumerated"], 10)
+        for k in ["encode", "solver", "parse", "messageBytes", "programsPerSecond", "launchTime"]:
+            self.assertIn(k, w)
+
+    @mock.patch('dreamcoder.enumeration.subprocess')
+    def test_enumeration_journal_resumes(self, mock_subprocess):
+        # A solver that finds a program in the second window
+        def communicate(message, *_, **__):
+            message = json.loads(message.decode('utf-8'))
+            hits = [{"program": "(lambda $0)", "time": 0.1, "logLikelihood": 0., "logPrior": -1.,
+                     "tokens": ""}] if message["lowerBound"] == 1.5 else []
+            return json.dumps({"add1": hits, "number_enumerated": 10}).encode('utf-8'), None
+        mock_process = mock.MagicMock()
+        mock_process.communicate.side_effect = communicate
+        mock_subprocess.Popen.return_value = mock_process
+        directory = tempfile.mkdtemp()
+        path = os.path.join(directory, "journal.jsonl")
+        task = get_add1_task()
+
+        def enumerate(journal):
+            mock_process.communicate.reset_mock()
+            frontiers, _ = multicoreEnumeration(Grammar.uniform([]), [task], maximumFrontier=2,
+                                                enumerationTimeout=1, enumerationJournal=journal)
+            windows = [json.loads(c[0][0].decode('utf-8'))["lowerBound"]
+                       for c in mock_process.communicate.call_args_list]
+            return frontiers[0], windows
+
+        try:
+            enumerate(path)
+            # Die after the third window, part way through writing the fourth
+            with open(path) as f:
+                records = f.readlines()
+            with open(path, "w") as f:
+                f.writelines(records[:4])
+                f.write(records[4][:10])
+            mock_process.communicate.side_effect = lambda *_, **__: \
+                ('{"add1": [], "number_enumerated": 10}'.encode('utf-8'), None)
+            frontier, windows = enumerate(path)
+            with open(path) as f:
+                records = [json.loads(l) for l in f]
+            # Starting over when we are not resuming
+            _, fresh = enumerate(EnumerationJournal(path, resume=False))
+        finally:
+            shutil.rmtree(directory)
+        self.assertEqual(windows[0], 4.5)
+        self.assertEqual([str(e.program) for e in frontier], ["(lambda $0)"])
+        self.assertEqual([r["type"] for r in records][:5], ["begin", "window", "window", "window", "window"])
+        self.assertEqual(records[4]["lowerBound"], 4.5)
+        self.assertEqual(records[-1]["type"], "end")
+        self.assertEqual(sum(r["type"] == "begin" for r in records), 1)
+        self.assertEqual(fresh[0], 0.)
+
+def fake_python_solver(log, g=None, tasks=None, lowerBound=None, upperBound=None,
+                       CPUs=None, maximumFrontiers=None, **_):
+    """Solves the task called `solved` straight away, and spends a while not solving the others"""
+    with open(log, "a") as f:
+        f.write(json.dumps({"tasks": [t.name for t in tasks], "CPUs": CPUs, "logVariable": g.logVariable,
+                            "lowerBound": lowerBound, "upperBound": upperBound}) + "\n")
+    frontiers, searchTimes = {}, {}
+    for t in tasks:
+        if t.name == "solved":
+            p = Program.parse("(lambda (test_incr $0))")
+            frontiers[t] = Frontier([FrontierEntry(p, logPrior=-1., logLikelihood=0.)], task=t)
+            searchTimes[t] = 0.
+        else:
+            time.sleep(0.1)
+            frontiers[t] = Frontier([], task=t)
+            searchTimes[t] = None
+    return frontiers, searchTimes, 1
+
+
+class TestInputGroups(unittest.TestCase):
+
+    def setUp(self):
+        self.calls = 0
+        def incr(x):
+            self.calls += 1
+            return x + 1
+        self.grammar = Grammar.uniform([Primitive("test_counted_incr", arrow(tint, tint), incr)])
+        self.tasks = [Task("add%d" % k, arrow(tint, tint), [((x,), x + k) for x in range(3)])
+                      for k in range(3)]
+
+    def enumerate(self, tasks):
+        self.calls = 0
+        frontiers, _, _ = enumerateForTasks(self.grammar, tasks, AllOrNothingLikelihoodModel(timeout=1.),
+                                            timeout=10, lowerBound=0., upperBound=8., budgetIncrement=8.,
+                                            maximumFrontiers={t: 10 for t in tasks})
+        return {t.name: sorted(str(e.program) for e in f) for t, f in frontiers.items()}, self.calls
+
+    def test_group_tasks_by_inputs(self):
+        other = Task("other", arrow(tint, tint), [((5,), 6)])
+        groups = groupTasksByInputs(self.tasks + [other], AllOrNothingLikelihoodModel())
+        self.assertEqual([g for _, g in groups], [[0, 1, 2], [3]])
+        self.assertEqual(groups[0][0], [(0,), (1,), (2,)])
+        self.assertIsNone(groups[1][0])
+
+    def test_programs_run_once_per_input_set(self):
+        together, calls = self.enumerate(self.tasks)
+        separately, separateCalls = {}, 0
+        for t in self.tasks:
+            frontiers, n = self.enumerate([t])
+            separately.update(frontiers)
+            separateCalls += n
+        self.assertEqual(together, separately)
+        self.assertEqual(together["add2"], ["(lambda (test_counted_incr (test_counted_incr $0)))"])
+        self.assertLess(2 * calls, separateCalls)
+
+
+class TestObservationalEquivalence(unittest.TestCase):
+
+    def setUp(self):
+        self.grammar = Grammar.uniform([Primitive("test_zero", tint, 0),
+                                        Primitive("test_one", tint, 1),
+                                        Primitive("test_plus", arrow(tint, tint, tint),
+                                                  lambda x: lambda y: x + y)])
+        self.tasks = [Task("add%d" % k, arrow(tint, tint), [((x,), x + k) for x in range(3)])
+                      for k in range(3)]
+
+    def enumerate(self, tasks, observationalEquivalence):
+        frontiers, _, n = enumerateForTasks(self.grammar, tasks, AllOrNothingLikelihoodModel(timeout=1.),
+                                            timeout=30, lowerBound=0., upperBound=14., budgetIncrement=3.5,
+                                            maximumFrontiers={t: 1 for t in tasks},
+                                            observationalEquivalence=observationalEquivalence)
+        for t, f in frontiers.items():
+            self.assertTrue(all(t.check(e.program, 1.) for e in f))
+        return {t.name: [round(e.logPrior, 6) for e in f] for t, f in frontiers.items()}, n
+
+    def test_pruning_keeps_the_best_programs(self):
+        pruned, prunedCount = self.enumerate(self.tasks, True)
+        unpruned, unprunedCount = self.enumerate(self.tasks, False)
+        # Ties between equally good programs can go either way
+        self.assertEqual(pruned, unpruned)
+        self.assertTrue(all(len(priors) == 1 for priors in pruned.values()))
+        self.assertLess(2 * prunedCount, unprunedCount)
+
+    def test_signatures(self):
+        table = ObservationalEquivalence.fromTasks(self.tasks, AllOrNothingLikelihoodModel(timeout=1.))
+        x = Program.parse("$0")
+        self.assertEqual(table.signature(x), (0, 1, 2))
+        self.assertFalse(table.redundant([tint], tint, 1., x))
+        # Seen it before, at the same description length
+        self.assertFalse(table.redundant([tint], tint, 1., x))
+        self.assertTrue(table.redundant([tint], tint, 5., Program.parse("(test_plus test_zero $0)")))
+        # Under another lambda we cannot evaluate it
+        self.assertFalse(table.redundant([tint, tint], tint, 5., Program.parse("(test_plus test_zero $0)")))
+        # Free variables
+        self.assertIsNone(table.signature(Program.parse("$1")))
+
+    def test_only_plain_tasks(self):
+        class Special(Task):
+            def logLikelihood(self, e, timeout=None): return 0.
+        special = Special("special", arrow(tint, tint), [((1,), 1)])
+        self.assertIsNone(ObservationalEquivalence.fromTasks([special], AllOrNothingLikelihoodModel()))
+
+
+class TestBottomUpEnumeration(unittest.TestCase):
+
+    def setUp(self):
+        self.grammar = Grammar.uniform([Primitive("test_zero", tint, 0),
+                                        Primitive("test_one", tint, 1),
+                                        Primitive("test_plus", arrow(tint, tint, tint),
+                                                  lambda x: lambda y: x + y)])
+        self.tasks = [Task("add%d" % k, arrow(tint, tint), [((x,), x + k) for x in range(3)])
+                      for k in range(4)]
+
+    def enumerate(self, f, g, tasks, upperBound=14., lowerBound=0.):
+        frontiers, _, n = f(g, tasks, AllOrNothingLikelihoodModel(timeout=1.),
+                            timeout=30, lowerBound=lowerBound, upperBound=upperBound, budgetIncrement=1.5,
+                            maximumFrontiers={t: 1 for t in tasks})
+        for t, frontier in frontiers.items():
+            self.assertTrue(all(t.check(e.program, 1.) for e in frontier))
+        return {t.name: [round(e.logPrior, 6) for e in f] for t, f in frontiers.items()}, n
+
+    def test_same_best_programs_as_top_down(self):
+        bottomUp, bottomUpCount = self.enumerate(bottomUpEnumerateForTasks, self.grammar, self.tasks)
+        topDown, topDownCount = self.enumerate(enumerateForTasks, self.grammar, self.tasks)
+        self.assertEqual(bottomUp, topDown)
+        self.assertTrue(all(len(priors) == 1 for priors in bottomUp.values()))
+        self.assertLess(bottomUpCount, topDownCount)
+
+    def test_windows_above_lower_bound(self):
+        frontiers, _ = self.enumerate(bottomUpEnumerateForTasks, self.grammar, self.tasks, lowerBound=5.)
+        self.assertEqual(frontiers["add0"], [])
+        self.assertEqual(len(frontiers["add2"]), 1)
+
+    def test_higher_order_primitives(self):
+        from dreamcoder.domains.list.listPrimitives import bootstrapTarget
+        g = Grammar.uniform(bootstrapTarget())
+        tasks = [Task("increment", arrow(tlist(tint), tlist(tint)), [(([1, 2, 3],), [2, 3, 4]), (([5],), [6])]),
+                 Task("double", arrow(tlist(tint), tlist(tint)), [(([1, 2, 3],), [2, 4, 6]), (([5],), [10])])]
+        frontiers, _ = self.enumerate(bottomUpEnumerateForTasks, g, tasks, upperBound=12.)
+        self.assertEqual([len(f) for f in frontiers.values()], [1, 1])
+
+    def test_lambda_windows_stop_at_the_deadline(self):
+        g = Grammar.uniform(self.grammar.primitives + [Primitive("test_apply", arrow(arrow(tint, tint), tint, tint),
+                                                                 lambda f: lambda x: f(x))])
+        enumerator = BottomUpEnumerator(g, arrow(tint, tint), [(1,)], deadline=time.time() - 1)
+        with self.assertRaises(EnumerationTimeout):
+            enumerator.lambdasBelow(arrow(tint, tint), 10.)
+        self.assertEqual(enumerator.lambdas[arrow(tint, tint)], [])
+        # ... and the window is not remembered as done
+        enumerator.deadline = None
+        self.assertGreater(len(enumerator.lambdasBelow(arrow(tint, tint), 6.)), 0)
+
+    def test_multicore_enumeration(self):
+        frontiers, times = multicoreEnumeration(self.grammar, self.tasks, solver="bottomup",
+                                                maximumFrontier=1, enumerationTimeout=5)
+        self.assertTrue(all(len(f) == 1 for f in frontiers))
+        self.assertTrue(all(times[t] is not None for t in self.tasks))
+
+
+class TestTaskStore(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_task_store_is_content_addressed(self):
+        task = get_add1_task()
+        store = TaskStore(self.directory)
+        key = store.task(task)
+        self.assertEqual(key, TaskStore(self.directory).task(task))
+        self.assertNotEqual(key, store.task(get_add2_task()))
+        with open(os.path.join(self.directory, key + ".json")) as f:
+            self.assertEqual(json.load(f), taskMessage(task))
+        # Stores that we give a directory to don't delete it
+        store.close()
+        self.assertTrue(os.path.exists(os.path.join(self.directory, key + ".json")))
+
+    def test_temporary_task_store(self):
+        store = TaskStore()
+        key = store.grammar(Grammar.uniform([]))
+        self.assertTrue(os.path.exists(os.path.join(store.directory, key + ".json")))
+        store.close()
+        self.assertFalse(os.path.exists(store.directory))
+
+
+# Stands in for `solver --server`: answers every job with empty frontiers,
+# and logs what it received so that the tests can look at the messages.
+# When asked to stream, it finds a solution to every task straight away,
+# and then keeps on enumerating for a long time.
+FAKE_SERVER = """#!%s
+import json, os, sys, time
+for line in sys.stdin:
+    m = json.loads(line)
+    with open(os.path.join(os.path.dirname(__file__), "log"), "a") as f:
+        f.write(json.dumps({"pid": os.getpid(), "message": m}) + "\\n")
+    if m.get("stream"):
+        for t in m["tasks"]:
+            sys.stdout.write(json.dumps({"hit": t["name"], "program": "(lambda (test_incr $0))",
+                                         "time": 0.1, "logLikelihood": 0., "logPrior": -1.,
+                                         "tokens": "test_incr"}) + "\\n")
+        sys.stdout.flush()
+        time.sleep(60)
+    response = {t["name"]: [] for t in m["tasks"]}
+    response["number_enumerated"] = 0
+    sys.stdout.write(json.dumps(response) + "\\n")
+    sys.stdout.flush()
+"""
+
+
+# Runs out of memory unless it gets one CPU and a shatter factor of at most 2,
+# and solves every task once it gets past MDL 4
+FAKE_GREEDY_SOLVER = """#!%s
+import json, os, resource, sys
+m = json.load(sys.stdin)
+with open(os.path.join(os.path.dirname(__file__), "log"), "a") as f:
+    f.write(json.dumps({"nc": m["nc"], "shatter": m["shatter"], "lowerBound": m["lowerBound"],
+                        "limit": resource.getrlimit(resource.RLIMIT_AS)[0]}) + "\\n")
+if m["nc"] > 1 or m["shatter"] > 2:
+    sys.stderr.write("Fatal error: exception Out_of_memory\\n")
+    sys.exit(2)
+hits = [{"program": "(lambda $0)", "time": 0.1, "logLikelihood": 0., "logPrior": -1., "tokens": ""}]
+response = {t["name"]: hits if m["lowerBound"] >= 4 else [] for t in m["tasks"]}
+response["number_enumerated"] = 0
+sys.stdout.write(json.dumps(response))
+"""
+
+
+class TestMemoryLimits(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        solver = os.path.join(self.directory, "solver")
+        with open(solver, "w") as f:
+            f.write(FAKE_GREEDY_SOLVER % sys.executable)
+        os.chmod(solver, os.stat(solver).st_mode | stat.S_IEXEC)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_killed_for_memory(self):
+        self.assertTrue(killedForMemory(2, "Fatal error: exception Out_of_memory"))
+        self.assertTrue(killedForMemory(-9, ""))
+        self.assertTrue(killedForMemory(-11, ""))
+        self.assertFalse(killedForMemory(-11, "", limited=False))
+        self.assertFalse(killedForMemory(2, "Fatal error: exception Not_found"))
+        self.assertFalse(killedForMemory(0, "MemoryError"))
+
+    def log(self):
+        with open(os.path.join(self.directory, "log")) as f:
+            return [json.loads(l) for l in f]
+
+    def test_out_of_memory_windows_are_retried(self):
+        limit = 2 ** 34
+        # The solver finishes the job, so the timeout only has to be long enough
+        with mock.patch('dreamcoder.enumeration.get_root_dir', return_value=self.directory):
+            frontiers, _ = multicoreEnumeration(Grammar.uniform([]), [get_add1_task()],
+                                                maximumFrontier=1, enumerationTimeout=60, CPUs=4,
+                                                max_mem_per_enumeration_thread=limit, workStealing=False)
+        self.assertFalse(frontiers[0].empty)
+        log = self.log()
+        self.assertTrue(all(l["limit"] == limit for l in log))
+        # The first window went from 4 CPUs down to 1, and then its shatter factor got halved
+        first = [(l["nc"], l["shatter"]) for l in log if l["lowerBound"] == 0.]
+        self.assertEqual(first, [(4, 10), (2, 10), (1, 10), (1, 5), (1, 2)])
+        # ... and every later window started where the first one got to
+        self.assertGreater(len(log), len(first))
+        self.assertTrue(all((l["nc"], l["shatter"]) == (1, 2) for l in log[len(first):]))
+
+    def test_idle_cpus_get_windows_that_fit_in_memory(self):
+        with mock.patch('dreamcoder.enumeration.get_root_dir', return_value=self.directory):
+            frontiers, _ = multicoreEnumeration(Grammar.uniform([]), [get_add1_task()],
+                                                maximumFrontier=1, enumerationTimeout=60, CPUs=2,
+                                                max_mem_per_enumeration_thread=2 ** 34)
+        self.assertFalse(frontiers[0].empty)
+        log = self.log()
+        self.assertEqual((log[0]["nc"], log[0]["shatter"]), (2, 10))
+        self.assertTrue(all(l["nc"] == 1 for l in log[1:]))
+        # The retry of the first window and the window of the idle CPU run out of memory
+        # at shatter 10 and then at shatter 5; after that nothing asks for more than 2
+        self.assertEqual(sum(l["shatter"] == 10 for l in log), 3)
+        self.assertEqual(sum(l["shatter"] == 5 for l in log), 2)
+
+
+class TestSolverPool(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.solver = os.path.join(self.directory, "solver")
+        with open(self.solver, "w") as f:
+            f.write(FAKE_SERVER % sys.executable)
+        os.chmod(self.solver, os.stat(self.solver).st_mode | stat.S_IEXEC)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def log(self):
+        with open(os.path.join(self.directory, "log")) as f:
+            return [json.loads(l) for l in f]
+
+    def test_pool_reuses_workers(self):
+        pool = SolverPool(1)
+        w1 = pool.acquire(self.solver)
+        pool.release(w1)
+        w2 = pool.acquire(self.solver)
+        self.assertIs(w1, w2)
+        w3 = pool.acquire(self.solver)
+        self.assertIsNot(w2, w3)
+        pool.discard(w3)
+        pool.close()
+        self.assertFalse(w1.alive)
+
+    def test_multicore_enumeration_persistent_solver(self):
+        grammar = Grammar.uniform([])
+        tasks = [get_add1_task(), get_add2_task()]
+        with mock.patch('dreamcoder.enumeration.get_root_dir', return_value=self.directory):
+            frontiers, best_search_time = multicoreEnumeration(
+                grammar, tasks, maximumFrontier=1, enumerationTimeout=1,
+                CPUs=1, persistentSolver=True)
+        self.assertEqual([f.task for f in frontiers], tasks)
+        self.assertTrue(all(f.empty for f in frontiers))
+        log = self.log()
+        self.assertGreater(len(log), 1)
+        # One worker served every job, and everything came out of the task store
+        self.assertEqual(len({l["pid"] for l in log}), 1)
+        self.assertFalse(any("DSL" in l["message"] for l in log))
+        self.assertFalse(any("examples" in t for l in log for t in l["message"]["tasks"]))
+
+    def check_streaming(self, persistentSolver):
+        grammar = Grammar.uniform([Primitive("test_incr", arrow(tint, tint), lambda x: x + 1)])
+        tasks = [get_add1_task(), get_add2_task()]
+        startTime = time.time()
+        with mock.patch('dreamcoder.enumeration.get_root_dir', return_value=self.directory):
+            frontiers, best_search_time = multicoreEnumeration(
+                grammar, tasks, maximumFrontier=1, enumerationTimeout=30,
+                CPUs=1, persistentSolver=persistentSolver, streamHits=True)
+        # The job got cancelled as soon as both tasks had a solution
+        self.assertLess(time.time() - startTime, 20)
+        self.assertEqual(len(self.log()), 1)
+        for f in frontiers:
+            self.assertEqual([str(e.program) for e in f], ["(lambda (test_incr $0))"])
+            self.assertIsNotNone(best_search_time[f.task])
+
+    def test_streaming_cancels_saturated_jobs(self):
+        self.check_streaming(persistentSolver=False)
+
+    def test_streaming_cancels_saturated_jobs_with_pool(self):
+        self.check_streaming(persistentSolver=True)
+
 
 if __name__ == '__main__':
     unittest.main()
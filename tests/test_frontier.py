@@ -0,0 +1,86 @@
+import pickle
+import random
+import unittest
+
+from dreamcoder.domains.list.listPrimitives import bootstrapTarget
+from dreamcoder.frontier import Frontier, FrontierEntry, FrontierStore
+from dreamcoder.grammar import Grammar
+from dreamcoder.program import Program
+from dreamcoder.task import Task
+from dreamcoder.type import arrow, tint, tlist
+
+
+PROGRAMS = ["(lambda (map (lambda (+ $0 1)) $0))", "(lambda (map (lambda (+ 1 $0)) $0))",
+            "(lambda (map (lambda (- $0 1)) $0))", "(lambda (map (lambda (+ $0 $0)) $0))",
+            "(lambda (cdr $0))", "(lambda (cons 0 $0))", "(lambda (cons 1 $0))", "(lambda $0)"]
+
+
+def summary(frontier):
+    return [(str(e.program), e.logPrior, e.logLikelihood) for e in frontier]
+
+
+class TestFrontierStore(unittest.TestCase):
+
+    def setUp(self):
+        bootstrapTarget()
+        self.task = Task("test", arrow(tlist(tint), tlist(tint)), [(([1],), [2])])
+        self.programs = [Program.parse(p) for p in PROGRAMS]
+
+    def randomFrontier(self, r):
+        return Frontier([FrontierEntry(p, logPrior=-float(r.randint(1, 4)), logLikelihood=0.)
+                         for p in r.sample(self.programs, r.randint(0, 4))],
+                        task=self.task)
+
+    def test_matches_combine_top_k(self):
+        r = random.Random(0)
+        for k in [-1, 0, 1, 3]:
+            frontier = Frontier([], task=self.task)
+            store = FrontierStore([], self.task, k)
+            for _ in range(30):
+                new = self.randomFrontier(r)
+                frontier = frontier.combine(new).topK(k)
+                self.assertIs(store.update(new), store)
+                if k < 0:
+                    # topK does not sort when there is no limit
+                    self.assertEqual(sorted(summary(store)), sorted(summary(frontier)))
+                else:
+                    self.assertEqual(summary(store), summary(frontier))
+                self.assertEqual(store.empty, frontier.empty)
+
+    def test_of_reuses_stores(self):
+        frontier = self.randomFrontier(random.Random(1))
+        store = FrontierStore.of(frontier, 2)
+        self.assertIsInstance(store, FrontierStore)
+        self.assertEqual(summary(store), summary(frontier.topK(2)))
+        self.assertIs(FrontierStore.of(store, 2), store)
+        self.assertIsNot(FrontierStore.of(store, 3), store)
+
+    def test_rescore_in_place(self):
+        g = Grammar.uniform(bootstrapTarget())
+        store = FrontierStore([FrontierEntry(p, logPrior=0., logLikelihood=0.) for p in self.programs],
+                              self.task, 4)
+        self.assertIs(store.rescore(g), store)
+        self.assertEqual(summary(store), summary(g.rescoreFrontier(store).topK(4)))
+        # ... and the bound holds with the new priors
+        store.update(g.rescoreFrontier(Frontier([FrontierEntry(p, logPrior=0., logLikelihood=0.)
+                                                 for p in self.programs], task=self.task)))
+        self.assertEqual(len(store), 4)
+        self.assertEqual(str(store.entries[0].program), "(lambda $0)")
+
+    def test_pickling(self):
+        store = FrontierStore.of(self.randomFrontier(random.Random(2)), 2)
+        copy = pickle.loads(pickle.dumps(store))
+        self.assertEqual(summary(copy), summary(store))
+        self.assertEqual(copy.maximumFrontier, 2)
+
+    def test_entries_can_be_replaced(self):
+        store = FrontierStore([FrontierEntry(p, logPrior=-1., logLikelihood=float('-inf'))
+                               for p in self.programs[:2]] +
+                              [FrontierEntry(self.programs[2], logPrior=-1., logLikelihood=0.)],
+                              self.task, 3)
+        store.removeZeroLikelihood()
+        self.assertEqual([e.program for e in store], [self.programs[2]])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,176 @@
+import pickle
+import unittest
+from unittest import mock
+
+from dreamcoder.domains.list.listPrimitives import bootstrapTarget
+from dreamcoder.frontier import Frontier, FrontierEntry
+from dreamcoder.grammar import Grammar, LikelihoodSummaryCache, NoCandidates
+from dreamcoder.program import Program
+from dreamcoder.task import Task
+from dreamcoder.type import Context, arrow, tint, tlist, tbool, t0
+
+
+def uncachedBuildCandidates(self, request, context, environment,
+                            normalize=True, returnTable=False, returnProbabilities=False,
+                            mustBeLeaf=False):
+    candidates = self._buildCandidates(request, context, environment,
+                                       normalize, returnProbabilities, mustBeLeaf)
+    if returnTable:
+        return {p: (l, t, k) for l, t, p, k in candidates}
+    return candidates
+
+
+def canonical(build, *arguments, **keywords):
+    """Candidates with their contexts applied, so that they can be compared"""
+    try:
+        candidates = build(*arguments, **keywords)
+    except NoCandidates:
+        return None
+    return [(round(l, 6), str(t.apply(k)), str(p), k.nextVariable) for l, t, p, k in candidates]
+
+
+class TestCandidateCache(unittest.TestCase):
+
+    def setUp(self):
+        self.g = Grammar.uniform(bootstrapTarget())
+
+    def test_cached_candidates_match_uncached(self):
+        # A context that has already used some type variables
+        k, _ = t0.instantiate(Context.EMPTY)
+        k, _ = arrow(t0, t0).instantiate(k)
+        requests = [(tint, []), (tlist(tint), [tint, tlist(tint)]), (tbool, [tint]),
+                    (arrow(tint, tint), [tlist(tbool)])]
+        for request, environment in requests:
+            for mustBeLeaf in [False, True]:
+                for _ in range(2):
+                    cached = canonical(self.g.buildCandidates, request, k, environment,
+                                       mustBeLeaf=mustBeLeaf)
+                    uncached = canonical(uncachedBuildCandidates, self.g, request, k, environment,
+                                         mustBeLeaf=mustBeLeaf)
+                    self.assertEqual(cached, uncached)
+        statistics = self.g.candidateCacheStatistics()
+        self.assertEqual(statistics["misses"], 2 * len(requests))
+        self.assertEqual(statistics["hits"], 2 * len(requests))
+
+    def test_polymorphic_requests_are_not_cached(self):
+        k, request = arrow(t0, t0).instantiate(Context.EMPTY)
+        self.g.buildCandidates(request, k, [])
+        self.assertEqual(self.g.candidateCacheStatistics(),
+                         {"hits": 0, "misses": 0, "size": 0})
+        # ... unless the context has already decided what the type variables are
+        k = k.unify(request, arrow(tint, tint))
+        self.g.buildCandidates(request, k, [])
+        self.assertEqual(self.g.candidateCacheStatistics()["misses"], 1)
+
+    def test_no_candidates_are_cached(self):
+        g = Grammar.uniform([p for p in bootstrapTarget() if p.name == "map"])
+        for _ in range(2):
+            with self.assertRaises(NoCandidates):
+                g.buildCandidates(tint, Context.EMPTY, [])
+        self.assertEqual(g.candidateCacheStatistics(), {"hits": 1, "misses": 1, "size": 1})
+
+    def test_cache_is_bounded(self):
+        self.g.CANDIDATECACHESIZE = 2
+        for request in [tint, tbool, tlist(tint), tint]:
+            self.g.buildCandidates(request, Context.EMPTY, [])
+        self.assertEqual(self.g.candidateCacheStatistics(), {"hits": 0, "misses": 4, "size": 2})
+
+    def test_entries_evicted_by_another_thread(self):
+        cached = canonical(self.g.buildCandidates, tint, Context.EMPTY, [])
+        with mock.patch.object(self.g.candidateCache, "move_to_end", side_effect=KeyError):
+            self.assertEqual(canonical(self.g.buildCandidates, tint, Context.EMPTY, []), cached)
+        self.assertEqual(self.g.candidateCacheStatistics()["hits"], 1)
+
+    def test_enumeration_is_unchanged(self):
+        request = arrow(tlist(tint), tlist(tint))
+
+        def enumerate():
+            return sorted((round(l, 6), str(p))
+                          for l, _, p in self.g.enumeration(Context.EMPTY, [], request, 10.5))
+
+        cached = enumerate()
+        with mock.patch.object(Grammar, 'buildCandidates', uncachedBuildCandidates):
+            uncached = enumerate()
+        self.assertEqual(cached, uncached)
+        self.assertGreater(len(cached), 50)
+        self.assertGreater(self.g.candidateCacheHits, self.g.candidateCacheMisses)
+
+    def test_pickling_drops_cache(self):
+        self.g.buildCandidates(tint, Context.EMPTY, [])
+        g = pickle.loads(pickle.dumps(self.g))
+        self.assertEqual(len(g.candidateCache), 0)
+        self.assertEqual(g, self.g)
+
+
+class TestSummaryCache(unittest.TestCase):
+
+    PROGRAMS = ["(lambda (map (lambda (+ $0 1)) $0))", "(lambda (cdr $0))", "(lambda (cons (car $0) $0))"]
+
+    def setUp(self):
+        self.g = Grammar.uniform(bootstrapTarget())
+        self.request = arrow(tlist(tint), tlist(tint))
+        self.programs = [Program.parse(s) for s in self.PROGRAMS]
+        self.cache = LikelihoodSummaryCache()
+        patcher = mock.patch('dreamcoder.grammar.SUMMARYCACHE', self.cache)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def reweighted(self, g):
+        return Grammar(-1., [(-0.1 * i, t, p) for i, (_, t, p) in enumerate(g.productions)],
+                       continuationType=g.continuationType)
+
+    def test_summaries_survive_reweighting(self):
+        summaries = [self.g.closedLikelihoodSummary(self.request, p) for p in self.programs]
+        h = self.reweighted(self.g)
+        for p, summary in zip(self.programs, summaries):
+            self.assertIs(h.closedLikelihoodSummary(self.request, p), summary)
+            self.assertAlmostEqual(h.logLikelihood(self.request, p),
+                                   h._closedLikelihoodSummary(self.request, p).logLikelihood(h))
+        self.assertEqual(self.cache.statistics(),
+                         {"hits": 2 * len(self.programs), "misses": len(self.programs), "size": len(self.programs)})
+
+        # Rescoring a frontier under the new weights only looks its summaries up
+        frontier = Frontier([FrontierEntry(p, logPrior=0., logLikelihood=0.) for p in self.programs],
+                            task=Task("t", self.request, []))
+        rescored = h.rescoreFrontier(frontier)
+        self.assertEqual([e.logPrior for e in rescored],
+                         [s.logLikelihood(h) for s in summaries])
+        self.assertEqual(self.cache.misses, len(self.programs))
+
+    def test_other_productions_are_not_shared(self):
+        fewer = Grammar.uniform([p for _, _, p in self.g.productions if str(p) != "empty"])
+        for p in self.programs:
+            summary = self.g.closedLikelihoodSummary(self.request, p)
+            other = fewer.closedLikelihoodSummary(self.request, p)
+            self.assertIsNot(summary, other)
+            self.assertNotEqual(summary.normalizers, other.normalizers)
+        self.assertEqual(self.cache.hits, 0)
+        # Ill-typed programs have no summary, which is not cached, so that
+        # callers that are not silent about them still fail loudly
+        self.assertIsNone(self.g.closedLikelihoodSummary(arrow(tint, tint), self.programs[1], silent=True))
+        with self.assertRaises(AssertionError):
+            self.g.closedLikelihoodSummary(arrow(tint, tint), self.programs[1])
+        self.assertEqual(self.cache.hits, 0)
+
+    def test_cache_is_bounded(self):
+        self.cache.size = 2
+        for p in self.programs + self.programs[:1]:
+            self.g.closedLikelihoodSummary(self.request, p)
+        self.assertEqual(self.cache.statistics(), {"hits": 0, "misses": 4, "size": 2})
+        self.assertEqual([p for _, _, p in self.cache.summaries], [self.programs[2], self.programs[0]])
+
+    def test_entries_evicted_by_another_thread(self):
+        summary = self.g.closedLikelihoodSummary(self.request, self.programs[0])
+        # What another thread evicting the entry between our lookup and move_to_end looks like
+        with mock.patch.object(self.cache.summaries, "move_to_end", side_effect=KeyError):
+            self.assertIs(self.g.closedLikelihoodSummary(self.request, self.programs[0]), summary)
+
+    def test_pickled_grammars_share_summaries(self):
+        summary = self.g.closedLikelihoodSummary(self.request, self.programs[0])
+        g = pickle.loads(pickle.dumps(self.g))
+        self.assertNotIn("productionKey", self.g.__getstate__())
+        self.assertIs(g.closedLikelihoodSummary(self.request, self.programs[0]), summary)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,99 @@
+import json
+import random
+import unittest
+from unittest import mock
+
+from dreamcoder.domains.list.listPrimitives import bootstrapTarget
+from dreamcoder.enumeration import multicoreEnumeration
+from dreamcoder.grammar import ContextualGrammar, Grammar
+from dreamcoder.grammarBucketing import bucketGrammars, centroidGrammar, grammarDistance
+from dreamcoder.program import Program
+from dreamcoder.task import Task
+from dreamcoder.type import arrow, tint, tlist
+
+
+def jitter(g, amount, seed):
+    r = random.Random(seed)
+    return g.randomWeights(lambda l: l + r.uniform(-amount, amount))
+
+
+class TestGrammarBucketing(unittest.TestCase):
+
+    def setUp(self):
+        self.g = Grammar.uniform(bootstrapTarget())
+        self.request = arrow(tlist(tint), tlist(tint))
+        self.tasks = [Task("t%d" % i, self.request, [(([1],), [1])]) for i in range(4)]
+
+    def test_distances(self):
+        near = jitter(self.g, 0.1, 0)
+        for distance in ["linf", "kl"]:
+            self.assertAlmostEqual(grammarDistance(self.g, self.g, distance), 0.)
+            self.assertGreater(grammarDistance(self.g, near, distance), 0.)
+            self.assertLess(grammarDistance(self.g, near, distance),
+                            grammarDistance(self.g, jitter(self.g, 2., 0), distance))
+        self.assertLessEqual(grammarDistance(self.g, near), 0.2 + 1e-9)
+        # Shifting every weight by the same amount does not change the distribution
+        self.assertAlmostEqual(grammarDistance(self.g, self.g.randomWeights(lambda l: l + 3.)), 0.)
+        # Grammars with different productions never share a bucket
+        smaller = Grammar.uniform(bootstrapTarget()[1:])
+        self.assertEqual(grammarDistance(self.g, smaller), float('inf'))
+        self.assertEqual(grammarDistance(self.g, ContextualGrammar.fromGrammar(self.g)), float('inf'))
+
+    def test_buckets(self):
+        far = jitter(self.g, 5., 7)
+        task2grammar = {self.tasks[0]: jitter(self.g, 0.1, 0),
+                        self.tasks[1]: far,
+                        self.tasks[2]: jitter(self.g, 0.1, 1),
+                        self.tasks[3]: jitter(self.g, 0.1, 2)}
+        buckets = bucketGrammars(self.tasks, task2grammar, 0.5)
+        self.assertEqual([ts for _, ts in buckets],
+                         [[self.tasks[0], self.tasks[2], self.tasks[3]], [self.tasks[1]]])
+        # Singletons keep their own grammar, and everything is close to its centroid
+        self.assertIs(buckets[1][0], far)
+        for t in buckets[0][1]:
+            self.assertLessEqual(grammarDistance(buckets[0][0], task2grammar[t]), 0.5)
+        # Tasks with different requests never share a bucket
+        other = Task("other", arrow(tlist(tint), tint), [(([1],), 1)])
+        buckets = bucketGrammars(self.tasks[:1] + [other], {self.tasks[0]: self.g, other: self.g}, 1.)
+        self.assertEqual(len(buckets), 2)
+
+    def test_contextual_centroid(self):
+        cg = ContextualGrammar.fromGrammar(self.g)
+        grammars = [jitter(cg, 0.2, seed) for seed in range(3)]
+        centroid = centroidGrammar(grammars)
+        self.assertIsInstance(centroid, ContextualGrammar)
+        for g in grammars:
+            self.assertLessEqual(grammarDistance(centroid, g), 0.4 + 1e-9)
+        buckets = bucketGrammars(self.tasks[:3], dict(zip(self.tasks, grammars)), 0.4, distance="kl")
+        self.assertEqual(len(buckets), 1)
+
+    @mock.patch('dreamcoder.enumeration.subprocess')
+    def test_testing_tasks_share_jobs(self, mock_subprocess):
+        def communicate(message, *_, **__):
+            message = json.loads(message.decode("utf-8"))
+            response = {t["name"]: [{"program": "(lambda $0)", "time": 0.1, "logLikelihood": 0.,
+                                     "logPrior": -1., "tokens": ""}]
+                        for t in message["tasks"]}
+            response["number_enumerated"] = 1
+            return json.dumps(response).encode("utf-8"), None
+        mock_process = mock.MagicMock()
+        mock_process.communicate.side_effect = communicate
+        mock_subprocess.Popen.return_value = mock_process
+
+        task2grammar = {t: jitter(self.g, 0.1, i) for i, t in enumerate(self.tasks)}
+        frontiers, _ = multicoreEnumeration(task2grammar, self.tasks, maximumFrontier=1,
+                                            enumerationTimeout=1, CPUs=4, testing=True,
+                                            grammarBucketing=0.5)
+        messages = [json.loads(c[0][0].decode("utf-8"))
+                    for c in mock_process.communicate.call_args_list]
+        self.assertEqual(len(messages), 1)
+        self.assertEqual(len(messages[0]["tasks"]), 4)
+        # Every frontier is scored under its own grammar, and not the centroid
+        p = Program.parse("(lambda $0)")
+        for t, f in zip(self.tasks, frontiers):
+            self.assertEqual(len(f), 1)
+            self.assertAlmostEqual(f.entries[0].logPrior, task2grammar[t].logLikelihood(t.request, p))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,215 @@
+import gc
+import pickle
+import unittest
+from unittest import mock
+
+from dreamcoder.domains.list.listPrimitives import bootstrapTarget
+from dreamcoder.program import Abstraction, Application, CompileCache, Index, Invented, ParseCache, Primitive, Program
+from dreamcoder.type import arrow, tint
+from dreamcoder.utilities import ParseFailure
+from dreamcoder.vs import VersionTable
+
+
+PROGRAMS = ["(lambda (map (lambda (+ $0 1)) $0))", "(lambda (map (lambda (+ 1 $0)) $0))",
+            "(lambda (cons (car $0) (cdr $0)))", "(lambda (if (empty? $0) $0 (cdr $0)))"]
+
+
+def plain(p):
+    """A copy of p that is not interned, and only shares its primitives with it"""
+    if p.isApplication: return Application(plain(p.f), plain(p.x))
+    if p.isAbstraction: return Abstraction(plain(p.body))
+    if p.isIndex: return Index(p.i)
+    return p
+
+
+class TestInterning(unittest.TestCase):
+
+    def setUp(self):
+        bootstrapTarget()
+
+    def test_interned_programs_are_shared(self):
+        a = Program.parse(PROGRAMS[0])
+        b = Program.parse(PROGRAMS[0])
+        self.assertIs(a, b)
+        self.assertTrue(a.isInterned)
+        # ... and so are their subtrees
+        c = Program.parse(PROGRAMS[1])
+        self.assertIs(a.body.f.f, c.body.f.f)
+        self.assertIs(a.body.x, c.body.x)
+
+    def test_equality_and_hashing_agree_with_plain_programs(self):
+        for s in PROGRAMS:
+            p = Program.parse(s)
+            q = plain(p)
+            self.assertFalse(q.isInterned)
+            self.assertIsNot(p, q)
+            self.assertEqual(p, q)
+            self.assertEqual(q, p)
+            self.assertEqual(hash(p), hash(q))
+            self.assertIs(q.intern(), p)
+            self.assertEqual(str(p), s)
+            # Pickling copies the primitives too, which are then interned separately
+            r = pickle.loads(pickle.dumps(p)).intern()
+            self.assertIsNot(r, p)
+            self.assertEqual(r, p)
+            self.assertEqual(hash(r), hash(p))
+        self.assertEqual(len({Program.parse(s) for s in PROGRAMS} | {plain(Program.parse(s)) for s in PROGRAMS}),
+                         len(PROGRAMS))
+        self.assertNotEqual(Program.parse(PROGRAMS[0]), Program.parse(PROGRAMS[1]))
+
+    def test_conditionals(self):
+        p = Program.parse(PROGRAMS[3]).body
+        self.assertTrue(p.isConditional)
+        self.assertEqual(str(p.branch), "(empty? $0)")
+        self.assertEqual(str(p.trueBranch), "$0")
+        self.assertEqual(str(p.falseBranch), "(cdr $0)")
+        self.assertIsNone(Program.parse(PROGRAMS[2]).body.branch)
+        f = Program.parse(PROGRAMS[3]).evaluate([])
+        self.assertEqual(f([]), [])
+        self.assertEqual(f([1, 2]), [2])
+
+    def test_primitives_keep_their_values(self):
+        # Not registered: "+" is already in GLOBALS
+        copy = Primitive("+", arrow(tint, tint, tint), lambda x: lambda y: x - y)
+        p = Application(Abstraction(Index(0)), copy).intern()
+        self.assertIs(p.x, copy)
+        q = Application(Abstraction(Index(0)), Primitive.GLOBALS["+"]).intern()
+        self.assertIsNot(p, q)
+        self.assertEqual(p, q)
+        self.assertEqual(Application(Application(copy, Index(0)), Index(0)).intern(),
+                         Program.parse("(+ $0 $0)"))
+        self.assertEqual(Program.parse("(lambda (- 3 1))"), Program.parse("(lambda (- 3 1))"))
+        subtract = Abstraction(Abstraction(Application(Application(copy, Index(1)), Index(0))))
+        self.assertEqual(subtract.compile()(5)(2), 3)
+        self.assertEqual(Program.parse("(lambda (lambda (+ $1 $0)))").compile()(5)(2), 7)
+
+    def test_nodes_use_slots(self):
+        p = Program.parse(PROGRAMS[0])
+        for node in [p, p.body, p.body.x]:
+            self.assertFalse(hasattr(node, "__dict__"))
+
+    def test_unused_programs_are_released(self):
+        key = (Index, 12345)
+        Index.interned(12345)
+        gc.collect()
+        self.assertNotIn(key, Program.INTERNED)
+
+    def test_version_table_incorporates_shared_subtrees(self):
+        table = VersionTable(typed=False, identity=False)
+        interned = [table.incorporate(Program.parse(s)) for s in PROGRAMS]
+        other = VersionTable(typed=False, identity=False)
+        plainIndices = [other.incorporate(plain(Program.parse(s))) for s in PROGRAMS]
+        self.assertEqual(interned, plainIndices)
+        self.assertEqual([list(table.extract(j)) for j in interned], [[Program.parse(s)] for s in PROGRAMS])
+        self.assertEqual(table.incorporate(Program.parse(PROGRAMS[0])), interned[0])
+
+
+class TestParse(unittest.TestCase):
+
+    def setUp(self):
+        bootstrapTarget()
+
+    def test_round_trip(self):
+        invention = Invented(Program.parse(PROGRAMS[0]))
+        programs = [Program.parse(s) for s in PROGRAMS] + \
+                   [Application(invention, Index(0)), Abstraction(Application(invention, Index(0)))]
+        for p in programs:
+            self.assertEqual(Program.parseUncached(str(p)), p)
+            self.assertEqual(str(Program.parse(str(p))), str(p))
+        self.assertEqual(Program.parse("  (lambda\n(cdr   $0))  "), Program.parse("(lambda (cdr $0))"))
+
+    def test_deep_programs(self):
+        depth = 5000
+        p = Program.parse("(lambda " * depth + "$0" + ")" * depth)
+        for _ in range(depth):
+            p = p.body
+        self.assertEqual(p, Index(0))
+
+    def test_failures(self):
+        for s in ["", "(", ")", "()", "(lambda)", "(lambda $0 $0)", "#", "(cdr #)",
+                  "$x", "notAPrimitive", "$0 $0", "(cdr $0))"]:
+            with self.assertRaises(ParseFailure, msg=s):
+                Program.parse(s)
+
+    def test_cache(self):
+        cache = ParseCache(size=2)
+        p = cache.parse(PROGRAMS[0])
+        self.assertIs(cache.parse(PROGRAMS[0]), p)
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+        cache.parse(PROGRAMS[1])
+        cache.parse(PROGRAMS[2])
+        self.assertEqual(list(cache.programs), PROGRAMS[1:3])
+
+        # New primitives empty the cache, and can be parsed straight away
+        with self.assertRaises(ParseFailure):
+            cache.parse("(lambda (parseCacheTestPrimitive $0))")
+        Primitive("parseCacheTestPrimitive", arrow(tint, tint), lambda x: x)
+        try:
+            self.assertEqual(str(cache.parse("(lambda (parseCacheTestPrimitive $0))")),
+                             "(lambda (parseCacheTestPrimitive $0))")
+            self.assertEqual(list(cache.programs), ["(lambda (parseCacheTestPrimitive $0))"])
+        finally:
+            del Primitive.GLOBALS["parseCacheTestPrimitive"]
+        with self.assertRaises(ParseFailure):
+            cache.parse("(lambda (parseCacheTestPrimitive $0))")
+
+    def test_cache_entries_evicted_by_another_thread(self):
+        cache = ParseCache()
+        p = cache.parse(PROGRAMS[0])
+        # What another thread evicting (or clearing) the entry between our lookup and move_to_end looks like
+        with mock.patch.object(cache.programs, "move_to_end", side_effect=KeyError):
+            self.assertIs(cache.parse(PROGRAMS[0]), p)
+
+
+class TestCompile(unittest.TestCase):
+
+    def setUp(self):
+        bootstrapTarget()
+
+    def test_agrees_with_evaluate(self):
+        invention = Invented(Program.parse("(lambda (lambda (cons $1 $0)))"))
+        cases = [(Program.parse(s), [[x] for x in [[], [1], [3, 1, 2]]]) for s in PROGRAMS] + [
+            (Program.parse("(lambda (lambda (lambda (lambda (cons $3 (cons $2 (cons $1 $0)))))))"),
+             [[1, 2, 3, []]]),
+            (Program.parse("(lambda (lambda (map (lambda (+ $0 $2)) $0)))"), [[1, [1, 2]], [0, []]]),
+            (Abstraction(Application(Application(invention, Index(0)), Program.parse("empty"))), [[1]])]
+
+        def run(f, xs):
+            try:
+                for x in xs:
+                    f = f(x)
+                return f
+            except Exception as e:
+                return type(e)
+
+        for p, arguments in cases:
+            for xs in arguments:
+                self.assertEqual(run(p.evaluate([]), xs), run(p.compile(), xs), msg=str(p))
+
+    def test_conditionals_are_lazy(self):
+        # car of the empty list throws, but only if we take that branch
+        p = Program.parse("(lambda (if (empty? $0) 0 (car $0)))")
+        self.assertEqual(p.compile()([]), 0)
+        self.assertEqual(p.runWithArguments([[4, 5]]), 4)
+
+    def test_free_variables(self):
+        with self.assertRaises(IndexError):
+            Program.parse("(lambda (cons $1 $0))").compile()
+
+    def test_cache(self):
+        cache = CompileCache(size=1)
+        p = Program.parse(PROGRAMS[0])
+        closure = cache.closure(p)
+        # Equal programs share a closure
+        self.assertIs(cache.closure(plain(p)), closure)
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+        cache.closure(Program.parse(PROGRAMS[1]))
+        self.assertEqual([p for p, _ in cache.closures.values()], [Program.parse(PROGRAMS[1])])
+        # Another thread may evict a closure between our lookup and move_to_end
+        closure = cache.closure(Program.parse(PROGRAMS[1]))
+        with mock.patch.object(cache.closures, "move_to_end", side_effect=KeyError):
+            self.assertIs(cache.closure(Program.parse(PROGRAMS[1])), closure)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,133 @@
+import pickle
+import unittest
+
+from dreamcoder.type import Context, TypeConstructor, TypeVariable, UnificationFailure, Occurs, \
+    arrow, baseType, tint, tbool, tlist, t0, t1, t2
+
+
+class TestContext(unittest.TestCase):
+
+    def test_contexts_are_persistent(self):
+        k, _ = Context.EMPTY.makeVariable()
+        k, _ = k.makeVariable()
+        ints = k.unify(t0, tint)
+        bools = k.unify(t0, tbool)
+        both = ints.unify(t1, tlist(t0))
+        # Going back and forth between versions of the same substitution
+        for _ in range(2):
+            self.assertEqual(t0.apply(k), t0)
+            self.assertEqual(t0.apply(ints), tint)
+            self.assertEqual(t0.apply(bools), tbool)
+            self.assertEqual(t1.apply(bools), t1)
+            self.assertEqual(t1.apply(both), tlist(tint))
+        self.assertEqual(Context.EMPTY.substitution, [])
+        self.assertEqual(sorted((v, t.apply(both)) for v, t in both.substitution),
+                         [(0, tint), (1, tlist(tint))])
+        self.assertEqual(both.nextVariable, 2)
+        with self.assertRaises(UnificationFailure):
+            bools.unify(t0, tint)
+        with self.assertRaises(Occurs):
+            k.unify(t0, tlist(t0))
+
+    def test_list_constructor(self):
+        # The first binding of a variable wins, as it always has
+        k = Context(3, [(0, tint), (2, t0), (0, tbool)])
+        self.assertEqual(arrow(t2, t1).apply(k), arrow(tint, t1))
+        k = k.extendMany(5, [(4, t2)])
+        self.assertEqual(TypeVariable(4).apply(k), tint)
+        self.assertEqual(k.nextVariable, 5)
+
+    def test_negative_variables(self):
+        request = arrow(t0, t1).negateVariables()
+        k, tp = arrow(t0, t0).instantiate(Context.EMPTY)
+        k = k.unify(tp, request)
+        self.assertEqual(request.apply(k).arguments[0], request.apply(k).arguments[1])
+        self.assertTrue(any(v < 0 for v, _ in k.substitution))
+        self.assertEqual(t0.apply(Context.EMPTY.extend(-1, tint)), t0)
+
+    def test_chains_are_compressed_without_changing_other_contexts(self):
+        k = Context.EMPTY
+        variables = []
+        for _ in range(200):
+            k, v = k.makeVariable()
+            variables.append(v)
+        for a, b in zip(variables, variables[1:]):
+            k = k.unify(a, b)
+        unresolved = k
+        k = k.unify(variables[-1], tint)
+        self.assertEqual([v.apply(k) for v in variables], [tint] * len(variables))
+        self.assertEqual(variables[0].apply(unresolved), variables[-1])
+        self.assertEqual(variables[0].apply(k), tint)
+
+    def test_pickling(self):
+        k, tp = arrow(t0, tlist(t1)).instantiate(Context.EMPTY)
+        k = k.unify(tp, arrow(tint, t2))
+        copy = pickle.loads(pickle.dumps(k))
+        self.assertEqual(copy.nextVariable, k.nextVariable)
+        self.assertEqual(tp.apply(copy), tp.apply(k))
+        self.assertEqual(sorted(copy.substitution, key=str), sorted(k.substitution, key=str))
+        self.assertEqual(pickle.loads(pickle.dumps(Context.EMPTY)).substitution, [])
+
+
+class TestInterning(unittest.TestCase):
+
+    def test_monomorphic_types_are_interned(self):
+        a = arrow(tint, tlist(tint), tbool)
+        self.assertIs(arrow(baseType("int"), tlist(tint), tbool), a)
+        self.assertTrue(a.isInterned)
+        self.assertIs(pickle.loads(pickle.dumps(a)), a)
+        self.assertIs(Context.EMPTY.unify(a, arrow(tint, tlist(tint), tbool)), Context.EMPTY)
+        with self.assertRaises(UnificationFailure):
+            Context.EMPTY.unify(a, arrow(tint, tlist(tbool), tbool))
+        # ... but polymorphic ones are not
+        p = tlist(t0)
+        self.assertFalse(p.isInterned)
+        self.assertIsNot(tlist(t0), p)
+        self.assertEqual(tlist(t0), p)
+        self.assertIs(p.apply(Context(1, [(0, tint)])), tlist(tint))
+
+    def test_interning_races(self):
+        class Late(dict):
+            # What a thread sees if another one interns the same type right after its lookup
+            def get(self, key, default=None):
+                return default
+        interned = TypeConstructor.INTERNED
+        try:
+            TypeConstructor.INTERNED = Late(interned)
+            first = arrow(tlist(tlist(tint)), tbool)
+            self.assertIs(arrow(tlist(tlist(tint)), tbool), first)
+        finally:
+            interned.update(TypeConstructor.INTERNED)
+            TypeConstructor.INTERNED = interned
+        self.assertEqual(first, arrow(tlist(tlist(tint)), tbool))
+
+    def test_types_pickled_before_interning(self):
+        # What unpickling a TypeConstructor that was pickled with its __dict__ gives
+        def legacy(name, arguments):
+            t = TypeConstructor.__new__(TypeConstructor)
+            t.__dict__.update(name=name, arguments=arguments,
+                              isPolymorphic=any(a.isPolymorphic for a in arguments))
+            return t
+        old = legacy("->", [legacy("int", []), legacy("list", [legacy("int", [])])])
+        self.assertFalse(old.isInterned)
+        self.assertEqual(old, arrow(tint, tlist(tint)))
+        self.assertEqual(hash(old), hash(arrow(tint, tlist(tint))))
+        self.assertIs(old.intern(), arrow(tint, tlist(tint)))
+        self.assertIs(TypeConstructor("list", [old.arguments[0]]), tlist(tint))
+        self.assertIs(Context.EMPTY.unify(old, arrow(tint, tlist(tint))), Context.EMPTY)
+
+    def test_cached_arguments_and_returns(self):
+        for t in [arrow(tint, tlist(tint), tbool), arrow(t0, arrow(t1, t0), tlist(t1)), tint, t0]:
+            for _ in range(2):
+                xs = t.functionArguments()
+                xs.append(None)
+        self.assertEqual(arrow(t0, arrow(t1, t0), tlist(t1)).functionArguments(), [t0, arrow(t1, t0)])
+        self.assertEqual(arrow(t0, arrow(t1, t0), tlist(t1)).returns(), tlist(t1))
+        self.assertEqual(arrow(tint, tlist(tint), tbool).functionArguments(), [tint, tlist(tint)])
+        self.assertIs(arrow(tint, tlist(tint), tbool).returns(), tbool)
+        self.assertEqual(tint.functionArguments(), [])
+        self.assertIs(tint.returns(), tint)
+
+
+if __name__ == '__main__':
+    unittest.main()
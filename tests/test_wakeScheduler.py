@@ -0,0 +1,80 @@
+import json
+import time
+import unittest
+from unittest import mock
+
+from dreamcoder.enumeration import multicoreEnumeration
+from dreamcoder.grammar import Grammar
+from dreamcoder.task import Task
+from dreamcoder.type import arrow, tint, tlist
+from dreamcoder.wakeScheduler import DeadlineWakeScheduler, FixedWakeScheduler, makeWakeScheduler
+
+
+PROMISING = (None, arrow(tint, tint))
+SATURATED = (None, arrow(tlist(tint), tint))
+UNTRIED = (None, arrow(tint, tlist(tint)))
+
+
+class TestWakeScheduler(unittest.TestCase):
+
+    def test_fixed_wake_scheduler(self):
+        scheduler = makeWakeScheduler("fixed")
+        self.assertIsInstance(scheduler, FixedWakeScheduler)
+        scheduler.begin({PROMISING: [1, 2]}, 30, 4)
+        self.assertIsNone(scheduler.deadline)
+        self.assertEqual(scheduler.timeLimits({PROMISING: [1, 2]}, {PROMISING: 29.}), {PROMISING: 30})
+        self.assertLess(scheduler.priority(PROMISING, 1.5), scheduler.priority(SATURATED, 3.))
+
+    def test_deadline_scheduler_favors_promising_jobs(self):
+        scheduler = makeWakeScheduler("deadline")
+        self.assertIsInstance(scheduler, DeadlineWakeScheduler)
+        jobs = {PROMISING: list(range(4)), SATURATED: list(range(4)), UNTRIED: list(range(4))}
+        scheduler.begin(jobs, 100., 3)
+        self.assertLessEqual(scheduler.deadline, time.time() + 100.)
+        # Before anything has come back every job gets the same share
+        limits = scheduler.timeLimits(jobs, {j: 0. for j in jobs})
+        self.assertAlmostEqual(limits[PROMISING], limits[UNTRIED], places=3)
+        self.assertLessEqual(limits[PROMISING], 100.)
+
+        # Both solved tasks quickly, but only one of them still has tasks left to solve
+        scheduler.update(PROMISING, 2., 2, 2)
+        scheduler.update(SATURATED, 2., 0, 4)
+        elapsed = {PROMISING: 2., SATURATED: 2., UNTRIED: 0.}
+        limits = scheduler.timeLimits(jobs, elapsed)
+        self.assertGreater(limits[PROMISING] - 2., limits[UNTRIED])
+        self.assertGreater(limits[UNTRIED], limits[SATURATED] - 2.)
+        # The shares add up to what is left of the budget
+        self.assertLessEqual(sum(limits[j] - elapsed[j] for j in jobs), 3 * 100.)
+        self.assertGreater(sum(limits[j] - elapsed[j] for j in jobs), 3 * 99.)
+        self.assertEqual(sorted(jobs, key=lambda j: scheduler.priority(j, 0.)),
+                         [PROMISING, UNTRIED, SATURATED])
+
+    def test_deadline_scheduler_limits(self):
+        scheduler = DeadlineWakeScheduler(phaseBudget=0., minimumTime=2., maximumJobTime=5.)
+        scheduler.begin({PROMISING: [1]}, 100., 1)
+        # Out of time, but every job gets its minimum
+        self.assertEqual(scheduler.timeLimits({PROMISING: [1]}, {PROMISING: 0.}), {PROMISING: 2.})
+        scheduler = DeadlineWakeScheduler(phaseBudget=100., maximumJobTime=5.)
+        scheduler.begin({PROMISING: [1]}, 1., 1)
+        self.assertEqual(scheduler.timeLimits({PROMISING: [1]}, {PROMISING: 0.}), {PROMISING: 5.})
+
+    @mock.patch('dreamcoder.enumeration.subprocess')
+    def test_multicore_enumeration_uses_scheduler(self, mock_subprocess):
+        mock_process = mock.MagicMock()
+        mock_process.communicate.return_value = ('{"add1": [], "number_enumerated": 0}'.encode('utf-8'), None)
+        mock_subprocess.Popen.return_value = mock_process
+        task = Task("add1", arrow(tint, tint), [((1,), 2)])
+        scheduler = DeadlineWakeScheduler(phaseBudget=1.)
+        start = time.time()
+        multicoreEnumeration(Grammar.uniform([]), [task], maximumFrontier=1, enumerationTimeout=100,
+                             wakeScheduler=scheduler)
+        self.assertLess(time.time() - start, 10)
+        windows = [json.loads(c[0][0].decode('utf-8'))
+                   for c in mock_process.communicate.call_args_list]
+        self.assertGreater(len(windows), 0)
+        self.assertTrue(all(m["timeout"] <= 1. for m in windows))
+        self.assertEqual(scheduler.unsolved, {j: 1 for j in scheduler.unsolved})
+
+
+if __name__ == '__main__':
+    unittest.main()